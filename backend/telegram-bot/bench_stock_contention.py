@@ -0,0 +1,137 @@
+'''
+Business: Benchmark of stock reservation under contention on one hot product
+Args: --buyers concurrent connections, --attempts total checkouts, --stock initial stock, --mode reserve|naive
+Returns: prints throughput, latency percentiles and whether the product was oversold
+
+Runs against DATABASE_URL with all migrations applied. Creates a temporary product
+and orders for telegram_user_id -1 and removes them afterwards.
+'''
+import argparse
+import os
+import statistics
+import threading
+import time
+from typing import Any, Dict, List
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+from index import place_order
+
+BENCH_USER = {'id': -1, 'first_name': 'Benchmark', 'username': 'benchmark'}
+
+
+def naive_reserve(cur, item: Dict[str, Any]) -> bool:
+    cur.execute('SELECT stock FROM products WHERE id = %s', (item['product_id'],))
+    stock = cur.fetchone()['stock']
+    if stock < item['quantity']:
+        return False
+    cur.execute('UPDATE products SET stock = %s WHERE id = %s', (stock - item['quantity'], item['product_id']))
+    return True
+
+
+def buyer(database_url: str, product: Dict[str, Any], mode: str, attempts: List[int],
+          lock: threading.Lock, results: Dict[str, Any]):
+    conn = psycopg2.connect(database_url)
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    item = {**product, 'quantity': 1}
+    
+    while True:
+        with lock:
+            if not attempts:
+                break
+            attempts.pop()
+        
+        started = time.perf_counter()
+        try:
+            if mode == 'naive':
+                success = naive_reserve(cur, item)
+            else:
+                order, _ = place_order(cur, BENCH_USER, [item])
+                success = order is not None
+            
+            if success:
+                conn.commit()
+            else:
+                conn.rollback()
+        except psycopg2.Error:
+            conn.rollback()
+            success = False
+            with lock:
+                results['errors'] += 1
+        
+        elapsed = time.perf_counter() - started
+        with lock:
+            results['latencies'].append(elapsed)
+            results['sold' if success else 'rejected'] += 1
+    
+    cur.close()
+    conn.close()
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--buyers', type=int, default=200)
+    parser.add_argument('--attempts', type=int, default=2000)
+    parser.add_argument('--stock', type=int, default=500)
+    parser.add_argument('--mode', choices=['reserve', 'naive'], default='reserve')
+    args = parser.parse_args()
+    
+    database_url = os.environ['DATABASE_URL']
+    conn = psycopg2.connect(database_url)
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    
+    cur.execute('''
+        INSERT INTO products (name, description, price, emoji, stock)
+        VALUES ('Benchmark hot SKU', 'contention benchmark', 100, '🔥', %s)
+        RETURNING id AS product_id, name, price, emoji, stock
+    ''', (args.stock,))
+    product = dict(cur.fetchone())
+    conn.commit()
+    
+    attempts = list(range(args.attempts))
+    lock = threading.Lock()
+    results = {'latencies': [], 'sold': 0, 'rejected': 0, 'errors': 0}
+    
+    threads = [
+        threading.Thread(target=buyer, args=(database_url, product, args.mode, attempts, lock, results))
+        for _ in range(args.buyers)
+    ]
+    
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.perf_counter() - started
+    
+    cur.execute('SELECT stock FROM products WHERE id = %s', (product['product_id'],))
+    final_stock = cur.fetchone()['stock']
+    
+    cur.execute('DELETE FROM orders WHERE telegram_user_id = %s', (BENCH_USER['id'],))
+    cur.execute('DELETE FROM products WHERE id = %s', (product['product_id'],))
+    conn.commit()
+    cur.close()
+    conn.close()
+    
+    latencies = results['latencies']
+    oversold = results['sold'] - args.stock
+    
+    print(f"mode:            {args.mode}")
+    print(f"buyers:          {args.buyers}")
+    print(f"attempts:        {args.attempts} in {duration:.2f}s ({args.attempts / duration:.0f}/s)")
+    print(f"sold / rejected: {results['sold']} / {results['rejected']} (errors: {results['errors']})")
+    print(f"stock:           {args.stock} -> {final_stock}")
+    print(f"latency p50/p95/p99/max ms: "
+          f"{statistics.median(latencies) * 1000:.1f} / {percentile(latencies, 0.95) * 1000:.1f} / "
+          f"{percentile(latencies, 0.99) * 1000:.1f} / {max(latencies) * 1000:.1f}")
+    print(f"oversold:        {max(oversold, 0)}" + ('  <-- OVERSOLD' if oversold > 0 or final_stock != args.stock - results['sold'] else ''))
+
+
+if __name__ == '__main__':
+    main()
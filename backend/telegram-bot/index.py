@@ -1,6 +1,12 @@
+import csv
+import html
+import io
 import json
 import os
-from typing import Dict, Any, List, Optional
+import random
+import time
+from collections.abc import MutableMapping
+from typing import Dict, Any, List, Optional, Iterator, Tuple
 import psycopg2
 from psycopg2.extras import RealDictCursor
 from datetime import datetime, timedelta
@@ -12,20 +18,28 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     Returns: HTTP response with status 200
     '''
     method: str = event.get('httpMethod', 'POST')
+    current_chat['id'] = None
     
     if method == 'OPTIONS':
         return {
             'statusCode': 200,
             'headers': {
                 'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type',
+                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type, If-None-Match',
                 'Access-Control-Max-Age': '86400'
             },
             'body': '',
             'isBase64Encoded': False
         }
     
+    query_params = event.get('queryStringParameters') or {}
+    if query_params.get('job'):
+        return run_scheduled_job(query_params['job'], event)
+    
+    if method == 'GET' and query_params.get('api'):
+        return handle_storefront_api(query_params['api'], event)
+    
     if method != 'POST':
         return {
             'statusCode': 405,
@@ -34,13 +48,56 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
+    shop_id = resolve_shop(event)
+    if not shop_id:
+        return {
+            'statusCode': 404,
+            'headers': {'Content-Type': 'application/json'},
+            'body': json.dumps({'error': 'Unknown shop'}),
+            'isBase64Encoded': False
+        }
+    shop_secret = SHOPS[shop_id]['secret']
+    if shop_secret:
+        import hmac
+        headers = {key.lower(): value for key, value in (event.get('headers') or {}).items()}
+        if not hmac.compare_digest(headers.get('x-telegram-bot-api-secret-token', ''), shop_secret):
+            return {
+                'statusCode': 403,
+                'headers': {'Content-Type': 'application/json'},
+                'body': json.dumps({'error': 'Forbidden'}),
+                'isBase64Encoded': False
+            }
+    activate_shop(shop_id)
+    
+    update: Dict[str, Any] = {}
     try:
         update = json.loads(event.get('body', '{}'))
         
+        if 'pre_checkout_query' in update:
+            answer_pre_checkout_query(update['pre_checkout_query'])
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json'},
+                'body': json.dumps({'ok': True}),
+                'isBase64Encoded': False
+            }
+        
+        sender_id = update_sender_id(update)
+        if (sender_id is not None and sender_id not in (admin_cache['ids'] or ())
+                and 'successful_payment' not in update.get('message', {}) and not take_flood_token(sender_id)):
+            return suppress_flooded_update(update, sender_id)
+        
+        sync_cache_events()
+        
+        if os.path.exists(shop_file_path(ORDER_SPOOL_PATH)) and db_circuit['open_until'] <= time.time():
+            replay_order_spool()
+        
         if 'message' in update:
-            process_message(update['message'])
+            touch_customer(update['message']['from'])
+            run_profiled(update, process_message, update['message'])
         elif 'callback_query' in update:
-            process_callback(update['callback_query'])
+            touch_customer(update['callback_query']['from'])
+            run_profiled(update, process_callback, update['callback_query'])
         
         return {
             'statusCode': 200,
@@ -48,6 +105,29 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': json.dumps({'ok': True}),
             'isBase64Encoded': False
         }
+    except psycopg2.OperationalError as e:
+        # A charge must not be acknowledged before its order is written: a 5xx makes
+        # Telegram redeliver it, and the unique charge id turns the retry into a no-op.
+        if 'successful_payment' in update.get('message', {}):
+            return {
+                'statusCode': 503,
+                'headers': {'Content-Type': 'application/json'},
+                'body': json.dumps({'error': str(e)}),
+                'isBase64Encoded': False
+            }
+        
+        if current_chat['id'] is not None:
+            try:
+                send_telegram_message(current_chat['id'], '⚠️ Сервис временно недоступен. Каталог и быстрый заказ работают, остальное — чуть позже.')
+            except Exception:
+                pass
+        
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json'},
+            'body': json.dumps({'ok': True, 'degraded': True}),
+            'isBase64Encoded': False
+        }
     except Exception as e:
         return {
             'statusCode': 500,
@@ -57,18 +137,207 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
 
 
+DEFAULT_SHOP_ID = 'default'
+
+
+def load_shops() -> Dict[str, Dict[str, Any]]:
+    shops_config = os.environ.get('SHOPS')
+    if not shops_config:
+        return {
+            DEFAULT_SHOP_ID: {
+                'token': os.environ.get('TELEGRAM_BOT_TOKEN'),
+                'secret': os.environ.get('TELEGRAM_WEBHOOK_SECRET'),
+                'schema': None,
+                'payment_token': os.environ.get('PAYMENT_PROVIDER_TOKEN')
+            }
+        }
+    
+    shops = json.loads(shops_config)
+    for shop_id, shop in shops.items():
+        if not shop_id.replace('_', '').isalnum():
+            raise ValueError(f'Invalid shop id: {shop_id}')
+        shop.setdefault('secret', None)
+        shop.setdefault('schema', f'shop_{shop_id}')
+        shop.setdefault('payment_token', None)
+    return shops
+
+
+SHOPS = load_shops()
+
+current_shop: Dict[str, Any] = {'id': None, 'token': None, 'secret': None, 'schema': None, 'payment_token': None}
+
+
+def activate_shop(shop_id: str):
+    current_shop.update(SHOPS[shop_id])
+    current_shop['id'] = shop_id
+
+
+def resolve_shop(event: Dict[str, Any]) -> Optional[str]:
+    query_params = event.get('queryStringParameters') or {}
+    headers = {key.lower(): value for key, value in (event.get('headers') or {}).items()}
+    
+    shop_id = query_params.get('shop')
+    if not shop_id:
+        path_segments = [segment for segment in (event.get('path') or '').split('/') if segment]
+        shop_id = path_segments[-1] if path_segments and path_segments[-1] in SHOPS else None
+    if not shop_id:
+        secret = headers.get('x-telegram-bot-api-secret-token')
+        shop_id = next((key for key, shop in SHOPS.items() if secret and shop['secret'] == secret), None)
+    if not shop_id and len(SHOPS) == 1:
+        shop_id = next(iter(SHOPS))
+    
+    return shop_id if shop_id in SHOPS else None
+
+
+def shop_file_path(path: str) -> str:
+    if current_shop['id'] in (None, DEFAULT_SHOP_ID):
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}_{current_shop['id']}{ext}"
+
+
+class ShopScoped(MutableMapping):
+    def __init__(self, factory=dict):
+        self._factory = factory
+        self._by_shop: Dict[Optional[str], Any] = {}
+    
+    def for_shop(self, shop_id: Optional[str]):
+        if shop_id not in self._by_shop:
+            self._by_shop[shop_id] = self._factory()
+        return self._by_shop[shop_id]
+    
+    def _current(self):
+        return self.for_shop(current_shop['id'])
+    
+    def __getitem__(self, key):
+        return self._current()[key]
+    
+    def __setitem__(self, key, value):
+        self._current()[key] = value
+    
+    def __delitem__(self, key):
+        del self._current()[key]
+    
+    def __iter__(self):
+        return iter(self._current())
+    
+    def __len__(self):
+        return len(self._current())
+
+
+def shop_connect_options() -> Dict[str, str]:
+    if not current_shop['schema']:
+        return {}
+    return {'options': f"-c search_path={current_shop['schema']}"}
+
+
+REPLICA_MAX_LAG = float(os.environ.get('REPLICA_MAX_LAG', '5'))
+REPLICA_LAG_CHECK_INTERVAL = float(os.environ.get('REPLICA_LAG_CHECK_INTERVAL', '10'))
+READ_YOUR_WRITES_WINDOW = float(os.environ.get('READ_YOUR_WRITES_WINDOW', '30'))
+
+DB_CIRCUIT_THRESHOLD = int(os.environ.get('DB_CIRCUIT_THRESHOLD', '3'))
+DB_CIRCUIT_COOLDOWN = float(os.environ.get('DB_CIRCUIT_COOLDOWN', '30'))
+DB_CONNECT_TIMEOUT = int(os.environ.get('DB_CONNECT_TIMEOUT', '3'))
+
+
+class DatabaseUnavailable(psycopg2.OperationalError):
+    pass
+
+
+db_circuit: Dict[str, Any] = {'failures': 0, 'open_until': 0.0}
+
+
+def connect_database(database_url: str):
+    if db_circuit['open_until'] > time.time():
+        raise DatabaseUnavailable('database circuit is open')
+    
+    try:
+        conn = psycopg2.connect(database_url, connect_timeout=DB_CONNECT_TIMEOUT, **shop_connect_options())
+    except psycopg2.OperationalError as e:
+        db_circuit['failures'] += 1
+        if db_circuit['failures'] >= DB_CIRCUIT_THRESHOLD:
+            db_circuit['open_until'] = time.time() + DB_CIRCUIT_COOLDOWN
+        raise DatabaseUnavailable(str(e))
+    
+    db_circuit['failures'] = 0
+    db_circuit['open_until'] = 0.0
+    return conn
+
+
+current_chat: Dict[str, Optional[int]] = {'id': None}
+chat_writes = ShopScoped()
+replica_state: Dict[str, Any] = {'healthy': True, 'checked_at': 0.0}
+
+
 def get_db_connection():
+    chat_id = current_chat['id']
+    if chat_id is not None:
+        if len(chat_writes) > 10000:
+            cutoff = time.time() - READ_YOUR_WRITES_WINDOW
+            for stale_chat_id in [key for key, written_at in chat_writes.items() if written_at < cutoff]:
+                chat_writes.pop(stale_chat_id, None)
+        chat_writes[chat_id] = time.time()
+    
     database_url = os.environ.get('DATABASE_URL')
-    return psycopg2.connect(database_url)
+    return connect_database(database_url)
 
 
-def send_telegram_message(chat_id: int, text: str, reply_markup: Optional[Dict] = None):
+def get_read_connection(prefer_primary: bool = False):
+    database_url = os.environ.get('DATABASE_URL')
+    replica_url = os.environ.get('DATABASE_REPLICA_URL')
+    chat_id = current_chat['id']
+    now = time.time()
+    
+    if not replica_url or prefer_primary:
+        return connect_database(database_url)
+    if chat_id is not None and now - chat_writes.get(chat_id, 0.0) < READ_YOUR_WRITES_WINDOW:
+        return connect_database(database_url)
+    if not replica_state['healthy'] and now - replica_state['checked_at'] < REPLICA_LAG_CHECK_INTERVAL:
+        return connect_database(database_url)
+    
+    try:
+        conn = psycopg2.connect(replica_url, connect_timeout=2, **shop_connect_options())
+    except psycopg2.OperationalError:
+        replica_state['healthy'] = False
+        replica_state['checked_at'] = now
+        return connect_database(database_url)
+    
+    if now - replica_state['checked_at'] >= REPLICA_LAG_CHECK_INTERVAL:
+        cur = conn.cursor()
+        cur.execute('''
+            SELECT CASE
+                WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                ELSE COALESCE(EXTRACT(EPOCH FROM NOW() - pg_last_xact_replay_timestamp()), 0)
+            END
+        ''')
+        lag = float(cur.fetchone()[0] or 0)
+        cur.close()
+        conn.rollback()
+        
+        replica_state['healthy'] = lag <= REPLICA_MAX_LAG
+        replica_state['checked_at'] = now
+        
+        if not replica_state['healthy']:
+            conn.close()
+            return connect_database(database_url)
+    
+    return conn
+
+
+def call_telegram_api(method: str, data: Dict[str, Any]) -> Dict[str, Any]:
     import urllib.request
     import urllib.parse
     
-    bot_token = os.environ.get('TELEGRAM_BOT_TOKEN')
-    url = f'https://api.telegram.org/bot{bot_token}/sendMessage'
+    bot_token = current_shop['token']
+    url = f'https://api.telegram.org/bot{bot_token}/{method}'
     
+    req_data = urllib.parse.urlencode(data).encode()
+    req = urllib.request.Request(url, data=req_data)
+    with urllib.request.urlopen(req) as response:
+        return json.loads(response.read().decode())
+
+
+def send_telegram_message(chat_id: int, text: str, reply_markup: Optional[Dict] = None):
     data = {
         'chat_id': chat_id,
         'text': text,
@@ -78,37 +347,205 @@ def send_telegram_message(chat_id: int, text: str, reply_markup: Optional[Dict]
     if reply_markup:
         data['reply_markup'] = json.dumps(reply_markup)
     
-    req_data = urllib.parse.urlencode(data).encode()
-    req = urllib.request.Request(url, data=req_data)
-    urllib.request.urlopen(req)
+    return call_telegram_api('sendMessage', data)
 
 
-def is_admin(user: Dict[str, Any]) -> bool:
-    conn = get_db_connection()
-    cur = conn.cursor()
+def call_telegram_api_ignoring_unmodified(method: str, data: Dict[str, Any]):
+    import urllib.error
     
-    cur.execute('SELECT id FROM admins WHERE telegram_user_id = %s', (user['id'],))
-    result = cur.fetchone()
+    try:
+        call_telegram_api(method, data)
+    except urllib.error.HTTPError as e:
+        if e.code != 400 or 'message is not modified' not in e.read().decode():
+            raise
+
+
+def edit_telegram_message(chat_id: int, message_id: int, text: str, reply_markup: Optional[Dict] = None):
+    data = {
+        'chat_id': chat_id,
+        'message_id': message_id,
+        'text': text,
+        'parse_mode': 'HTML'
+    }
     
-    cur.close()
-    conn.close()
+    if reply_markup:
+        data['reply_markup'] = json.dumps(reply_markup)
     
-    return result is not None
+    call_telegram_api_ignoring_unmodified('editMessageText', data)
 
 
-def get_all_admins() -> List[int]:
-    conn = get_db_connection()
-    cur = conn.cursor()
+def edit_telegram_reply_markup(chat_id: int, message_id: int, reply_markup: Dict):
+    call_telegram_api_ignoring_unmodified('editMessageReplyMarkup', {
+        'chat_id': chat_id,
+        'message_id': message_id,
+        'reply_markup': json.dumps(reply_markup)
+    })
+
+
+TELEGRAM_BATCH_RATE = float(os.environ.get('TELEGRAM_BATCH_RATE', '25'))
+
+
+def deliver_telegram_message(chat_id: int, text: str) -> Tuple[str, Optional[str]]:
+    import urllib.error
+    
+    for attempt in range(2):
+        try:
+            send_telegram_message(chat_id, text)
+            return 'sent', None
+        except urllib.error.HTTPError as e:
+            try:
+                error = json.loads(e.read().decode())
+            except ValueError:
+                error = {}
+            description = error.get('description', str(e))
+            
+            if e.code == 429 and attempt == 0:
+                time.sleep(error.get('parameters', {}).get('retry_after', 1))
+                continue
+            if e.code == 403:
+                return 'blocked', description
+            return 'failed', description
+        except Exception as e:
+            return 'failed', str(e)
+    
+    return 'failed', 'Too Many Requests'
+
+
+def send_telegram_messages_batch(messages: List[Tuple[int, str]], rate: Optional[float] = None) -> List[Tuple[str, Optional[str]]]:
+    interval = 1.0 / (rate or TELEGRAM_BATCH_RATE)
+    outcomes = []
     
-    cur.execute('SELECT telegram_user_id FROM admins')
-    admin_ids = [row[0] for row in cur.fetchall()]
+    for chat_id, text in messages:
+        started = time.time()
+        outcomes.append(deliver_telegram_message(chat_id, text))
+        
+        elapsed = time.time() - started
+        if elapsed < interval:
+            time.sleep(interval - elapsed)
     
-    cur.close()
-    conn.close()
+    return outcomes
+
+
+def call_telegram_api_multipart(method: str, fields: Dict[str, Any], file_field: str, filename: str, content) -> Dict[str, Any]:
+    import urllib.request
+    import uuid
+    
+    bot_token = current_shop['token']
+    url = f'https://api.telegram.org/bot{bot_token}/{method}'
+    
+    boundary = uuid.uuid4().hex
+    
+    head = io.BytesIO()
+    for name, value in fields.items():
+        head.write(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    head.write(f'--{boundary}\r\nContent-Disposition: form-data; name="{file_field}"; filename="{filename}"\r\n'.encode())
+    head.write(b'Content-Type: application/octet-stream\r\n\r\n')
+    tail = f'\r\n--{boundary}--\r\n'.encode()
+    
+    stream = io.BytesIO(content) if isinstance(content, bytes) else content
+    stream.seek(0, io.SEEK_END)
+    content_length = stream.tell()
+    stream.seek(0)
+    
+    def iter_body():
+        yield head.getvalue()
+        while True:
+            chunk = stream.read(64 * 1024)
+            if not chunk:
+                break
+            yield chunk
+        yield tail
+    
+    req = urllib.request.Request(url, data=iter_body())
+    req.add_header('Content-Type', f'multipart/form-data; boundary={boundary}')
+    req.add_header('Content-Length', str(len(head.getvalue()) + content_length + len(tail)))
+    with urllib.request.urlopen(req) as response:
+        return json.loads(response.read().decode())
+
+
+def send_telegram_document(chat_id: int, filename: str, content, caption: str = ''):
+    fields = {'chat_id': str(chat_id), 'caption': caption, 'parse_mode': 'HTML'}
+    call_telegram_api_multipart('sendDocument', fields, 'document', filename, content)
+
+
+def send_telegram_photo(chat_id: int, photo: str, caption: str, reply_markup: Optional[Dict] = None) -> Dict[str, Any]:
+    data = {
+        'chat_id': chat_id,
+        'photo': photo,
+        'caption': caption,
+        'parse_mode': 'HTML'
+    }
+    
+    if reply_markup:
+        data['reply_markup'] = json.dumps(reply_markup)
+    
+    return call_telegram_api('sendPhoto', data)
+
+
+def send_telegram_media_group(chat_id: int, media: List[Dict[str, Any]]):
+    call_telegram_api('sendMediaGroup', {
+        'chat_id': chat_id,
+        'media': json.dumps(media)
+    })
+
+
+TELEGRAM_FILE_MAX_BYTES = 20 * 1024 * 1024
+
+
+def open_telegram_file(file_id: str):
+    import urllib.request
+    
+    file_info = call_telegram_api('getFile', {'file_id': file_id})
+    bot_token = current_shop['token']
+    url = f"https://api.telegram.org/file/bot{bot_token}/{file_info['result']['file_path']}"
+    return urllib.request.urlopen(url)
+
+
+ADMIN_CACHE_TTL = int(os.environ.get('ADMIN_CACHE_TTL', '300'))
+
+admin_cache = ShopScoped(lambda: {'ids': None, 'loaded_at': 0.0, 'stale': False})
+
+
+def get_admin_ids() -> frozenset:
+    if admin_cache['ids'] is not None and time.time() - admin_cache['loaded_at'] < ADMIN_CACHE_TTL:
+        return admin_cache['ids']
     
+    try:
+        conn = get_read_connection(prefer_primary=admin_cache['stale'])
+        cur = conn.cursor()
+        
+        cur.execute('SELECT telegram_user_id FROM admins')
+        admin_ids = frozenset(row[0] for row in cur.fetchall())
+        
+        cur.close()
+        conn.close()
+    except psycopg2.OperationalError:
+        if admin_cache['ids'] is not None:
+            return admin_cache['ids']
+        raise
+    
+    admin_cache['ids'] = admin_ids
+    admin_cache['loaded_at'] = time.time()
+    admin_cache['stale'] = False
     return admin_ids
 
 
+def invalidate_admin_cache():
+    admin_cache['loaded_at'] = 0.0
+    admin_cache['stale'] = True
+
+
+def is_admin(user: Dict[str, Any]) -> bool:
+    try:
+        return user['id'] in get_admin_ids()
+    except DatabaseUnavailable:
+        return False
+
+
+def get_all_admins() -> List[int]:
+    return sorted(get_admin_ids())
+
+
 def notify_admins(text: str):
     admin_ids = get_all_admins()
     for admin_id in admin_ids:
@@ -118,110 +555,707 @@ def notify_admins(text: str):
             pass
 
 
-user_states = {}
+CATALOG_CACHE_TTL = int(os.environ.get('CATALOG_CACHE_TTL', '60'))
 
-def process_message(message: Dict[str, Any]):
-    chat_id = message['chat']['id']
-    text = message.get('text', '')
-    user = message['from']
-    
-    if text == '/start':
-        user_states.pop(chat_id, None)
-        send_welcome(chat_id, user)
-    elif text == '/admin' and is_admin(user):
-        user_states.pop(chat_id, None)
-        send_admin_panel(chat_id)
-    elif text == '📦 Каталог':
-        user_states.pop(chat_id, None)
-        send_catalog(chat_id)
-    elif text == '💬 Обратная связь':
-        user_states[chat_id] = {'type': 'awaiting_feedback'}
-        send_feedback_prompt(chat_id)
-    elif text == '📋 Мои заказы':
-        user_states.pop(chat_id, None)
-        send_my_orders(chat_id, user['id'])
-    elif text == '🔙 Назад':
-        user_states.pop(chat_id, None)
-        send_welcome(chat_id, user)
-    elif user_states.get(chat_id, {}).get('type') == 'awaiting_feedback':
-        save_feedback_message(chat_id, user, text)
-        user_states.pop(chat_id, None)
-    elif user_states.get(chat_id, {}).get('type') == 'awaiting_product_name' and is_admin(user):
-        handle_new_product_name(chat_id, text)
-    elif user_states.get(chat_id, {}).get('type') == 'awaiting_product_description' and is_admin(user):
-        handle_new_product_description(chat_id, text)
-    elif user_states.get(chat_id, {}).get('type') == 'awaiting_product_price' and is_admin(user):
-        handle_new_product_price(chat_id, text)
-    elif user_states.get(chat_id, {}).get('type') == 'awaiting_product_emoji' and is_admin(user):
-        handle_new_product_emoji(chat_id, text)
-    elif user_states.get(chat_id, {}).get('type') == 'awaiting_feedback_reply' and is_admin(user):
-        handle_feedback_reply(chat_id, text)
-    elif user_states.get(chat_id, {}).get('type') == 'awaiting_edit_product_name' and is_admin(user):
-        handle_edit_product_name(chat_id, text)
-    elif user_states.get(chat_id, {}).get('type') == 'awaiting_edit_product_description' and is_admin(user):
-        handle_edit_product_description(chat_id, text)
-    elif user_states.get(chat_id, {}).get('type') == 'awaiting_edit_product_price' and is_admin(user):
-        handle_edit_product_price(chat_id, text)
-    elif user_states.get(chat_id, {}).get('type') == 'awaiting_edit_product_emoji' and is_admin(user):
-        handle_edit_product_emoji(chat_id, text)
-    elif user_states.get(chat_id, {}).get('type') == 'awaiting_admin_username' and is_admin(user):
-        handle_add_admin(chat_id, text)
-    else:
-        send_telegram_message(chat_id, '❓ Используйте кнопки меню для навигации')
+catalog_cache = ShopScoped(lambda: {'products': None, 'version': None, 'loaded_at': 0.0, 'stale': False, 'dirty_ids': set()})
 
 
-def send_welcome(chat_id: int, user: Dict[str, Any]):
-    text = '''🛍️ <b>Добро пожаловать в EasyShop!</b>
+CATALOG_SNAPSHOT_PATH = os.environ.get('CATALOG_SNAPSHOT_PATH', '/tmp/easyshop_catalog.json')
 
-Рады видеть вас в нашем магазине! 
 
-Используйте кнопки ниже для навигации:
-📦 Каталог - посмотреть товары
-💬 Обратная связь - связаться с нами
-📋 Мои заказы - история ваших заказов'''
+def load_catalog_snapshot() -> List[Dict[str, Any]]:
+    if catalog_cache['products'] is not None:
+        return catalog_cache['products']
     
-    keyboard_buttons = [
-        [{'text': '📦 Каталог'}],
-        [{'text': '💬 Обратная связь'}, {'text': '📋 Мои заказы'}]
-    ]
+    try:
+        with open(shop_file_path(CATALOG_SNAPSHOT_PATH), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        raise DatabaseUnavailable('database is unavailable and there is no catalog snapshot')
+
+
+def save_catalog_snapshot(products: List[Dict[str, Any]]):
+    try:
+        snapshot_path = shop_file_path(CATALOG_SNAPSHOT_PATH)
+        with open(snapshot_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(products, f, ensure_ascii=False)
+        os.replace(snapshot_path + '.tmp', snapshot_path)
+    except OSError:
+        pass
+
+
+def get_catalog_products() -> List[Dict[str, Any]]:
+    if catalog_cache['products'] is not None and time.time() - catalog_cache['loaded_at'] < CATALOG_CACHE_TTL:
+        if catalog_cache['dirty_ids']:
+            refresh_catalog_products()
+        return catalog_cache['products']
     
-    if is_admin(user):
-        text += '\n\n⚙️ Админ-панель доступна по команде /admin'
+    try:
+        conn = get_read_connection(prefer_primary=catalog_cache['stale'])
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        
+        cur.execute('''
+            SELECT id, name, description, price, emoji, stock, photo_file_id, thumb_file_id
+            FROM products
+            ORDER BY id
+        ''')
+        products = [dict(row) for row in cur.fetchall()]
+        
+        cur.close()
+        conn.close()
+    except psycopg2.OperationalError:
+        return load_catalog_snapshot()
     
-    keyboard = {
-        'keyboard': keyboard_buttons,
-        'resize_keyboard': True
-    }
+    save_catalog_snapshot(products)
     
-    send_telegram_message(chat_id, text, keyboard)
+    catalog_cache['products'] = products
+    catalog_cache['version'] = None
+    catalog_cache['loaded_at'] = time.time()
+    catalog_cache['stale'] = False
+    catalog_cache['dirty_ids'] = set()
+    return products
 
 
-def send_admin_panel(chat_id: int):
-    text = '''⚙️ <b>Админ-панель EasyShop</b>
-
-Выберите действие:'''
+def refresh_catalog_products():
+    dirty_ids = catalog_cache['dirty_ids']
     
-    inline_keyboard = [
-        [{'text': '📦 Все заказы', 'callback_data': 'admin_orders'}],
-        [{'text': '💬 Обратная связь', 'callback_data': 'admin_feedback'}],
-        [{'text': '🛍️ Управление товарами', 'callback_data': 'admin_products'}],
-        [{'text': '👥 Управление админами', 'callback_data': 'admin_admins'}],
-        [{'text': '🔙 Назад', 'callback_data': 'admin_back'}]
-    ]
+    try:
+        conn = get_read_connection(prefer_primary=True)
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        
+        cur.execute('''
+            SELECT id, name, description, price, emoji, stock, photo_file_id, thumb_file_id
+            FROM products
+            WHERE id = ANY(%s)
+        ''', (sorted(dirty_ids),))
+        fresh = {row['id']: dict(row) for row in cur.fetchall()}
+        
+        cur.close()
+        conn.close()
+    except psycopg2.OperationalError:
+        return
     
-    reply_markup = {'inline_keyboard': inline_keyboard}
-    send_telegram_message(chat_id, text, reply_markup)
+    products = []
+    for product in catalog_cache['products']:
+        if product['id'] in fresh:
+            products.append(fresh.pop(product['id']))
+        elif product['id'] not in dirty_ids:
+            products.append(product)
+    products.extend(fresh.values())
+    products.sort(key=lambda product: product['id'])
+    
+    save_catalog_snapshot(products)
+    
+    catalog_cache['products'] = products
+    catalog_cache['version'] = None
+    catalog_cache['dirty_ids'] = set()
 
 
-def send_admin_orders(chat_id: int):
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
+def get_catalog_version(products: List[Dict[str, Any]]) -> str:
+    if products is catalog_cache['products'] and catalog_cache['version']:
+        return catalog_cache['version']
     
-    cur.execute('''
+    import hashlib
+    version = hashlib.sha1(json.dumps(products, sort_keys=True, ensure_ascii=False).encode()).hexdigest()[:16]
+    
+    if products is catalog_cache['products']:
+        catalog_cache['version'] = version
+    return version
+
+
+def get_catalog_product(product_id: int) -> Optional[Dict[str, Any]]:
+    for product in get_catalog_products():
+        if product['id'] == product_id:
+            return product
+    return None
+
+
+def invalidate_catalog_cache():
+    catalog_cache['loaded_at'] = 0.0
+    catalog_cache['stale'] = True
+
+
+CACHE_EVENTS_CHANNEL = 'easyshop_changes'
+CACHE_VERSION_CHECK_INTERVAL = float(os.environ.get('CACHE_VERSION_CHECK_INTERVAL', '30'))
+CACHE_EVENT_PATCH_LIMIT = 50
+
+SCHEMA_SHOPS = {(shop['schema'] or 'public'): shop_id for shop_id, shop in SHOPS.items()}
+
+cache_listener: Dict[str, Any] = {'conn': None, 'epoch': 0}
+cache_versions = ShopScoped(lambda: {'versions': {}, 'epoch': -1, 'checked_at': 0.0})
+
+
+def sync_cache_events():
+    conn = cache_listener['conn']
+    try:
+        if conn is None or conn.closed:
+            conn = connect_database(os.environ.get('DATABASE_URL'))
+            conn.autocommit = True
+            cur = conn.cursor()
+            cur.execute(f'LISTEN {CACHE_EVENTS_CHANNEL}')
+            cur.close()
+            cache_listener['conn'] = conn
+            cache_listener['epoch'] += 1
+        
+        conn.poll()
+        while conn.notifies:
+            apply_cache_event(conn.notifies.pop(0).payload)
+    except psycopg2.OperationalError:
+        if conn is not None and not conn.closed:
+            conn.close()
+        cache_listener['conn'] = None
+    
+    if cache_versions['epoch'] != cache_listener['epoch'] or time.time() - cache_versions['checked_at'] >= CACHE_VERSION_CHECK_INTERVAL:
+        check_cache_versions()
+
+
+def apply_cache_event(payload: str):
+    try:
+        event = json.loads(payload)
+    except ValueError:
+        return
+    
+    shop_id = SCHEMA_SHOPS.get(event.get('schema'))
+    if shop_id is None:
+        return
+    
+    known_versions = cache_versions.for_shop(shop_id)['versions']
+    last_version = known_versions.get(event['table'])
+    if last_version is not None and event['version'] <= last_version:
+        return
+    
+    ids = event.get('ids')
+    if last_version is not None and event['version'] > last_version + 1:
+        ids = None
+    known_versions[event['table']] = event['version']
+    
+    invalidate_cached_rows(shop_id, event['table'], event['op'], ids)
+
+
+def invalidate_cached_rows(shop_id: str, table: str, op: str, ids: Optional[List[int]]):
+    if table == 'products':
+        catalog = catalog_cache.for_shop(shop_id)
+        if ids is None or len(ids) > CACHE_EVENT_PATCH_LIMIT:
+            catalog['loaded_at'] = 0.0
+            catalog['stale'] = True
+        elif op == 'DELETE' and catalog['products'] is not None:
+            catalog['products'] = [product for product in catalog['products'] if product['id'] not in ids]
+            catalog['version'] = None
+        else:
+            catalog['dirty_ids'].update(ids)
+    elif table == 'admins':
+        admins = admin_cache.for_shop(shop_id)
+        if admins['ids'] is None:
+            return
+        if ids is None or op == 'UPDATE':
+            admins['loaded_at'] = 0.0
+            admins['stale'] = True
+        elif op == 'INSERT':
+            admins['ids'] = admins['ids'] | set(ids)
+        else:
+            admins['ids'] = admins['ids'] - set(ids)
+
+
+def check_cache_versions():
+    cache_versions['epoch'] = cache_listener['epoch']
+    cache_versions['checked_at'] = time.time()
+    
+    try:
+        conn = get_read_connection(prefer_primary=True)
+        cur = conn.cursor()
+        
+        cur.execute('SELECT name, version FROM cache_versions')
+        versions = dict(cur.fetchall())
+        
+        cur.close()
+        conn.close()
+    except psycopg2.Error:
+        return
+    
+    known_versions = cache_versions['versions']
+    for name, version in versions.items():
+        if name in known_versions and known_versions[name] != version:
+            invalidate_cached_rows(current_shop['id'], name, 'UPDATE', None)
+        known_versions[name] = version
+
+
+ORDER_STATUS_TEXT = {
+    'pending': 'Ожидание принятия',
+    'accepted': 'Заказ принят',
+    'processing': 'Выполняется',
+    'completed': 'Выполнено',
+    'cancelled': 'Отменено'
+}
+
+ORDER_STATUS_EMOJI = {
+    'pending': '⏳',
+    'accepted': '💳',
+    'processing': '⚙️',
+    'completed': '✅',
+    'cancelled': '❌'
+}
+
+ORDER_STATUS_TRANSITIONS = {
+    'pending': ('accepted', 'processing', 'cancelled'),
+    'accepted': ('processing', 'completed', 'cancelled'),
+    'processing': ('completed', 'cancelled'),
+    'completed': (),
+    'cancelled': ()
+}
+
+ORDER_STATUS_ACTIONS = {
+    'accepted': ('✅ Принять', 'order_accept_'),
+    'processing': ('⚙️ В работу', 'order_processing_'),
+    'completed': ('🎉 Завершить', 'order_complete_'),
+    'cancelled': ('❌ Отменить', 'order_cancel_')
+}
+
+
+def order_status_sources(new_status: str) -> List[str]:
+    return [status for status, targets in ORDER_STATUS_TRANSITIONS.items() if new_status in targets]
+
+
+CUSTOMER_TOUCH_INTERVAL = int(os.environ.get('CUSTOMER_TOUCH_INTERVAL', '3600'))
+
+customer_touches = ShopScoped()
+
+
+def touch_customer(user: Dict[str, Any]):
+    profile = (user.get('username'), user.get('first_name'), user.get('last_name'))
+    last_touch = customer_touches.get(user['id'])
+    
+    if last_touch and last_touch[1] == profile and time.time() - last_touch[0] < CUSTOMER_TOUCH_INTERVAL:
+        return
+    
+    try:
+        conn = get_db_connection()
+    except DatabaseUnavailable:
+        return
+    cur = conn.cursor()
+    
+    cur.execute('''
+        INSERT INTO customers (telegram_user_id, telegram_username, first_name, last_name)
+        VALUES (%s, %s, %s, %s)
+        ON CONFLICT (telegram_user_id) DO UPDATE
+        SET telegram_username = EXCLUDED.telegram_username,
+            first_name = EXCLUDED.first_name,
+            last_name = EXCLUDED.last_name,
+            last_seen_at = NOW()
+        WHERE customers.telegram_username IS DISTINCT FROM EXCLUDED.telegram_username
+           OR customers.first_name IS DISTINCT FROM EXCLUDED.first_name
+           OR customers.last_name IS DISTINCT FROM EXCLUDED.last_name
+           OR customers.last_seen_at < NOW() - make_interval(secs => %s)
+    ''', (user['id'], *profile, CUSTOMER_TOUCH_INTERVAL))
+    conn.commit()
+    
+    cur.close()
+    conn.close()
+    
+    now = time.time()
+    if len(customer_touches) > 10000:
+        for stale_user_id in [key for key, touch in customer_touches.items() if now - touch[0] >= CUSTOMER_TOUCH_INTERVAL]:
+            customer_touches.pop(stale_user_id, None)
+    customer_touches[user['id']] = (now, profile)
+
+
+FLOOD_RATE = float(os.environ.get('FLOOD_RATE', '2'))
+FLOOD_BURST = float(os.environ.get('FLOOD_BURST', '10'))
+FLOOD_MODE = os.environ.get('FLOOD_MODE', 'notice')
+FLOOD_SHARED = os.environ.get('FLOOD_SHARED') == '1'
+FLOOD_NOTICE = '⏳ Слишком много запросов. Подождите несколько секунд.'
+
+flood_buckets = ShopScoped()
+flood_stats = ShopScoped(lambda: {'suppressed': 0, 'notices': 0, 'shared_checks': 0, 'by_user': {}, 'since': time.time()})
+
+
+def update_sender_id(update: Dict[str, Any]) -> Optional[int]:
+    for key in ('message', 'callback_query'):
+        if key in update:
+            return update[key].get('from', {}).get('id')
+    return None
+
+
+def take_flood_token(user_id: int) -> bool:
+    now = time.time()
+    if len(flood_buckets) > 10000:
+        refill_time = FLOOD_BURST / FLOOD_RATE
+        for stale_user_id in [key for key, bucket in flood_buckets.items() if now - bucket['updated_at'] > refill_time]:
+            flood_buckets.pop(stale_user_id, None)
+    
+    bucket = flood_buckets.get(user_id)
+    if bucket is None:
+        bucket = flood_buckets[user_id] = {'tokens': FLOOD_BURST, 'updated_at': now, 'noticed': False}
+    
+    bucket['tokens'] = min(FLOOD_BURST, bucket['tokens'] + (now - bucket['updated_at']) * FLOOD_RATE)
+    bucket['updated_at'] = now
+    if bucket['tokens'] < 1:
+        return False
+    bucket['tokens'] -= 1
+    
+    if FLOOD_SHARED and bucket['tokens'] < FLOOD_BURST / 2 and not take_shared_flood_token(user_id):
+        return False
+    
+    bucket['noticed'] = False
+    return True
+
+
+def take_shared_flood_token(user_id: int) -> bool:
+    flood_stats['shared_checks'] += 1
+    try:
+        conn = connect_database(os.environ.get('DATABASE_URL'))
+    except DatabaseUnavailable:
+        return True
+    conn.autocommit = True
+    cur = conn.cursor()
+    
+    try:
+        cur.execute('''
+            INSERT INTO flood_buckets AS b (telegram_user_id, tokens)
+            VALUES (%s, %s - 1)
+            ON CONFLICT (telegram_user_id) DO UPDATE
+            SET tokens = GREATEST(LEAST(%s, b.tokens + EXTRACT(EPOCH FROM NOW() - b.updated_at) * %s) - 1, -1),
+                updated_at = NOW()
+            RETURNING tokens >= 0
+        ''', (user_id, FLOOD_BURST, FLOOD_BURST, FLOOD_RATE))
+        allowed = cur.fetchone()[0]
+    except psycopg2.Error:
+        allowed = True
+    finally:
+        cur.close()
+        conn.close()
+    
+    return allowed
+
+
+def suppress_flooded_update(update: Dict[str, Any], user_id: int) -> Dict[str, Any]:
+    flood_stats['suppressed'] += 1
+    by_user = flood_stats['by_user']
+    if user_id in by_user or len(by_user) < 1000:
+        by_user[user_id] = by_user.get(user_id, 0) + 1
+    
+    bucket = flood_buckets[user_id]
+    if FLOOD_MODE == 'notice' and not bucket['noticed']:
+        bucket['noticed'] = True
+        flood_stats['notices'] += 1
+        try:
+            if 'callback_query' in update:
+                call_telegram_api('answerCallbackQuery', {'callback_query_id': update['callback_query']['id'], 'text': FLOOD_NOTICE})
+            else:
+                send_telegram_message(user_id, FLOOD_NOTICE)
+        except Exception:
+            pass
+    
+    return {
+        'statusCode': 200,
+        'headers': {'Content-Type': 'application/json'},
+        'body': json.dumps({'ok': True, 'throttled': True}),
+        'isBase64Encoded': False
+    }
+
+
+def send_flood_stats(chat_id: int):
+    top_users = sorted(flood_stats['by_user'].items(), key=lambda item: -item[1])[:10]
+    
+    text = f'''🚦 <b>Ограничение частоты</b>
+
+Лимит: {FLOOD_RATE:g}/с, запас {FLOOD_BURST:g}, режим: {FLOOD_MODE}{', общий' if FLOOD_SHARED else ''}
+С {datetime.fromtimestamp(flood_stats['since']).strftime('%d.%m %H:%M')} на этом экземпляре:
+Отброшено обновлений: {flood_stats['suppressed']}
+Предупреждений: {flood_stats['notices']}
+Проверок общего лимита: {flood_stats['shared_checks']}'''
+    
+    if top_users:
+        text += '\n\n<b>Чаще всего:</b>\n' + '\n'.join(f'<code>{user_id}</code> — {count}' for user_id, count in top_users)
+    
+    send_telegram_message(chat_id, text)
+
+
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_INTERVAL = float(os.environ.get('PROFILE_INTERVAL', '0.005'))
+PROFILE_MAX_STACKS = 5000
+PROFILE_TOP_N = 15
+PROFILE_MAX_ROUTES = 200
+PROFILE_COMMANDS = {'/start', '/admin', '/profile', '/flood', '/export_orders'}
+PROFILE_MENU_TEXTS = {'📦 Каталог', '🛒 Корзина', '💬 Обратная связь', '📋 Мои заказы', '🔙 Назад'}
+
+profiler_state: Dict[str, Any] = {'rate': PROFILE_SAMPLE_RATE, 'stacks': {}, 'routes': {}, 'started_at': time.time()}
+
+
+def profile_route(update: Dict[str, Any]) -> str:
+    import re
+    
+    # Routes never contain user text: it would leak into the admin report and could break
+    # its HTML or the ';'-separated stacks of the .folded export.
+    if 'callback_query' in update:
+        route = 'callback:' + re.sub(r'[^A-Za-z_]', '', update['callback_query'].get('data', ''))[:40]
+    else:
+        message = update['message']
+        text = message.get('text', '')
+        state_type = user_states.get(message['chat']['id'], {}).get('type')
+        command = text.split()[0] if text.startswith('/') else ''
+        if command:
+            route = 'message:' + (command if command in PROFILE_COMMANDS else 'command')
+        elif state_type:
+            route = 'message:' + state_type
+        elif text in PROFILE_MENU_TEXTS:
+            route = 'message:' + text
+        else:
+            route = 'message:text'
+    
+    if current_shop['id'] not in (None, DEFAULT_SHOP_ID):
+        route = f"{current_shop['id']}/{route}"
+    return route
+
+
+def run_profiled(update: Dict[str, Any], func, payload: Dict[str, Any]):
+    if not profiler_state['rate'] or random.random() >= profiler_state['rate']:
+        return func(payload)
+    
+    import sys
+    import threading
+    
+    route = profile_route(update)
+    stacks = profiler_state['stacks']
+    stop_code = run_profiled.__code__
+    thread_id = threading.get_ident()
+    done = threading.Event()
+    samples = [0]
+    
+    # A sampler thread works whichever thread the runtime calls handler on, and keeps
+    # ticking while this one waits on Postgres with the GIL released.
+    def sample():
+        while not done.wait(PROFILE_INTERVAL):
+            frame = sys._current_frames().get(thread_id)
+            names = []
+            while frame is not None and frame.f_code is not stop_code:
+                names.append(f'{frame.f_code.co_name} ({os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_firstlineno})')
+                frame = frame.f_back
+            key = ';'.join([route, *reversed(names)])
+            if key in stacks or len(stacks) < PROFILE_MAX_STACKS:
+                stacks[key] = stacks.get(key, 0) + 1
+            samples[0] += 1
+    
+    # CPU-bound Python only yields the GIL every switch interval (5 ms by default),
+    # which would halve the sampling rate of exactly the code being measured.
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(min(switch_interval, PROFILE_INTERVAL / 5))
+    sampler = threading.Thread(target=sample, name='profiler', daemon=True)
+    sampler.start()
+    started = time.perf_counter()
+    try:
+        return func(payload)
+    finally:
+        done.set()
+        sampler.join()
+        sys.setswitchinterval(switch_interval)
+        
+        if route not in profiler_state['routes'] and len(profiler_state['routes']) >= PROFILE_MAX_ROUTES:
+            route = 'other'
+        stats = profiler_state['routes'].setdefault(route, {'updates': 0, 'seconds': 0.0, 'max_seconds': 0.0, 'samples': 0})
+        elapsed = time.perf_counter() - started
+        stats['updates'] += 1
+        stats['seconds'] += elapsed
+        stats['max_seconds'] = max(stats['max_seconds'], elapsed)
+        stats['samples'] += samples[0]
+
+
+def format_profile_report() -> str:
+    routes = profiler_state['routes']
+    if not routes:
+        return f"🔬 <b>Профилирование</b>\n\nДоля обновлений: {profiler_state['rate']:.0%}\nДанных пока нет"
+    
+    self_samples: Dict[str, int] = {}
+    total_samples: Dict[str, int] = {}
+    for key, count in profiler_state['stacks'].items():
+        frames = key.split(';')[1:]
+        if frames:
+            self_samples[frames[-1]] = self_samples.get(frames[-1], 0) + count
+        for name in set(frames):
+            total_samples[name] = total_samples.get(name, 0) + count
+    sample_count = sum(profiler_state['stacks'].values()) or 1
+    
+    lines = [
+        '🔬 <b>Профилирование</b>',
+        '',
+        f"Доля обновлений: {profiler_state['rate']:.0%}, с {datetime.fromtimestamp(profiler_state['started_at']).strftime('%d.%m %H:%M')}",
+        '',
+        '<b>Маршруты</b> (обновлений, среднее / макс. мс):'
+    ]
+    for route, stats in sorted(routes.items(), key=lambda item: -item[1]['seconds'])[:PROFILE_TOP_N]:
+        lines.append(f"<code>{html.escape(route)}</code> — {stats['updates']}, "
+                     f"{stats['seconds'] / stats['updates'] * 1000:.0f} / {stats['max_seconds'] * 1000:.0f}")
+    
+    lines += ['', '<b>Собственное время</b> (% выборок):']
+    for name, count in sorted(self_samples.items(), key=lambda item: -item[1])[:PROFILE_TOP_N]:
+        lines.append(f"{count / sample_count:.0%}  <code>{html.escape(name)}</code>")
+    
+    lines += ['', '<b>Полное время</b> (% выборок):']
+    for name, count in sorted(total_samples.items(), key=lambda item: -item[1])[:PROFILE_TOP_N]:
+        lines.append(f"{count / sample_count:.0%}  <code>{html.escape(name)}</code>")
+    
+    return '\n'.join(lines)
+
+
+def handle_profile_command(chat_id: int, text: str):
+    args = text.split()[1:]
+    
+    if args and (args[0] in ('off', 'reset') or args[0].replace('.', '', 1).isdigit()):
+        if args[0] == 'off':
+            profiler_state['rate'] = 0.0
+        elif args[0] != 'reset':
+            profiler_state['rate'] = min(float(args[0]), 1.0)
+        profiler_state['stacks'] = {}
+        profiler_state['routes'] = {}
+        profiler_state['started_at'] = time.time()
+        send_telegram_message(chat_id, f"🔬 Профилирование: {profiler_state['rate']:.0%} обновлений на этом экземпляре")
+        return
+    
+    if args:
+        send_telegram_message(chat_id, '🔬 Использование: /profile [доля 0–1 | off | reset]')
+        return
+    
+    send_telegram_message(chat_id, format_profile_report())
+    
+    if profiler_state['stacks']:
+        folded = ''.join(f'{key} {count}\n' for key, count in sorted(profiler_state['stacks'].items()))
+        filename = f"profile_{datetime.now().strftime('%Y%m%d_%H%M%S')}.folded"
+        send_telegram_document(chat_id, filename, folded.encode('utf-8'), '🔥 Стеки для flamegraph.pl / speedscope')
+
+
+user_states = ShopScoped()
+
+def process_message(message: Dict[str, Any]):
+    chat_id = message['chat']['id']
+    current_chat['id'] = chat_id
+    text = message.get('text', '')
+    user = message['from']
+    
+    if 'successful_payment' in message:
+        handle_successful_payment(chat_id, user, message['successful_payment'])
+    elif text == '/start':
+        user_states.pop(chat_id, None)
+        send_welcome(chat_id, user)
+    elif text == '/admin' and is_admin(user):
+        user_states.pop(chat_id, None)
+        send_admin_panel(chat_id)
+    elif text.startswith('/profile') and is_admin(user):
+        handle_profile_command(chat_id, text)
+    elif text == '/flood' and is_admin(user):
+        send_flood_stats(chat_id)
+    elif text.startswith('/export_orders') and is_admin(user):
+        export_orders(chat_id, text[len('/export_orders'):])
+    elif text == '📦 Каталог':
+        user_states.pop(chat_id, None)
+        send_catalog(chat_id)
+    elif text == '🛒 Корзина':
+        user_states.pop(chat_id, None)
+        send_cart(chat_id, user['id'])
+    elif text == '💬 Обратная связь':
+        user_states[chat_id] = {'type': 'awaiting_feedback'}
+        send_feedback_prompt(chat_id)
+    elif text == '📋 Мои заказы':
+        user_states.pop(chat_id, None)
+        send_my_orders(chat_id, user['id'])
+    elif text == '🔙 Назад':
+        user_states.pop(chat_id, None)
+        send_welcome(chat_id, user)
+    elif user_states.get(chat_id, {}).get('type') == 'awaiting_feedback':
+        save_feedback_message(chat_id, user, text)
+        user_states.pop(chat_id, None)
+    elif user_states.get(chat_id, {}).get('type') == 'awaiting_product_name' and is_admin(user):
+        handle_new_product_name(chat_id, text)
+    elif user_states.get(chat_id, {}).get('type') == 'awaiting_product_description' and is_admin(user):
+        handle_new_product_description(chat_id, text)
+    elif user_states.get(chat_id, {}).get('type') == 'awaiting_product_price' and is_admin(user):
+        handle_new_product_price(chat_id, text)
+    elif user_states.get(chat_id, {}).get('type') == 'awaiting_product_emoji' and is_admin(user):
+        handle_new_product_emoji(chat_id, text)
+    elif user_states.get(chat_id, {}).get('type') == 'awaiting_feedback_reply' and is_admin(user):
+        handle_feedback_reply(chat_id, text)
+    elif user_states.get(chat_id, {}).get('type') == 'awaiting_edit_product_name' and is_admin(user):
+        handle_edit_product_name(chat_id, text)
+    elif user_states.get(chat_id, {}).get('type') == 'awaiting_edit_product_description' and is_admin(user):
+        handle_edit_product_description(chat_id, text)
+    elif user_states.get(chat_id, {}).get('type') == 'awaiting_edit_product_price' and is_admin(user):
+        handle_edit_product_price(chat_id, text)
+    elif user_states.get(chat_id, {}).get('type') == 'awaiting_edit_product_emoji' and is_admin(user):
+        handle_edit_product_emoji(chat_id, text)
+    elif user_states.get(chat_id, {}).get('type') == 'awaiting_edit_product_stock' and is_admin(user):
+        handle_edit_product_stock(chat_id, text)
+    elif user_states.get(chat_id, {}).get('type') == 'awaiting_edit_product_photo' and is_admin(user):
+        handle_edit_product_photo(chat_id, message)
+    elif user_states.get(chat_id, {}).get('type') == 'awaiting_admin_username' and is_admin(user):
+        handle_add_admin(chat_id, text)
+    elif user_states.get(chat_id, {}).get('type') == 'awaiting_broadcast_text' and is_admin(user):
+        handle_broadcast_text(chat_id, text)
+    elif user_states.get(chat_id, {}).get('type') == 'awaiting_orders_export' and is_admin(user):
+        export_orders(chat_id, text)
+    elif user_states.get(chat_id, {}).get('type') == 'awaiting_order_search' and is_admin(user):
+        send_order_search_results(chat_id, text)
+    elif user_states.get(chat_id, {}).get('type') == 'awaiting_products_file' and is_admin(user):
+        if 'document' in message:
+            handle_products_import(chat_id, message['document'])
+        else:
+            send_telegram_message(chat_id, '📎 Отправьте файл CSV или JSON документом')
+    else:
+        send_telegram_message(chat_id, '❓ Используйте кнопки меню для навигации')
+
+
+def send_welcome(chat_id: int, user: Dict[str, Any]):
+    text = '''🛍️ <b>Добро пожаловать в EasyShop!</b>
+
+Рады видеть вас в нашем магазине! 
+
+Используйте кнопки ниже для навигации:
+📦 Каталог - посмотреть товары
+🛒 Корзина - оформить заказ
+💬 Обратная связь - связаться с нами
+📋 Мои заказы - история ваших заказов'''
+    
+    keyboard_buttons = [
+        [{'text': '📦 Каталог'}, {'text': '🛒 Корзина'}],
+        [{'text': '💬 Обратная связь'}, {'text': '📋 Мои заказы'}]
+    ]
+    
+    if is_admin(user):
+        text += '\n\n⚙️ Админ-панель доступна по команде /admin'
+    
+    keyboard = {
+        'keyboard': keyboard_buttons,
+        'resize_keyboard': True
+    }
+    
+    send_telegram_message(chat_id, text, keyboard)
+
+
+def send_admin_panel(chat_id: int):
+    text = '''⚙️ <b>Админ-панель EasyShop</b>
+
+Выберите действие:'''
+    
+    inline_keyboard = [
+        [{'text': '📦 Все заказы', 'callback_data': 'admin_orders'}],
+        [{'text': '🔎 Поиск заказов', 'callback_data': 'admin_orders_search'}],
+        [{'text': '💬 Обратная связь', 'callback_data': 'admin_feedback'}],
+        [{'text': '🛍️ Управление товарами', 'callback_data': 'admin_products'}],
+        [{'text': '👥 Управление админами', 'callback_data': 'admin_admins'}],
+        [{'text': '📣 Рассылки', 'callback_data': 'admin_broadcasts'}],
+        [{'text': '🔙 Назад', 'callback_data': 'admin_back'}]
+    ]
+    
+    reply_markup = {'inline_keyboard': inline_keyboard}
+    send_telegram_message(chat_id, text, reply_markup)
+
+
+def send_admin_orders(chat_id: int):
+    conn = get_read_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    
+    cur.execute('''
         SELECT id, order_number, customer_name, product_name, 
                executor, status, created_at, end_date
         FROM orders
-        ORDER BY 
+        ORDER BY -- must match idx_orders_admin_list
             CASE status
                 WHEN 'pending' THEN 1
                 WHEN 'accepted' THEN 2
@@ -243,42 +1277,492 @@ def send_admin_orders(chat_id: int):
     else:
         text = '📦 <b>Все заказы</b> (последние 20)\n\n'
         
-        status_emoji = {
-            'pending': '⏳',
-            'accepted': '💳',
-            'processing': '⚙️',
-            'completed': '✅',
-            'cancelled': '❌'
-        }
-        
         inline_keyboard = []
         for order in orders:
-            emoji = status_emoji.get(order['status'], '📦')
+            emoji = ORDER_STATUS_EMOJI.get(order['status'], '📦')
             button_text = f"{emoji} {order['customer_name']} - {order['product_name'][:20]}"
             inline_keyboard.append([{
                 'text': button_text,
                 'callback_data': f"admin_order_{order['id']}"
             }])
         
+        inline_keyboard.append([{'text': '☑️ Массовая смена статуса', 'callback_data': 'bulk_orders'}])
+        inline_keyboard.append([{'text': '🔎 Поиск заказов', 'callback_data': 'admin_orders_search'}])
+        inline_keyboard.append([{'text': '📤 Экспорт заказов', 'callback_data': 'admin_orders_export'}])
         inline_keyboard.append([{'text': '🔙 Назад', 'callback_data': 'admin_panel'}])
     
     reply_markup = {'inline_keyboard': inline_keyboard}
     send_telegram_message(chat_id, text, reply_markup)
 
 
-def send_admin_order_details(chat_id: int, order_id: int):
+ORDER_SEARCH_PAGE_SIZE = 10
+ORDER_SEARCH_CANDIDATES = 1000
+ORDER_SEARCH_MIN_LENGTH = 3
+
+
+def start_order_search(chat_id: int):
+    user_states[chat_id] = {'type': 'awaiting_order_search'}
+    send_telegram_message(chat_id, '''🔎 <b>Поиск заказов</b>
+
+Отправьте начало номера заказа, имя клиента или @username.
+Например: <code>ORD-1712345678</code>, <code>1712</code>, <code>@ivan</code>, <code>Иванов</code>''')
+
+
+def escape_like(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def order_number_prefix(query: str) -> Optional[str]:
+    import re
+    
+    match = re.match(r'^(?:ORD-?)?(\d+)$', query, re.IGNORECASE)
+    return f'ORD-{match.group(1)}' if match else None
+
+
+def search_orders(query: str, cursor: Optional[Any]) -> Tuple[List[Dict[str, Any]], Optional[Any]]:
+    number_prefix = order_number_prefix(query)
+    
+    created_before, id_before = cursor or ('infinity', 0)
+    
+    conn = get_read_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    
+    if number_prefix:
+        # Matches are listed newest first like name matches: legacy ORD-<seconds> numbers are
+        # shorter than ORD-<milliseconds><2 digits> ones, so number order is not age order.
+        # The key range keeps a long prefix on the unique order_number index plus a small sort;
+        # a short prefix walks idx_orders_created_at_id, slowly when all its orders are old.
+        digits = number_prefix[len('ORD-'):]
+        upper_bound = 'ORD-' + str(int(digits) + 1).zfill(len(digits)) if digits.strip('9') else 'ORE'
+        cur.execute('''
+            SELECT id, order_number, customer_name, telegram_username, product_name, status, created_at
+            FROM orders
+            WHERE order_number LIKE %s
+              AND order_number >= %s AND order_number < %s
+              AND (created_at, id) < (%s::timestamp, %s)
+            ORDER BY created_at DESC, id DESC
+            LIMIT %s
+        ''', (number_prefix + '%', number_prefix, upper_bound, created_before, id_before,
+              ORDER_SEARCH_PAGE_SIZE + 1))
+        orders = cur.fetchall()
+        
+        if not orders and cursor is None:
+            cur.execute('''
+                SELECT id, order_number, customer_name, telegram_username, product_name, status, created_at
+                FROM orders_archive
+                WHERE order_number = %s
+            ''', (number_prefix,))
+            orders = cur.fetchall()
+    else:
+        # Usernames match by prefix, customer names by substring or word similarity.
+        # Matches are listed newest first. Rare terms are collected from the indexes
+        # and sorted; only when there are more than ORDER_SEARCH_CANDIDATES of them (a common
+        # name, so matches are dense) is idx_orders_created_at_id walked until a page is full.
+        # Left to itself the planner walks the index for rare terms too, reading every order.
+        params = (escape_like(query.lower()) + '%', '%' + escape_like(query) + '%', query, created_before, id_before)
+        cur.execute('''
+            WITH candidates AS MATERIALIZED (
+                SELECT id, created_at
+                FROM orders
+                WHERE (lower(telegram_username) LIKE %s OR customer_name ILIKE %s OR customer_name OPERATOR(public.%%>) %s)
+                  AND (created_at, id) < (%s::timestamp, %s)
+                LIMIT %s
+            )
+            SELECT o.id, o.order_number, o.customer_name, o.telegram_username, o.product_name, o.status, o.created_at,
+                   page.candidates
+            FROM (
+                SELECT c.id, c.created_at, COUNT(*) OVER () AS candidates
+                FROM candidates c
+                ORDER BY c.created_at DESC, c.id DESC
+                LIMIT %s
+            ) page
+            JOIN orders o ON o.id = page.id
+            ORDER BY page.created_at DESC, page.id DESC
+        ''', (*params, ORDER_SEARCH_CANDIDATES, ORDER_SEARCH_PAGE_SIZE + 1))
+        orders = cur.fetchall()
+        
+        if orders and orders[0]['candidates'] >= ORDER_SEARCH_CANDIDATES:
+            cur.execute('''
+                SELECT id, order_number, customer_name, telegram_username, product_name, status, created_at
+                FROM orders
+                WHERE (lower(telegram_username) LIKE %s OR customer_name ILIKE %s OR customer_name OPERATOR(public.%%>) %s)
+                  AND (created_at, id) < (%s::timestamp, %s)
+                ORDER BY created_at DESC, id DESC
+                LIMIT %s
+            ''', (*params, ORDER_SEARCH_PAGE_SIZE + 1))
+            orders = cur.fetchall()
+    
+    cur.close()
+    conn.close()
+    
+    if len(orders) <= ORDER_SEARCH_PAGE_SIZE:
+        return orders, None
+    last = orders[ORDER_SEARCH_PAGE_SIZE - 1]
+    return orders[:ORDER_SEARCH_PAGE_SIZE], [last['created_at'].isoformat(), last['id']]
+
+
+def send_order_search_results(chat_id: int, query_text: Optional[str] = None, page: int = 0):
+    state = user_states.get(chat_id, {})
+    if query_text is not None:
+        query = query_text.strip().lstrip('@#').strip()
+        if len(query) < ORDER_SEARCH_MIN_LENGTH:
+            user_states[chat_id] = {'type': 'awaiting_order_search'}
+            send_telegram_message(chat_id, f'❌ Введите не меньше {ORDER_SEARCH_MIN_LENGTH} символов')
+            return
+        state = {'type': 'awaiting_order_search', 'query': query, 'cursors': [None]}
+        user_states[chat_id] = state
+    query = state['query']
+    cursors = state['cursors']
+    page = min(page, len(cursors) - 1)
+    
+    orders, next_cursor = search_orders(query, cursors[page])
+    del cursors[page + 1:]
+    if next_cursor is not None:
+        cursors.append(next_cursor)
+    
+    if not orders:
+        text = f'🔎 По запросу <code>{html.escape(query)}</code> ничего не найдено\n\nОтправьте другой запрос.'
+        inline_keyboard = []
+    else:
+        text = f'🔎 <b>Найдено по запросу</b> <code>{html.escape(query)}</code> (стр. {page + 1}, сначала новые)\n\nМожно сразу отправить новый запрос.'
+        inline_keyboard = []
+        for order in orders:
+            emoji = ORDER_STATUS_EMOJI.get(order['status'], '📦')
+            username = f" @{order['telegram_username']}" if order['telegram_username'] else ''
+            inline_keyboard.append([{
+                'text': f"{emoji} {order['order_number']} · {order['customer_name']}{username}"[:64],
+                'callback_data': f"admin_order_{order['id']}"
+            }])
+        
+        navigation = []
+        if page > 0:
+            navigation.append({'text': '◀️ Назад', 'callback_data': f'admin_orders_search_{page - 1}'})
+        if next_cursor is not None:
+            navigation.append({'text': 'Далее ▶️', 'callback_data': f'admin_orders_search_{page + 1}'})
+        if navigation:
+            inline_keyboard.append(navigation)
+    
+    inline_keyboard.append([{'text': '📦 Все заказы', 'callback_data': 'admin_orders'}])
+    send_telegram_message(chat_id, text, {'inline_keyboard': inline_keyboard})
+
+
+ORDERS_EXPORT_COLUMNS = [
+    'order_number', 'created_at', 'status', 'customer_name', 'telegram_username', 'telegram_user_id',
+    'product_name', 'total_amount', 'executor', 'start_date', 'end_date', 'notes'
+]
+ORDERS_EXPORT_FETCH_SIZE = 2000
+ORDERS_EXPORT_MAX_BYTES = 48 * 1024 * 1024
+
+
+def start_orders_export(chat_id: int):
+    user_states[chat_id] = {'type': 'awaiting_orders_export'}
+    statuses = ', '.join(ORDER_STATUS_TEXT)
+    send_telegram_message(chat_id, f'''📤 <b>Экспорт заказов</b>
+
+Отправьте период и, если нужно, статусы:
+<code>01.01.2024 31.03.2024 completed cancelled</code>
+
+Можно указать только дату начала или только статусы.
+Отправьте <code>все</code>, чтобы выгрузить всю историю.
+Статусы: {statuses}''')
+
+
+def parse_orders_export_filters(text: str) -> Optional[Dict[str, Any]]:
+    filters: Dict[str, Any] = {'date_from': None, 'date_to': None, 'statuses': []}
+    dates = []
+    
+    for token in text.replace(',', ' ').split():
+        if token.lower() in ('все', 'all'):
+            continue
+        if token.lower() in ORDER_STATUS_TEXT:
+            filters['statuses'].append(token.lower())
+            continue
+        try:
+            dates.append(datetime.strptime(token, '%d.%m.%Y'))
+        except ValueError:
+            return None
+    
+    if len(dates) > 2:
+        return None
+    if dates:
+        filters['date_from'] = dates[0]
+    if len(dates) == 2:
+        filters['date_to'] = dates[1] + timedelta(days=1)
+    return filters
+
+
+def export_orders(chat_id: int, text: str):
+    import gzip
+    import tempfile
+    
+    filters = parse_orders_export_filters(text)
+    if filters is None:
+        send_telegram_message(chat_id, '❌ Не удалось разобрать фильтр. Пример: <code>01.01.2024 31.03.2024 completed</code>')
+        return
+    user_states.pop(chat_id, None)
+    
+    conditions = []
+    params: List[Any] = []
+    if filters['date_from']:
+        conditions.append('created_at >= %s')
+        params.append(filters['date_from'])
+    if filters['date_to']:
+        conditions.append('created_at < %s')
+        params.append(filters['date_to'])
+    if filters['statuses']:
+        conditions.append('status = ANY(%s)')
+        params.append(filters['statuses'])
+    where = ('WHERE ' + ' AND '.join(conditions)) if conditions else ''
+    columns = ', '.join(ORDERS_EXPORT_COLUMNS)
+    
+    send_telegram_message(chat_id, '⏳ Готовлю выгрузку заказов...')
+    
+    conn = get_read_connection()
+    cur = conn.cursor(name='orders_export')
+    cur.itersize = ORDERS_EXPORT_FETCH_SIZE
+    
+    row_count = 0
+    with tempfile.TemporaryFile() as export_file:
+        with gzip.GzipFile(fileobj=export_file, mode='wb') as gzip_file:
+            text_file = io.TextIOWrapper(gzip_file, encoding='utf-8-sig', newline='')
+            writer = csv.writer(text_file)
+            writer.writerow(ORDERS_EXPORT_COLUMNS)
+            
+            cur.execute(f'''
+                SELECT {columns} FROM orders {where}
+                UNION ALL
+                SELECT {columns} FROM orders_archive {where}
+                ORDER BY created_at
+            ''', params * 2)
+            status_index = ORDERS_EXPORT_COLUMNS.index('status')
+            for row in cur:
+                row = list(row)
+                row[status_index] = ORDER_STATUS_TEXT.get(row[status_index], row[status_index])
+                writer.writerow(row)
+                row_count += 1
+            
+            text_file.flush()
+            text_file.detach()
+        
+        cur.close()
+        conn.close()
+        
+        if not row_count:
+            send_telegram_message(chat_id, '📭 Нет заказов под этот фильтр')
+            return
+        if export_file.tell() > ORDERS_EXPORT_MAX_BYTES:
+            send_telegram_message(chat_id, '❌ Файл слишком большой для Telegram. Сузьте период или выберите статусы.')
+            return
+        
+        filename = f"orders_{datetime.now().strftime('%Y%m%d_%H%M')}.csv.gz"
+        send_telegram_document(chat_id, filename, export_file, f'📤 Экспорт заказов: {row_count}')
+
+
+BULK_ORDERS_LIMIT = 50
+
+
+def send_bulk_orders_filter(chat_id: int):
+    user_states.pop(chat_id, None)
+    
+    text = '''☑️ <b>Массовая смена статуса</b>
+
+Выберите текущий статус заказов:'''
+    
+    inline_keyboard = []
+    for status in ['pending', 'accepted', 'processing']:
+        inline_keyboard.append([{
+            'text': f"{ORDER_STATUS_EMOJI[status]} {ORDER_STATUS_TEXT[status]}",
+            'callback_data': f"bulk_orders_{status}"
+        }])
+    inline_keyboard.append([{'text': '🔙 К списку', 'callback_data': 'admin_orders'}])
+    
+    reply_markup = {'inline_keyboard': inline_keyboard}
+    send_telegram_message(chat_id, text, reply_markup)
+
+
+def start_bulk_order_selection(chat_id: int, status: str):
+    conn = get_read_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    
+    cur.execute('''
+        SELECT id, customer_name, product_name
+        FROM orders
+        WHERE status = %s
+        ORDER BY created_at
+        LIMIT %s
+    ''', (status, BULK_ORDERS_LIMIT))
+    
+    orders = [dict(row) for row in cur.fetchall()]
+    cur.close()
+    conn.close()
+    
+    if not orders:
+        inline_keyboard = [[{'text': '🔙 Назад', 'callback_data': 'bulk_orders'}]]
+        send_telegram_message(chat_id, f'☑️ Нет заказов со статусом «{ORDER_STATUS_TEXT.get(status, status)}»', {'inline_keyboard': inline_keyboard})
+        return
+    
+    user_states[chat_id] = {
+        'type': 'selecting_orders',
+        'status': status,
+        'orders': orders,
+        'selected': set()
+    }
+    
+    text = f'''☑️ <b>Заказы: {ORDER_STATUS_TEXT.get(status, status)}</b> (до {BULK_ORDERS_LIMIT})
+
+Отметьте заказы и выберите новый статус:'''
+    
+    send_telegram_message(chat_id, text, build_bulk_order_keyboard(chat_id))
+
+
+def build_bulk_order_keyboard(chat_id: int) -> Dict:
+    state = user_states[chat_id]
+    
+    inline_keyboard = []
+    for order in state['orders']:
+        mark = '☑️' if order['id'] in state['selected'] else '⬜'
+        inline_keyboard.append([{
+            'text': f"{mark} {order['customer_name']} - {order['product_name'][:20]}",
+            'callback_data': f"bulk_toggle_{order['id']}"
+        }])
+    
+    inline_keyboard.append([
+        {'text': '✅ Выбрать все', 'callback_data': 'bulk_select_all'},
+        {'text': '⬜ Снять все', 'callback_data': 'bulk_select_none'}
+    ])
+    
+    target_buttons = [
+        {'text': f"→ {ORDER_STATUS_EMOJI[status]} {ORDER_STATUS_TEXT[status]}", 'callback_data': f"bulk_apply_{status}"}
+        for status in ORDER_STATUS_TRANSITIONS[state['status']]
+    ]
+    for i in range(0, len(target_buttons), 2):
+        inline_keyboard.append(target_buttons[i:i + 2])
+    
+    inline_keyboard.append([{'text': '🔙 Назад', 'callback_data': 'bulk_orders'}])
+    return {'inline_keyboard': inline_keyboard}
+
+
+def toggle_bulk_order_selection(chat_id: int, message_id: int, order_id: Optional[int] = None, select_all: Optional[bool] = None):
+    state = user_states.get(chat_id, {})
+    if state.get('type') != 'selecting_orders':
+        send_bulk_orders_filter(chat_id)
+        return
+    
+    previous = set(state['selected'])
+    
+    if select_all is True:
+        state['selected'] = {order['id'] for order in state['orders']}
+    elif select_all is False:
+        state['selected'] = set()
+    elif order_id in state['selected']:
+        state['selected'].discard(order_id)
+    else:
+        state['selected'].add(order_id)
+    
+    if state['selected'] == previous:
+        return
+    
+    edit_telegram_reply_markup(chat_id, message_id, build_bulk_order_keyboard(chat_id))
+
+
+def apply_bulk_order_status(chat_id: int, new_status: str):
+    state = user_states.get(chat_id, {})
+    if state.get('type') != 'selecting_orders' or new_status not in ORDER_STATUS_TRANSITIONS[state['status']]:
+        send_bulk_orders_filter(chat_id)
+        return
+    
+    if not state['selected']:
+        send_telegram_message(chat_id, '☑️ Не выбрано ни одного заказа')
+        return
+    
     conn = get_db_connection()
     cur = conn.cursor(cursor_factory=RealDictCursor)
     
+    cur.execute('''
+        WITH changed AS (
+            UPDATE orders
+            SET status = %s
+            WHERE id = ANY(%s) AND status = %s
+            RETURNING id, telegram_user_id, order_number
+        ), history AS (
+            INSERT INTO order_status_history (order_id, old_status, new_status, changed_by_user_id)
+            SELECT id, %s, %s, %s FROM changed
+        )
+        SELECT id, telegram_user_id, order_number FROM changed
+    ''', (new_status, list(state['selected']), state['status'], state['status'], new_status, chat_id))
+    
+    updated = cur.fetchall()
+    if new_status == 'cancelled':
+        release_order_stock(cur, [order['id'] for order in updated])
+    conn.commit()
+    cur.close()
+    conn.close()
+    
+    user_states.pop(chat_id, None)
+    
+    orders_by_customer: Dict[int, List[str]] = {}
+    for order in updated:
+        orders_by_customer.setdefault(order['telegram_user_id'], []).append(order['order_number'])
+    
+    status_label = ORDER_STATUS_TEXT.get(new_status, new_status)
+    notifications = []
+    for customer_id, order_numbers in orders_by_customer.items():
+        numbers = '\n'.join(f'Заказ #{number}' for number in order_numbers)
+        notifications.append((customer_id, f'''📦 <b>Статус заказа изменен</b>
+
+{numbers}
+Новый статус: {status_label}'''))
+    
+    outcomes = send_telegram_messages_batch(notifications)
+    sent = sum(1 for status, _ in outcomes if status == 'sent')
+    failed = len(outcomes) - sent
+    skipped = len(state['selected']) - len(updated)
+    
+    text = f'''✅ <b>Статус обновлен: {status_label}</b>
+
+📦 Заказов: {len(updated)}
+📨 Уведомлено клиентов: {sent}'''
+    if failed:
+        text += f'\n⚠️ Не доставлено: {failed}'
+    if skipped:
+        text += f'\n⏭️ Пропущено (статус уже изменён): {skipped}'
+    
+    inline_keyboard = [[{'text': '🔙 К списку', 'callback_data': 'admin_orders'}]]
+    send_telegram_message(chat_id, text, {'inline_keyboard': inline_keyboard})
+
+
+def send_admin_order_details(chat_id: int, order_id: int):
+    conn = get_read_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    
     cur.execute('''
         SELECT id, order_number, telegram_user_id, telegram_username, 
-               customer_name, product_name, executor, notes, status, 
-               created_at, start_date, end_date
+               customer_name, product_name, total_amount, executor, notes, status, 
+               created_at, start_date, end_date, FALSE AS archived
         FROM orders
         WHERE id = %s
-    ''', (order_id,))
+        UNION ALL
+        SELECT id, order_number, telegram_user_id, telegram_username, 
+               customer_name, product_name, total_amount, executor, notes, status, 
+               created_at, start_date, end_date, TRUE AS archived
+        FROM orders_archive
+        WHERE id = %s
+        LIMIT 1
+    ''', (order_id, order_id))
     
     order = cur.fetchone()
+    
+    cur.execute('''
+        SELECT product_name, price, quantity
+        FROM order_items
+        WHERE order_id = %s
+        UNION ALL
+        SELECT product_name, price, quantity
+        FROM order_items_archive
+        WHERE order_id = %s
+    ''', (order_id, order_id))
+    items = cur.fetchall()
+    
     cur.close()
     conn.close()
     
@@ -286,46 +1770,49 @@ def send_admin_order_details(chat_id: int, order_id: int):
         send_telegram_message(chat_id, '❌ Заказ не найден')
         return
     
-    status_text = {
-        'pending': 'Ожидание принятия',
-        'accepted': 'Заказ принят',
-        'processing': 'Выполняется',
-        'completed': 'Выполнено',
-        'cancelled': 'Отменено'
-    }
-    
     text = f'''📦 <b>Заказ #{order['order_number']}</b>
 
 👤 <b>Клиент:</b> {order['customer_name']}
 📱 <b>Username:</b> @{order['telegram_username'] or 'не указан'}
 🎁 <b>Товар:</b> {order['product_name']}
-📝 <b>Исполнитель:</b> {order['executor'] or 'Не назначен'}
-📊 <b>Статус:</b> {status_text.get(order['status'], order['status'])}
+{format_order_items(items, order['total_amount'])}📝 <b>Исполнитель:</b> {order['executor'] or 'Не назначен'}
+📊 <b>Статус:</b> {ORDER_STATUS_TEXT.get(order['status'], order['status'])}
 
 📅 <b>Создан:</b> {order['created_at'].strftime('%d.%m.%Y %H:%M')}
 🎯 <b>Срок:</b> {order['end_date'].strftime('%d.%m.%Y') if order['end_date'] else 'Не указан'}
 
 {f"💬 <b>Примечания:</b> {order['notes']}" if order['notes'] else ""}'''
     
-    inline_keyboard = [
-        [
-            {'text': '✅ Принять', 'callback_data': f"order_accept_{order_id}"},
-            {'text': '❌ Отменить', 'callback_data': f"order_cancel_{order_id}"}
-        ],
-        [
-            {'text': '⚙️ В работу', 'callback_data': f"order_processing_{order_id}"},
-            {'text': '🎉 Завершить', 'callback_data': f"order_complete_{order_id}"}
-        ],
-        [{'text': '🗑️ Удалить заказ', 'callback_data': f"order_delete_{order_id}"}],
-        [{'text': '🔙 К списку', 'callback_data': 'admin_orders'}]
+    if order['archived']:
+        text += '\n🗄 <b>Заказ в архиве</b>'
+        inline_keyboard = [[{'text': '🔙 К списку', 'callback_data': 'admin_orders'}]]
+        send_telegram_message(chat_id, text, {'inline_keyboard': inline_keyboard})
+        return
+    
+    status_buttons = [
+        {'text': ORDER_STATUS_ACTIONS[status][0], 'callback_data': f"{ORDER_STATUS_ACTIONS[status][1]}{order_id}"}
+        for status in ORDER_STATUS_TRANSITIONS.get(order['status'], ())
     ]
+    inline_keyboard = [status_buttons[i:i + 2] for i in range(0, len(status_buttons), 2)]
+    inline_keyboard.append([{'text': '🗑️ Удалить заказ', 'callback_data': f"order_delete_{order_id}"}])
+    inline_keyboard.append([{'text': '🔙 К списку', 'callback_data': 'admin_orders'}])
     
     reply_markup = {'inline_keyboard': inline_keyboard}
     send_telegram_message(chat_id, text, reply_markup)
 
 
+def format_order_items(items: List[Dict[str, Any]], total_amount: Optional[int]) -> str:
+    if not items:
+        return ''
+    
+    lines = ''.join(f"   • {item['product_name']} × {item['quantity']} — {item['price'] * item['quantity']:,} ₽\n" for item in items)
+    if total_amount is not None:
+        lines += f"💰 <b>Сумма:</b> {total_amount:,} ₽\n"
+    return lines
+
+
 def send_admin_feedback(chat_id: int):
-    conn = get_db_connection()
+    conn = get_read_connection()
     cur = conn.cursor(cursor_factory=RealDictCursor)
     
     cur.execute('''
@@ -364,7 +1851,7 @@ def send_admin_feedback(chat_id: int):
 
 
 def send_admin_feedback_details(chat_id: int, message_id: int):
-    conn = get_db_connection()
+    conn = get_read_connection()
     cur = conn.cursor(cursor_factory=RealDictCursor)
     
     cur.execute('''
@@ -372,7 +1859,13 @@ def send_admin_feedback_details(chat_id: int, message_id: int):
                message, admin_reply, is_replied, created_at, replied_at
         FROM feedback_messages
         WHERE id = %s
-    ''', (message_id,))
+        UNION ALL
+        SELECT id, telegram_user_id, telegram_username, customer_name,
+               message, admin_reply, is_replied, created_at, replied_at
+        FROM feedback_messages_archive
+        WHERE id = %s
+        LIMIT 1
+    ''', (message_id, message_id))
     
     feedback = cur.fetchone()
     cur.close()
@@ -406,7 +1899,7 @@ def send_admin_feedback_details(chat_id: int, message_id: int):
 
 
 def send_admin_products(chat_id: int):
-    conn = get_db_connection()
+    conn = get_read_connection()
     cur = conn.cursor(cursor_factory=RealDictCursor)
     
     cur.execute('SELECT id, name, emoji, price FROM products ORDER BY id')
@@ -426,6 +1919,10 @@ def send_admin_products(chat_id: int):
         }])
     
     inline_keyboard.append([{'text': '➕ Добавить товар', 'callback_data': 'admin_product_add'}])
+    inline_keyboard.append([
+        {'text': '📥 Импорт', 'callback_data': 'admin_products_import'},
+        {'text': '📤 Экспорт', 'callback_data': 'admin_products_export'}
+    ])
     inline_keyboard.append([{'text': '🔙 Назад', 'callback_data': 'admin_panel'}])
     
     reply_markup = {'inline_keyboard': inline_keyboard}
@@ -433,10 +1930,10 @@ def send_admin_products(chat_id: int):
 
 
 def send_admin_product_details(chat_id: int, product_id: int):
-    conn = get_db_connection()
+    conn = get_read_connection()
     cur = conn.cursor(cursor_factory=RealDictCursor)
     
-    cur.execute('SELECT id, name, description, price, emoji FROM products WHERE id = %s', (product_id,))
+    cur.execute('SELECT id, name, description, price, emoji, stock, photo_file_id FROM products WHERE id = %s', (product_id,))
     product = cur.fetchone()
     
     cur.close()
@@ -450,7 +1947,9 @@ def send_admin_product_details(chat_id: int, product_id: int):
 
 📝 {product['description']}
 
-💰 <b>Цена:</b> {product['price']:,} ₽'''
+💰 <b>Цена:</b> {product['price']:,} ₽
+📦 <b>Остаток:</b> {product['stock'] if product['stock'] is not None else 'без ограничений'}
+🖼 <b>Фото:</b> {'есть' if product['photo_file_id'] else 'нет'}'''
     
     inline_keyboard = [
         [{'text': '✏️ Редактировать', 'callback_data': f"product_edit_{product_id}"}],
@@ -463,7 +1962,7 @@ def send_admin_product_details(chat_id: int, product_id: int):
 
 
 def send_product_edit_menu(chat_id: int, product_id: int):
-    conn = get_db_connection()
+    conn = get_read_connection()
     cur = conn.cursor(cursor_factory=RealDictCursor)
     
     cur.execute('SELECT id, name, description, price, emoji FROM products WHERE id = %s', (product_id,))
@@ -487,6 +1986,8 @@ def send_product_edit_menu(chat_id: int, product_id: int):
         [{'text': '📄 Описание', 'callback_data': f"edit_product_desc_{product_id}"}],
         [{'text': '💰 Цена', 'callback_data': f"edit_product_price_{product_id}"}],
         [{'text': '🎨 Эмодзи', 'callback_data': f"edit_product_emoji_{product_id}"}],
+        [{'text': '📦 Остаток', 'callback_data': f"edit_product_stock_{product_id}"}],
+        [{'text': '🖼 Фото', 'callback_data': f"edit_product_photo_{product_id}"}],
         [{'text': '🔙 Назад', 'callback_data': f"admin_product_{product_id}"}]
     ]
     
@@ -495,7 +1996,7 @@ def send_product_edit_menu(chat_id: int, product_id: int):
 
 
 def send_admin_admins(chat_id: int):
-    conn = get_db_connection()
+    conn = get_read_connection()
     cur = conn.cursor(cursor_factory=RealDictCursor)
     
     cur.execute('''
@@ -526,7 +2027,7 @@ def send_admin_admins(chat_id: int):
 
 
 def send_admin_admin_details(chat_id: int, admin_id: int):
-    conn = get_db_connection()
+    conn = get_read_connection()
     cur = conn.cursor(cursor_factory=RealDictCursor)
     
     cur.execute('''
@@ -601,19 +2102,237 @@ def handle_new_product_emoji(chat_id: int, emoji: str):
     cur.close()
     conn.close()
     
+    invalidate_catalog_cache()
+    
+    user_states.pop(chat_id, None)
+    
+    text = f'''✅ <b>Товар добавлен!</b>
+
+{emoji} <b>{product_data['name']}</b>
+{product_data['description']}
+💰 {product_data['price']:,} ₽'''
+    
+    inline_keyboard = [[{'text': '🛍️ К списку товаров', 'callback_data': 'admin_products'}]]
+    reply_markup = {'inline_keyboard': inline_keyboard}
+    send_telegram_message(chat_id, text, reply_markup)
+
+
+PRODUCT_IMPORT_COLUMNS = ['id', 'name', 'description', 'price', 'emoji', 'stock', 'stock_set']
+PRODUCT_IMPORT_MAX_ERRORS = 20
+PRODUCT_IMPORT_MAX_INT = 2 ** 31 - 1
+
+
+def start_products_import(chat_id: int):
+    user_states[chat_id] = {'type': 'awaiting_products_file'}
+    send_telegram_message(chat_id, '''📥 <b>Импорт товаров</b>
+
+Отправьте файл CSV или JSON с колонками:
+<code>id, name, description, price, emoji, stock</code>
+
+Строки с существующим id обновляются, без id — добавляются как новые товары.
+Пустой stock (или «-») — без ограничения остатка. Если колонки stock нет, остатки не меняются.
+Формат совпадает с файлом из 📤 Экспорт.''')
+
+
+def iter_product_import_rows(filename: str, stream) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    text_stream = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    
+    if filename.lower().endswith('.json'):
+        data = json.load(text_stream)
+        if isinstance(data, dict):
+            data = data.get('products')
+        if not isinstance(data, list):
+            raise ValueError('ожидается список товаров или объект с ключом "products"')
+        for index, row in enumerate(data, start=1):
+            yield index, row if isinstance(row, dict) else {}
+        return
+    
+    header_line = text_stream.readline()
+    dialect = csv.Sniffer().sniff(header_line, delimiters=',;')
+    fieldnames = [name.strip().lower() for name in next(csv.reader([header_line], dialect))]
+    
+    reader = csv.DictReader(text_stream, fieldnames=fieldnames, dialect=dialect)
+    for row in reader:
+        yield reader.line_num + 1, row
+
+
+def parse_product_import_row(raw: Dict[str, Any]) -> Dict[str, Any]:
+    product_id = str(raw.get('id') or '').strip()
+    name = str(raw.get('name') or '').strip()
+    description = str(raw.get('description') or '').strip()
+    price_text = str(raw.get('price') if raw.get('price') is not None else '').strip()
+    emoji = str(raw.get('emoji') or '').strip()
+    stock_text = str(raw.get('stock') if raw.get('stock') is not None else '').strip()
+    
+    if product_id and not product_id.isdigit():
+        raise ValueError('id должен быть целым числом')
+    if product_id and int(product_id) > PRODUCT_IMPORT_MAX_INT:
+        raise ValueError('id слишком большой')
+    if not name:
+        raise ValueError('не указано название')
+    if len(name) > 255:
+        raise ValueError('название длиннее 255 символов')
+    if not emoji:
+        raise ValueError('не указан эмодзи')
+    if len(emoji) > 10:
+        raise ValueError('эмодзи длиннее 10 символов')
+    
+    try:
+        price = int(price_text.replace(' ', '').replace(',', ''))
+    except ValueError:
+        raise ValueError('цена должна быть целым числом')
+    if price < 0:
+        raise ValueError('цена не может быть отрицательной')
+    if price > PRODUCT_IMPORT_MAX_INT:
+        raise ValueError('цена слишком большая')
+    
+    stock = None
+    if stock_text not in ('', '-'):
+        try:
+            stock = int(stock_text.replace(' ', ''))
+        except ValueError:
+            raise ValueError('остаток должен быть целым числом или пустым')
+        if stock < 0:
+            raise ValueError('остаток не может быть отрицательным')
+        if stock > PRODUCT_IMPORT_MAX_INT:
+            raise ValueError('остаток слишком большой')
+    
+    return {
+        'id': int(product_id) if product_id else None,
+        'name': name,
+        'description': description,
+        'price': price,
+        'emoji': emoji,
+        'stock': stock,
+        'stock_set': 'stock' in raw
+    }
+
+
+def bulk_load_products(buffer: io.StringIO) -> Tuple[int, int]:
+    conn = get_db_connection()
+    cur = conn.cursor()
+    
+    cur.execute('''
+        CREATE TEMP TABLE product_import (
+            id INTEGER,
+            name VARCHAR(255),
+            description TEXT,
+            price INTEGER,
+            emoji VARCHAR(10),
+            stock INTEGER,
+            stock_set BOOLEAN NOT NULL
+        ) ON COMMIT DROP
+    ''')
+    
+    buffer.seek(0)
+    cur.copy_expert('''
+        COPY product_import (id, name, description, price, emoji, stock, stock_set)
+        FROM STDIN WITH (FORMAT csv, FORCE_NOT_NULL (description))
+    ''', buffer)
+    
+    cur.execute('''
+        UPDATE products p
+        SET name = i.name, description = i.description, price = i.price, emoji = i.emoji,
+            stock = CASE WHEN i.stock_set THEN i.stock ELSE p.stock END
+        FROM product_import i
+        WHERE p.id = i.id
+    ''')
+    updated = cur.rowcount
+    
+    cur.execute('''
+        INSERT INTO products (name, description, price, emoji, stock)
+        SELECT i.name, i.description, i.price, i.emoji, i.stock
+        FROM product_import i
+        WHERE i.id IS NULL
+           OR NOT EXISTS (SELECT 1 FROM products p WHERE p.id = i.id)
+    ''')
+    inserted = cur.rowcount
+    
+    conn.commit()
+    cur.close()
+    conn.close()
+    
+    return inserted, updated
+
+
+def handle_products_import(chat_id: int, document: Dict[str, Any]):
+    filename = document.get('file_name', '')
+    if not filename.lower().endswith(('.csv', '.json')):
+        send_telegram_message(chat_id, '❌ Поддерживаются только файлы .csv и .json')
+        return
+    
+    if document.get('file_size', 0) > TELEGRAM_FILE_MAX_BYTES:
+        send_telegram_message(chat_id, f'❌ Файл больше {TELEGRAM_FILE_MAX_BYTES // (1024 * 1024)} МБ — бот не может его скачать. Разделите его на части.')
+        return
+    
     user_states.pop(chat_id, None)
+    send_telegram_message(chat_id, '⏳ Загружаю товары...')
     
-    text = f'''✅ <b>Товар добавлен!</b>
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    errors = []
+    seen_ids = set()
+    valid_count = 0
+    
+    try:
+        with open_telegram_file(document['file_id']) as stream:
+            for line_number, raw in iter_product_import_rows(filename, stream):
+                try:
+                    row = parse_product_import_row(raw)
+                    if row['id'] is not None:
+                        if row['id'] in seen_ids:
+                            raise ValueError(f"id {row['id']} повторяется в файле")
+                        seen_ids.add(row['id'])
+                except ValueError as e:
+                    errors.append((line_number, str(e)))
+                    continue
+                
+                writer.writerow([row[column] if row[column] is not None else '' for column in PRODUCT_IMPORT_COLUMNS])
+                valid_count += 1
+    except (ValueError, csv.Error) as e:
+        send_telegram_message(chat_id, f'❌ Не удалось прочитать файл: {html.escape(str(e))}')
+        return
+    except OSError as e:
+        # urllib.error.URLError from getFile or the download, or a connection dropped mid-read
+        send_telegram_message(chat_id, f'❌ Не удалось скачать файл из Telegram: {html.escape(str(getattr(e, "reason", e)))}. Попробуйте ещё раз.')
+        return
+    
+    inserted, updated = bulk_load_products(buffer) if valid_count else (0, 0)
+    invalidate_catalog_cache()
+    
+    text = f'''✅ <b>Импорт завершён</b>
 
-{emoji} <b>{product_data['name']}</b>
-{product_data['description']}
-💰 {product_data['price']:,} ₽'''
+➕ Добавлено: {inserted}
+✏️ Обновлено: {updated}
+❌ Ошибок: {len(errors)}'''
+    
+    if errors:
+        text += '\n\n' + '\n'.join(f'Строка {line}: {error}' for line, error in errors[:PRODUCT_IMPORT_MAX_ERRORS])
+        if len(errors) > PRODUCT_IMPORT_MAX_ERRORS:
+            text += f'\n...и ещё {len(errors) - PRODUCT_IMPORT_MAX_ERRORS}'
     
     inline_keyboard = [[{'text': '🛍️ К списку товаров', 'callback_data': 'admin_products'}]]
     reply_markup = {'inline_keyboard': inline_keyboard}
     send_telegram_message(chat_id, text, reply_markup)
 
 
+def export_products(chat_id: int):
+    conn = get_read_connection()
+    cur = conn.cursor()
+    
+    buffer = io.StringIO()
+    cur.copy_expert('''
+        COPY (SELECT id, name, description, price, emoji, stock FROM products ORDER BY id)
+        TO STDOUT WITH (FORMAT csv, HEADER)
+    ''', buffer)
+    
+    cur.close()
+    conn.close()
+    
+    filename = f"products_{datetime.now().strftime('%Y%m%d_%H%M')}.csv"
+    send_telegram_document(chat_id, filename, buffer.getvalue().encode('utf-8-sig'), '📤 Экспорт товаров')
+
+
 def start_edit_product_name(chat_id: int, product_id: int):
     user_states[chat_id] = {'type': 'awaiting_edit_product_name', 'product_id': product_id}
     send_telegram_message(chat_id, '📝 Введите новое название товара:')
@@ -630,6 +2349,8 @@ def handle_edit_product_name(chat_id: int, name: str):
     
     cur.close()
     conn.close()
+
+    invalidate_catalog_cache()
     
     user_states.pop(chat_id, None)
     send_telegram_message(chat_id, '✅ Название обновлено!')
@@ -652,6 +2373,8 @@ def handle_edit_product_description(chat_id: int, description: str):
     
     cur.close()
     conn.close()
+
+    invalidate_catalog_cache()
     
     user_states.pop(chat_id, None)
     send_telegram_message(chat_id, '✅ Описание обновлено!')
@@ -677,6 +2400,8 @@ def handle_edit_product_price(chat_id: int, price_text: str):
         cur.close()
         conn.close()
         
+        invalidate_catalog_cache()
+        
         user_states.pop(chat_id, None)
         send_telegram_message(chat_id, '✅ Цена обновлена!')
         send_admin_product_details(chat_id, product_id)
@@ -700,12 +2425,100 @@ def handle_edit_product_emoji(chat_id: int, emoji: str):
     
     cur.close()
     conn.close()
+
+    invalidate_catalog_cache()
     
     user_states.pop(chat_id, None)
     send_telegram_message(chat_id, '✅ Эмодзи обновлен!')
     send_admin_product_details(chat_id, product_id)
 
 
+def start_edit_product_stock(chat_id: int, product_id: int):
+    user_states[chat_id] = {'type': 'awaiting_edit_product_stock', 'product_id': product_id}
+    send_telegram_message(chat_id, '📦 Введите остаток товара (число) или «-» для продажи без ограничений:')
+
+
+def handle_edit_product_stock(chat_id: int, stock_text: str):
+    try:
+        stock_text = stock_text.strip()
+        stock = None if stock_text == '-' else int(stock_text.replace(' ', ''))
+        if stock is not None and not 0 <= stock <= PRODUCT_IMPORT_MAX_INT:
+            raise ValueError
+        product_id = user_states[chat_id]['product_id']
+        
+        conn = get_db_connection()
+        cur = conn.cursor()
+        
+        cur.execute('UPDATE products SET stock = %s WHERE id = %s', (stock, product_id))
+        conn.commit()
+        
+        cur.close()
+        conn.close()
+        
+        invalidate_catalog_cache()
+        
+        user_states.pop(chat_id, None)
+        send_telegram_message(chat_id, '✅ Остаток обновлен!')
+        send_admin_product_details(chat_id, product_id)
+    except ValueError:
+        send_telegram_message(chat_id, '❌ Ошибка! Введите неотрицательное число или «-»:')
+
+
+PRODUCT_THUMB_WIDTH = 320
+
+
+def start_edit_product_photo(chat_id: int, product_id: int):
+    user_states[chat_id] = {'type': 'awaiting_edit_product_photo', 'product_id': product_id}
+    send_telegram_message(chat_id, '🖼 Отправьте фото товара (или «-», чтобы удалить фото):')
+
+
+def pick_product_photo_sizes(sizes: List[Dict[str, Any]]) -> Tuple[str, str]:
+    sizes = sorted(sizes, key=lambda size: size['width'])
+    thumb = next((size for size in sizes if size['width'] >= PRODUCT_THUMB_WIDTH), sizes[-1])
+    return sizes[-1]['file_id'], thumb['file_id']
+
+
+def handle_edit_product_photo(chat_id: int, message: Dict[str, Any]):
+    product_id = user_states[chat_id]['product_id']
+    document = message.get('document') or {}
+    
+    if message.get('text', '').strip() == '-':
+        photo_file_id, thumb_file_id = None, None
+    elif message.get('photo'):
+        photo_file_id, thumb_file_id = pick_product_photo_sizes(message['photo'])
+    elif document.get('mime_type', '').startswith('image/'):
+        with open_telegram_file(document['file_id']) as stream:
+            content = stream.read()
+        uploaded = call_telegram_api_multipart(
+            'sendPhoto',
+            {'chat_id': str(chat_id), 'caption': '🖼 Превью фото товара'},
+            'photo',
+            document.get('file_name', 'photo.jpg'),
+            content
+        )
+        photo_file_id, thumb_file_id = pick_product_photo_sizes(uploaded['result']['photo'])
+    else:
+        send_telegram_message(chat_id, '❌ Отправьте изображение или «-»:')
+        return
+    
+    conn = get_db_connection()
+    cur = conn.cursor()
+    
+    cur.execute('''
+        UPDATE products SET photo_file_id = %s, thumb_file_id = %s WHERE id = %s
+    ''', (photo_file_id, thumb_file_id, product_id))
+    conn.commit()
+    
+    cur.close()
+    conn.close()
+    
+    invalidate_catalog_cache()
+    
+    user_states.pop(chat_id, None)
+    send_telegram_message(chat_id, '✅ Фото обновлено!' if photo_file_id else '✅ Фото удалено!')
+    send_admin_product_details(chat_id, product_id)
+
+
 def start_add_admin(chat_id: int):
     user_states[chat_id] = {'type': 'awaiting_admin_username'}
     send_telegram_message(chat_id, '''👥 <b>Добавление админа</b>
@@ -722,9 +2535,11 @@ def handle_add_admin(chat_id: int, text: str):
     cur = conn.cursor(cursor_factory=RealDictCursor)
     
     cur.execute('''
-        SELECT telegram_user_id, telegram_username, customer_name
-        FROM orders
-        WHERE telegram_username = %s
+        SELECT c.telegram_user_id, c.telegram_username, c.first_name, c.last_name,
+               a.id AS admin_id
+        FROM customers c
+        LEFT JOIN admins a ON a.telegram_user_id = c.telegram_user_id
+        WHERE LOWER(c.telegram_username) = LOWER(%s)
         LIMIT 1
     ''', (username,))
     
@@ -733,29 +2548,31 @@ def handle_add_admin(chat_id: int, text: str):
     if not user_info:
         cur.close()
         conn.close()
-        send_telegram_message(chat_id, '❌ Пользователь с таким username не найден в системе.\n\nПопросите пользователя сначала создать хотя бы один заказ.')
+        send_telegram_message(chat_id, '❌ Пользователь с таким username не найден в системе.\n\nПопросите пользователя сначала написать боту /start.')
         user_states.pop(chat_id, None)
         return
     
-    cur.execute('SELECT id FROM admins WHERE telegram_user_id = %s', (user_info['telegram_user_id'],))
-    existing = cur.fetchone()
-    
-    if existing:
+    if user_info['admin_id']:
         cur.close()
         conn.close()
         send_telegram_message(chat_id, '❌ Этот пользователь уже является админом!')
         user_states.pop(chat_id, None)
         return
     
+    full_name = ' '.join(filter(None, [user_info['first_name'], user_info['last_name']])) or username
+    
     cur.execute('''
         INSERT INTO admins (telegram_user_id, telegram_username, full_name)
         VALUES (%s, %s, %s)
-    ''', (user_info['telegram_user_id'], user_info['telegram_username'], user_info['customer_name']))
+        ON CONFLICT (telegram_user_id) DO NOTHING
+    ''', (user_info['telegram_user_id'], user_info['telegram_username'], full_name))
     
     conn.commit()
     cur.close()
     conn.close()
     
+    invalidate_admin_cache()
+    
     user_states.pop(chat_id, None)
     
     send_telegram_message(chat_id, f'''✅ <b>Админ добавлен!</b>
@@ -818,15 +2635,23 @@ def handle_feedback_reply(chat_id: int, reply_text: str):
     send_telegram_message(chat_id, '✅ Ответ успешно отправлен!', reply_markup)
 
 
+CATALOG_GALLERY_SIZE = int(os.environ.get('CATALOG_GALLERY_SIZE', '10'))
+PHOTO_CAPTION_LIMIT = 1024
+
+
 def send_catalog(chat_id: int):
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
-    
-    cur.execute('SELECT id, name, description, price, emoji FROM products ORDER BY id')
-    products = cur.fetchall()
-    
-    cur.close()
-    conn.close()
+    products = get_catalog_products()
+    
+    gallery = [product for product in products if product['thumb_file_id']][:min(CATALOG_GALLERY_SIZE, 10)]
+    if len(gallery) > 1:
+        send_telegram_media_group(chat_id, [
+            {
+                'type': 'photo',
+                'media': product['thumb_file_id'],
+                'caption': f"{product['emoji']} {product['name']} - {product['price']:,} ₽"
+            }
+            for product in gallery
+        ])
     
     text = '📦 <b>Каталог товаров</b>\n\nВыберите товар для заказа:'
     
@@ -875,71 +2700,416 @@ def save_feedback_message(chat_id: int, user: Dict[str, Any], message_text: str)
 
 Используйте кнопки меню для продолжения работы.'''
     
-    send_telegram_message(chat_id, text)
+    send_telegram_message(chat_id, text)
+
+
+def send_my_orders(chat_id: int, user_id: int):
+    conn = get_read_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    
+    cur.execute('''
+        SELECT order_number, product_name, status, created_at, start_date, end_date
+        FROM orders 
+        WHERE telegram_user_id = %s
+        ORDER BY created_at DESC
+        LIMIT 10
+    ''', (user_id,))
+    
+    orders = cur.fetchall()
+    
+    cur.close()
+    conn.close()
+    
+    if not orders:
+        text = '📋 <b>Мои заказы</b>\n\nУ вас пока нет заказов.\nПосмотрите наш каталог! 📦'
+    else:
+        text = '📋 <b>Мои заказы</b>\n\n'
+        
+        for order in orders:
+            emoji = ORDER_STATUS_EMOJI.get(order['status'], '📦')
+            status = ORDER_STATUS_TEXT.get(order['status'], order['status'])
+            text += f"\n{emoji} <b>{order['product_name']}</b>"
+            text += f"\nЗаказ: #{order['order_number']}"
+            text += f"\nСтатус: {status}"
+            
+            if order['end_date']:
+                text += f"\nГотовность: {order['end_date'].strftime('%d.%m.%Y')}"
+            
+            text += '\n'
+    
+    send_telegram_message(chat_id, text)
+
+
+BROADCAST_RATE = float(os.environ.get('BROADCAST_RATE', '25'))
+BROADCAST_CHUNK_SIZE = int(os.environ.get('BROADCAST_CHUNK_SIZE', '25'))
+BROADCAST_TIME_BUDGET = float(os.environ.get('BROADCAST_TIME_BUDGET', '10'))
+BROADCAST_LEASE_SECONDS = 60
+
+BROADCAST_STATUS_TEXT = {
+    'running': '▶️ Идёт',
+    'paused': '⏸ Пауза',
+    'completed': '✅ Завершена'
+}
+
+
+def send_admin_broadcasts(chat_id: int):
+    conn = get_read_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    
+    cur.execute('''
+        SELECT id, message, status, total_count, cursor_position
+        FROM broadcast_campaigns
+        ORDER BY created_at DESC
+        LIMIT 10
+    ''')
+    
+    campaigns = cur.fetchall()
+    cur.close()
+    conn.close()
+    
+    text = '📣 <b>Рассылки</b>\n\n'
+    text += 'Последние рассылки:' if campaigns else 'Рассылок пока не было'
+    
+    inline_keyboard = []
+    for campaign in campaigns:
+        preview = campaign['message'][:20] + '...' if len(campaign['message']) > 20 else campaign['message']
+        status = BROADCAST_STATUS_TEXT.get(campaign['status'], campaign['status'])
+        inline_keyboard.append([{
+            'text': f"{status} {campaign['cursor_position']}/{campaign['total_count']}: {preview}",
+            'callback_data': f"broadcast_view_{campaign['id']}"
+        }])
+    
+    inline_keyboard.append([{'text': '➕ Новая рассылка', 'callback_data': 'broadcast_new'}])
+    inline_keyboard.append([{'text': '🔙 Назад', 'callback_data': 'admin_panel'}])
+    
+    reply_markup = {'inline_keyboard': inline_keyboard}
+    send_telegram_message(chat_id, text, reply_markup)
+
+
+def start_new_broadcast(chat_id: int):
+    user_states[chat_id] = {'type': 'awaiting_broadcast_text'}
+    send_telegram_message(chat_id, '''📣 <b>Новая рассылка</b>
+
+Отправьте текст сообщения для всех клиентов (поддерживается HTML-разметка):''')
+
+
+def handle_broadcast_text(chat_id: int, text: str):
+    user_states[chat_id] = {'type': 'confirming_broadcast', 'message': text}
+    
+    inline_keyboard = [
+        [{'text': '🚀 Отправить всем', 'callback_data': 'broadcast_confirm'}],
+        [{'text': '❌ Отмена', 'callback_data': 'admin_broadcasts'}]
+    ]
+    
+    reply_markup = {'inline_keyboard': inline_keyboard}
+    send_telegram_message(chat_id, f'📣 <b>Предпросмотр рассылки</b>\n\n{text}', reply_markup)
+
+
+def create_broadcast(chat_id: int, user: Dict[str, Any]):
+    state = user_states.get(chat_id, {})
+    if state.get('type') != 'confirming_broadcast':
+        send_admin_broadcasts(chat_id)
+        return
+    user_states.pop(chat_id, None)
+    
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    
+    cur.execute('''
+        INSERT INTO broadcast_campaigns (message, created_by_user_id, progress_chat_id)
+        VALUES (%s, %s, %s)
+        RETURNING id
+    ''', (state['message'], user['id'], chat_id))
+    campaign_id = cur.fetchone()['id']
+    
+    cur.execute('''
+        INSERT INTO broadcast_recipients (campaign_id, seq, telegram_user_id)
+        SELECT %s, ROW_NUMBER() OVER (ORDER BY telegram_user_id), telegram_user_id
+        FROM customers
+    ''', (campaign_id,))
+    total_count = cur.rowcount
+    
+    cur.execute('UPDATE broadcast_campaigns SET total_count = %s WHERE id = %s', (total_count, campaign_id))
+    conn.commit()
+    
+    cur.close()
+    conn.close()
+    
+    progress = send_telegram_message(chat_id, f'📣 Рассылка #{campaign_id} создана, получателей: {total_count}')
+    set_broadcast_progress_message(campaign_id, progress['result']['message_id'])
+    
+    run_broadcast(campaign_id)
+
+
+def set_broadcast_progress_message(campaign_id: int, message_id: int):
+    conn = get_db_connection()
+    cur = conn.cursor()
+    
+    cur.execute('UPDATE broadcast_campaigns SET progress_message_id = %s WHERE id = %s', (message_id, campaign_id))
+    conn.commit()
+    
+    cur.close()
+    conn.close()
+
+
+def format_broadcast_progress(campaign: Dict[str, Any]) -> str:
+    total = campaign['total_count'] or 0
+    done = campaign['cursor_position'] or 0
+    percent = int(done * 100 / total) if total else 100
+    filled = percent // 10
+    
+    return f'''📣 <b>Рассылка #{campaign['id']}</b>
+
+{BROADCAST_STATUS_TEXT.get(campaign['status'], campaign['status'])}
+{'▓' * filled}{'░' * (10 - filled)} {percent}%
+
+📨 Обработано: {done} из {total}
+✅ Доставлено: {campaign['sent_count']}
+🚫 Заблокировали бота: {campaign['blocked_count']}
+⚠️ Ошибки: {campaign['failed_count']}'''
+
+
+def build_broadcast_keyboard(campaign: Dict[str, Any]) -> Dict:
+    inline_keyboard = []
+    if campaign['status'] == 'running':
+        inline_keyboard.append([{'text': '⏸ Пауза', 'callback_data': f"broadcast_pause_{campaign['id']}"}])
+    elif campaign['status'] == 'paused':
+        inline_keyboard.append([{'text': '▶️ Продолжить', 'callback_data': f"broadcast_resume_{campaign['id']}"}])
+    inline_keyboard.append([{'text': '🔄 Обновить', 'callback_data': f"broadcast_view_{campaign['id']}"}])
+    inline_keyboard.append([{'text': '🔙 К рассылкам', 'callback_data': 'admin_broadcasts'}])
+    return {'inline_keyboard': inline_keyboard}
+
+
+def get_broadcast_campaign(campaign_id: int) -> Optional[Dict[str, Any]]:
+    conn = get_read_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    
+    cur.execute('''
+        SELECT id, message, status, total_count, cursor_position, sent_count,
+               blocked_count, failed_count, progress_chat_id, progress_message_id
+        FROM broadcast_campaigns
+        WHERE id = %s
+    ''', (campaign_id,))
+    campaign = cur.fetchone()
+    
+    cur.close()
+    conn.close()
+    
+    return campaign
+
+
+def send_broadcast_details(chat_id: int, campaign_id: int):
+    campaign = get_broadcast_campaign(campaign_id)
+    
+    if not campaign:
+        send_telegram_message(chat_id, '❌ Рассылка не найдена')
+        return
+    
+    send_telegram_message(chat_id, format_broadcast_progress(campaign), build_broadcast_keyboard(campaign))
+
+
+def update_broadcast_progress(campaign: Dict[str, Any]):
+    if not campaign['progress_chat_id'] or not campaign['progress_message_id']:
+        return
+    
+    try:
+        edit_telegram_message(
+            campaign['progress_chat_id'],
+            campaign['progress_message_id'],
+            format_broadcast_progress(campaign),
+            build_broadcast_keyboard(campaign)
+        )
+    except Exception:
+        pass
+
+
+def set_broadcast_status(chat_id: int, campaign_id: int, status: str):
+    conn = get_db_connection()
+    cur = conn.cursor()
+    
+    cur.execute('''
+        UPDATE broadcast_campaigns
+        SET status = %s, progress_chat_id = %s, progress_message_id = NULL, updated_at = NOW()
+        WHERE id = %s AND status IN ('running', 'paused')
+    ''', (status, chat_id, campaign_id))
+    conn.commit()
+    
+    cur.close()
+    conn.close()
+    
+    if status == 'running':
+        progress = send_telegram_message(chat_id, f'▶️ Рассылка #{campaign_id} продолжается')
+        set_broadcast_progress_message(campaign_id, progress['result']['message_id'])
+        run_broadcast(campaign_id)
+    else:
+        send_broadcast_details(chat_id, campaign_id)
+
+
+def run_broadcast(campaign_id: int, time_budget: Optional[float] = None):
+    started = time.time()
+    time_budget = time_budget or BROADCAST_TIME_BUDGET
+    
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    
+    cur.execute('''
+        UPDATE broadcast_campaigns
+        SET locked_until = NOW() + make_interval(secs => %s), updated_at = NOW()
+        WHERE id = %s AND status = 'running'
+          AND (locked_until IS NULL OR locked_until < NOW())
+        RETURNING id, message, cursor_position
+    ''', (BROADCAST_LEASE_SECONDS, campaign_id))
+    lease = cur.fetchone()
+    conn.commit()
+    
+    if not lease:
+        cur.close()
+        conn.close()
+        return
+    
+    cursor_position = lease['cursor_position']
+    campaign = None
+    
+    while time.time() - started < time_budget:
+        cur.execute('''
+            SELECT seq, telegram_user_id
+            FROM broadcast_recipients
+            WHERE campaign_id = %s AND seq > %s
+            ORDER BY seq
+            LIMIT %s
+        ''', (campaign_id, cursor_position, BROADCAST_CHUNK_SIZE))
+        recipients = cur.fetchall()
+        
+        if not recipients:
+            cur.execute('''
+                UPDATE broadcast_campaigns
+                SET status = 'completed', finished_at = NOW(), updated_at = NOW()
+                WHERE id = %s AND status = 'running'
+            ''', (campaign_id,))
+            conn.commit()
+            break
+        
+        outcomes = send_telegram_messages_batch(
+            [(recipient['telegram_user_id'], lease['message']) for recipient in recipients],
+            BROADCAST_RATE
+        )
+        
+        cur.execute('''
+            UPDATE broadcast_recipients r
+            SET status = v.status, error = v.error, sent_at = NOW()
+            FROM unnest(%s::int[], %s::varchar[], %s::text[]) AS v(seq, status, error)
+            WHERE r.campaign_id = %s AND r.seq = v.seq
+        ''', (
+            [recipient['seq'] for recipient in recipients],
+            [status for status, _ in outcomes],
+            [error for _, error in outcomes],
+            campaign_id
+        ))
+        
+        cursor_position = recipients[-1]['seq']
+        cur.execute('''
+            UPDATE broadcast_campaigns
+            SET cursor_position = %s,
+                sent_count = sent_count + %s,
+                blocked_count = blocked_count + %s,
+                failed_count = failed_count + %s,
+                locked_until = NOW() + make_interval(secs => %s),
+                updated_at = NOW()
+            WHERE id = %s
+            RETURNING id, status, total_count, cursor_position, sent_count,
+                      blocked_count, failed_count, progress_chat_id, progress_message_id
+        ''', (
+            cursor_position,
+            sum(1 for status, _ in outcomes if status == 'sent'),
+            sum(1 for status, _ in outcomes if status == 'blocked'),
+            sum(1 for status, _ in outcomes if status == 'failed'),
+            BROADCAST_LEASE_SECONDS,
+            campaign_id
+        ))
+        campaign = cur.fetchone()
+        conn.commit()
+        
+        update_broadcast_progress(campaign)
+        
+        if campaign['status'] != 'running':
+            break
+    
+    cur.execute('''
+        UPDATE broadcast_campaigns
+        SET locked_until = NULL
+        WHERE id = %s
+        RETURNING id, status, total_count, cursor_position, sent_count,
+                  blocked_count, failed_count, progress_chat_id, progress_message_id
+    ''', (campaign_id,))
+    campaign = cur.fetchone()
+    conn.commit()
+    
+    cur.close()
+    conn.close()
+    
+    update_broadcast_progress(campaign)
 
 
-def send_my_orders(chat_id: int, user_id: int):
+def run_pending_broadcasts(time_budget: float) -> Dict[str, Any]:
+    started = time.time()
+    
     conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
+    cur = conn.cursor()
     
     cur.execute('''
-        SELECT order_number, product_name, status, created_at, start_date, end_date
-        FROM orders 
-        WHERE telegram_user_id = %s
-        ORDER BY created_at DESC
-        LIMIT 10
-    ''', (user_id,))
-    
-    orders = cur.fetchall()
+        SELECT id FROM broadcast_campaigns
+        WHERE status = 'running' AND (locked_until IS NULL OR locked_until < NOW())
+        ORDER BY id
+    ''')
+    campaign_ids = [row[0] for row in cur.fetchall()]
     
     cur.close()
     conn.close()
     
-    if not orders:
-        text = '📋 <b>Мои заказы</b>\n\nУ вас пока нет заказов.\nПосмотрите наш каталог! 📦'
-    else:
-        text = '📋 <b>Мои заказы</b>\n\n'
-        
-        status_emoji = {
-            'pending': '⏳',
-            'accepted': '💳',
-            'processing': '⚙️',
-            'completed': '✅',
-            'cancelled': '❌'
-        }
-        
-        status_text = {
-            'pending': 'Ожидание принятия',
-            'accepted': 'Заказ принят',
-            'processing': 'Выполняется',
-            'completed': 'Выполнено',
-            'cancelled': 'Отменено'
-        }
-        
-        for order in orders:
-            emoji = status_emoji.get(order['status'], '📦')
-            status = status_text.get(order['status'], order['status'])
-            text += f"\n{emoji} <b>{order['product_name']}</b>"
-            text += f"\nЗаказ: #{order['order_number']}"
-            text += f"\nСтатус: {status}"
-            
-            if order['end_date']:
-                text += f"\nГотовность: {order['end_date'].strftime('%d.%m.%Y')}"
-            
-            text += '\n'
+    for campaign_id in campaign_ids:
+        remaining = time_budget - (time.time() - started)
+        if remaining <= 0:
+            break
+        run_broadcast(campaign_id, remaining)
     
-    send_telegram_message(chat_id, text)
+    return {'campaigns': campaign_ids}
 
 
 def process_callback(callback_query: Dict[str, Any]):
     chat_id = callback_query['message']['chat']['id']
+    current_chat['id'] = chat_id
+    message_id = callback_query['message']['message_id']
     callback_data = callback_query['data']
     user = callback_query['from']
     
     if callback_data == 'admin_panel' and is_admin(user):
         send_admin_panel(chat_id)
     elif callback_data == 'admin_orders' and is_admin(user):
+        user_states.pop(chat_id, None)
         send_admin_orders(chat_id)
+    elif callback_data == 'admin_orders_export' and is_admin(user):
+        start_orders_export(chat_id)
+    elif callback_data == 'admin_orders_search' and is_admin(user):
+        start_order_search(chat_id)
+    elif callback_data.startswith('admin_orders_search_') and is_admin(user):
+        page = int(callback_data[len('admin_orders_search_'):])
+        if user_states.get(chat_id, {}).get('query'):
+            send_order_search_results(chat_id, page=page)
+        else:
+            start_order_search(chat_id)
+    elif callback_data == 'bulk_orders' and is_admin(user):
+        send_bulk_orders_filter(chat_id)
+    elif callback_data.startswith('bulk_orders_') and is_admin(user):
+        start_bulk_order_selection(chat_id, callback_data[len('bulk_orders_'):])
+    elif callback_data.startswith('bulk_toggle_') and is_admin(user):
+        order_id = int(callback_data.split('_')[2])
+        toggle_bulk_order_selection(chat_id, message_id, order_id=order_id)
+    elif callback_data == 'bulk_select_all' and is_admin(user):
+        toggle_bulk_order_selection(chat_id, message_id, select_all=True)
+    elif callback_data == 'bulk_select_none' and is_admin(user):
+        toggle_bulk_order_selection(chat_id, message_id, select_all=False)
+    elif callback_data.startswith('bulk_apply_') and is_admin(user):
+        apply_bulk_order_status(chat_id, callback_data[len('bulk_apply_'):])
     elif callback_data.startswith('admin_order_') and is_admin(user):
         order_id = int(callback_data.split('_')[2])
         send_admin_order_details(chat_id, order_id)
@@ -953,11 +3123,15 @@ def process_callback(callback_query: Dict[str, Any]):
         start_feedback_reply(chat_id, message_id)
     elif callback_data == 'admin_products' and is_admin(user):
         send_admin_products(chat_id)
+    elif callback_data == 'admin_products_import' and is_admin(user):
+        start_products_import(chat_id)
+    elif callback_data == 'admin_products_export' and is_admin(user):
+        export_products(chat_id)
+    elif callback_data == 'admin_product_add' and is_admin(user):
+        start_add_product(chat_id)
     elif callback_data.startswith('admin_product_') and is_admin(user):
         product_id = int(callback_data.split('_')[2])
         send_admin_product_details(chat_id, product_id)
-    elif callback_data == 'admin_product_add' and is_admin(user):
-        start_add_product(chat_id)
     elif callback_data.startswith('product_edit_') and is_admin(user):
         product_id = int(callback_data.split('_')[2])
         send_product_edit_menu(chat_id, product_id)
@@ -973,16 +3147,22 @@ def process_callback(callback_query: Dict[str, Any]):
     elif callback_data.startswith('edit_product_emoji_') and is_admin(user):
         product_id = int(callback_data.split('_')[3])
         start_edit_product_emoji(chat_id, product_id)
+    elif callback_data.startswith('edit_product_stock_') and is_admin(user):
+        product_id = int(callback_data.split('_')[3])
+        start_edit_product_stock(chat_id, product_id)
+    elif callback_data.startswith('edit_product_photo_') and is_admin(user):
+        product_id = int(callback_data.split('_')[3])
+        start_edit_product_photo(chat_id, product_id)
     elif callback_data.startswith('product_delete_confirm_') and is_admin(user):
         product_id = int(callback_data.split('_')[3])
         delete_product(chat_id, product_id)
     elif callback_data == 'admin_admins' and is_admin(user):
         send_admin_admins(chat_id)
+    elif callback_data == 'admin_admin_add' and is_admin(user):
+        start_add_admin(chat_id)
     elif callback_data.startswith('admin_admin_') and is_admin(user):
         admin_id = int(callback_data.split('_')[2])
         send_admin_admin_details(chat_id, admin_id)
-    elif callback_data == 'admin_admin_add' and is_admin(user):
-        start_add_admin(chat_id)
     elif callback_data.startswith('admin_delete_') and is_admin(user):
         admin_id = int(callback_data.split('_')[2])
         delete_admin(chat_id, admin_id)
@@ -1001,8 +3181,42 @@ def process_callback(callback_query: Dict[str, Any]):
     elif callback_data.startswith('order_delete_') and is_admin(user):
         order_id = int(callback_data.split('_')[2])
         delete_order(chat_id, order_id)
+    elif callback_data == 'admin_broadcasts' and is_admin(user):
+        user_states.pop(chat_id, None)
+        send_admin_broadcasts(chat_id)
+    elif callback_data == 'broadcast_new' and is_admin(user):
+        start_new_broadcast(chat_id)
+    elif callback_data == 'broadcast_confirm' and is_admin(user):
+        create_broadcast(chat_id, user)
+    elif callback_data.startswith('broadcast_view_') and is_admin(user):
+        campaign_id = int(callback_data.split('_')[2])
+        send_broadcast_details(chat_id, campaign_id)
+    elif callback_data.startswith('broadcast_pause_') and is_admin(user):
+        campaign_id = int(callback_data.split('_')[2])
+        set_broadcast_status(chat_id, campaign_id, 'paused')
+    elif callback_data.startswith('broadcast_resume_') and is_admin(user):
+        campaign_id = int(callback_data.split('_')[2])
+        set_broadcast_status(chat_id, campaign_id, 'running')
     elif callback_data == 'admin_back' and is_admin(user):
         send_welcome(chat_id, user)
+    elif callback_data.startswith('cart_add_'):
+        product_id = int(callback_data.split('_')[2])
+        add_to_cart(chat_id, user['id'], product_id)
+    elif callback_data.startswith('cart_inc_'):
+        product_id = int(callback_data.split('_')[2])
+        change_cart_quantity(chat_id, message_id, user['id'], product_id, 1)
+    elif callback_data.startswith('cart_dec_'):
+        product_id = int(callback_data.split('_')[2])
+        change_cart_quantity(chat_id, message_id, user['id'], product_id, -1)
+    elif callback_data.startswith('cart_del_'):
+        product_id = int(callback_data.split('_')[2])
+        change_cart_quantity(chat_id, message_id, user['id'], product_id, None)
+    elif callback_data == 'cart_clear':
+        clear_cart(chat_id, message_id, user['id'])
+    elif callback_data == 'cart_view':
+        send_cart(chat_id, user['id'])
+    elif callback_data == 'cart_checkout':
+        checkout_cart(chat_id, user)
     elif callback_data == 'back_to_catalog':
         send_catalog(chat_id)
     elif callback_data.startswith('product_'):
@@ -1011,162 +3225,1105 @@ def process_callback(callback_query: Dict[str, Any]):
     elif callback_data.startswith('order_'):
         product_id = int(callback_data.split('_')[1])
         create_order(chat_id, product_id, user)
+    elif callback_data.startswith('pay_'):
+        product_id = int(callback_data.split('_')[1])
+        send_product_invoice(chat_id, product_id)
+
+
+def update_order_status(chat_id: int, order_id: int, new_status: str):
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    
+    cur.execute('''
+        WITH previous AS (
+            SELECT id, status FROM orders WHERE id = %s FOR UPDATE
+        ), changed AS (
+            UPDATE orders o
+            SET status = %s
+            FROM previous
+            WHERE o.id = previous.id AND previous.status = ANY(%s)
+            RETURNING o.id, o.telegram_user_id, o.order_number, previous.status AS old_status
+        ), history AS (
+            INSERT INTO order_status_history (order_id, old_status, new_status, changed_by_user_id)
+            SELECT id, old_status, %s, %s FROM changed
+        )
+        SELECT previous.status AS current_status, changed.telegram_user_id, changed.order_number
+        FROM previous LEFT JOIN changed ON changed.id = previous.id
+    ''', (order_id, new_status, order_status_sources(new_status), new_status, chat_id))
+    order = cur.fetchone()
+    
+    if order and order['order_number'] and new_status == 'cancelled':
+        release_order_stock(cur, [order_id])
+    conn.commit()
+    
+    cur.close()
+    conn.close()
+    
+    status_label = ORDER_STATUS_TEXT.get(new_status, new_status)
+    
+    if not order:
+        send_telegram_message(chat_id, '❌ Заказ не найден')
+        return
+    
+    if not order['order_number']:
+        current_label = ORDER_STATUS_TEXT.get(order['current_status'], order['current_status'])
+        if order['current_status'] == new_status:
+            send_telegram_message(chat_id, f'⚠️ Заказ уже в статусе «{current_label}» — его только что изменил другой администратор')
+        else:
+            send_telegram_message(chat_id, f'⚠️ Нельзя сменить статус «{current_label}» на «{status_label}»')
+        send_admin_order_details(chat_id, order_id)
+        return
+    
+    notification = f'''📦 <b>Статус заказа изменен</b>
+
+Заказ #{order['order_number']}
+Новый статус: {status_label}'''
+    
+    send_telegram_message(order['telegram_user_id'], notification)
+    send_telegram_message(chat_id, f'✅ Статус заказа обновлен на: {status_label}')
+    send_admin_order_details(chat_id, order_id)
+
+
+def delete_order(chat_id: int, order_id: int):
+    conn = get_db_connection()
+    cur = conn.cursor()
+    
+    cur.execute('SELECT status FROM orders WHERE id = %s FOR UPDATE', (order_id,))
+    order = cur.fetchone()
+    if order and order[0] not in ('cancelled', 'completed'):
+        release_order_stock(cur, [order_id])
+    
+    cur.execute('DELETE FROM orders WHERE id = %s', (order_id,))
+    conn.commit()
+    
+    cur.close()
+    conn.close()
+    
+    send_telegram_message(chat_id, '✅ Заказ удален!')
+    send_admin_orders(chat_id)
+
+
+def delete_product(chat_id: int, product_id: int):
+    conn = get_db_connection()
+    cur = conn.cursor()
+    
+    cur.execute('DELETE FROM products WHERE id = %s', (product_id,))
+    conn.commit()
+    
+    cur.close()
+    conn.close()
+    
+    invalidate_catalog_cache()
+    
+    send_telegram_message(chat_id, '✅ Товар удален!')
+    send_admin_products(chat_id)
+
+
+def delete_admin(chat_id: int, admin_id: int):
+    conn = get_db_connection()
+    cur = conn.cursor()
+    
+    cur.execute('DELETE FROM admins WHERE id = %s', (admin_id,))
+    conn.commit()
+    
+    cur.close()
+    conn.close()
+    
+    invalidate_admin_cache()
+    
+    send_telegram_message(chat_id, '✅ Админ удален!')
+    send_admin_admins(chat_id)
+
+
+def show_product_details(chat_id: int, product_id: int, user: Dict[str, Any]):
+    product = get_catalog_product(product_id)
+    
+    if not product:
+        send_telegram_message(chat_id, '❌ Товар не найден')
+        return
+    
+    text = f'''{product['emoji']} <b>{product['name']}</b>
+
+📝 {product['description']}
+
+💰 <b>Цена:</b> {product['price']:,} ₽'''
+    
+    if product['stock'] == 0:
+        text += '\n\n🚫 Нет в наличии'
+        inline_keyboard = [[{'text': '🔙 К каталогу', 'callback_data': 'back_to_catalog'}]]
+    else:
+        inline_keyboard = [
+            [
+                {'text': '➕ В корзину', 'callback_data': f"cart_add_{product_id}"},
+                {'text': '⚡ Купить сейчас', 'callback_data': f"order_{product_id}"}
+            ],
+            [{'text': '🛒 Корзина', 'callback_data': 'cart_view'}],
+            [{'text': '🔙 К каталогу', 'callback_data': 'back_to_catalog'}]
+        ]
+        if current_shop['payment_token']:
+            inline_keyboard.insert(1, [{'text': '💳 Оплатить онлайн', 'callback_data': f"pay_{product_id}"}])
+    
+    reply_markup = {'inline_keyboard': inline_keyboard}
+    
+    if product['photo_file_id'] and len(text) <= PHOTO_CAPTION_LIMIT:
+        import urllib.error
+        try:
+            send_telegram_photo(chat_id, product['photo_file_id'], text, reply_markup)
+            return
+        except urllib.error.HTTPError as e:
+            if e.code != 400:
+                raise
+    
+    send_telegram_message(chat_id, text, reply_markup)
+
+
+CART_MAX_QUANTITY = 99
+
+
+def get_cart_items(cur, user_id: int) -> List[Dict[str, Any]]:
+    cur.execute('''
+        SELECT c.product_id, c.quantity, p.name, p.price, p.emoji, p.stock
+        FROM cart_items c
+        JOIN products p ON p.id = c.product_id
+        WHERE c.telegram_user_id = %s
+        ORDER BY c.added_at
+    ''', (user_id,))
+    return cur.fetchall()
+
+
+def render_cart(items: List[Dict[str, Any]]) -> Tuple[str, Dict]:
+    if not items:
+        text = '🛒 <b>Корзина</b>\n\nВ корзине пока пусто.\nДобавьте товары из каталога! 📦'
+        inline_keyboard = [[{'text': '📦 Каталог', 'callback_data': 'back_to_catalog'}]]
+        return text, {'inline_keyboard': inline_keyboard}
+    
+    text = '🛒 <b>Корзина</b>\n'
+    total = 0
+    inline_keyboard = []
+    
+    for item in items:
+        line_total = item['price'] * item['quantity']
+        total += line_total
+        text += f"\n{item['emoji']} {item['name']}\n{item['quantity']} × {item['price']:,} ₽ = {line_total:,} ₽\n"
+        inline_keyboard.append([
+            {'text': '➖', 'callback_data': f"cart_dec_{item['product_id']}"},
+            {'text': f"{item['emoji']} {item['quantity']} шт.", 'callback_data': f"product_{item['product_id']}"},
+            {'text': '➕', 'callback_data': f"cart_inc_{item['product_id']}"},
+            {'text': '🗑️', 'callback_data': f"cart_del_{item['product_id']}"}
+        ])
+    
+    text += f'\n💰 <b>Итого:</b> {total:,} ₽'
+    
+    inline_keyboard.append([{'text': '✅ Оформить заказ', 'callback_data': 'cart_checkout'}])
+    inline_keyboard.append([
+        {'text': '🧹 Очистить', 'callback_data': 'cart_clear'},
+        {'text': '📦 Каталог', 'callback_data': 'back_to_catalog'}
+    ])
+    return text, {'inline_keyboard': inline_keyboard}
+
+
+def send_cart(chat_id: int, user_id: int, message_id: Optional[int] = None):
+    conn = get_read_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    
+    items = get_cart_items(cur, user_id)
+    
+    cur.close()
+    conn.close()
+    
+    text, reply_markup = render_cart(items)
+    
+    if message_id:
+        edit_telegram_message(chat_id, message_id, text, reply_markup)
+    else:
+        send_telegram_message(chat_id, text, reply_markup)
+
+
+def add_to_cart(chat_id: int, user_id: int, product_id: int):
+    conn = get_db_connection()
+    cur = conn.cursor()
+    
+    cur.execute('''
+        INSERT INTO cart_items (telegram_user_id, product_id, quantity)
+        SELECT %s, id, 1 FROM products WHERE id = %s
+        ON CONFLICT (telegram_user_id, product_id) DO UPDATE
+        SET quantity = LEAST(cart_items.quantity + 1, %s)
+        RETURNING quantity
+    ''', (user_id, product_id, CART_MAX_QUANTITY))
+    added = cur.fetchone()
+    conn.commit()
+    
+    cur.close()
+    conn.close()
+    
+    if not added:
+        send_telegram_message(chat_id, '❌ Товар не найден')
+        return
+    
+    inline_keyboard = [
+        [{'text': '🛒 Перейти в корзину', 'callback_data': 'cart_view'}],
+        [{'text': '📦 Продолжить покупки', 'callback_data': 'back_to_catalog'}]
+    ]
+    reply_markup = {'inline_keyboard': inline_keyboard}
+    send_telegram_message(chat_id, f'✅ Добавлено в корзину (в корзине: {added[0]} шт.)', reply_markup)
+
+
+def change_cart_quantity(chat_id: int, message_id: int, user_id: int, product_id: int, delta: Optional[int]):
+    conn = get_db_connection()
+    cur = conn.cursor()
+    
+    if delta is None or delta < 0:
+        cur.execute('''
+            DELETE FROM cart_items
+            WHERE telegram_user_id = %s AND product_id = %s AND (%s OR quantity <= 1)
+        ''', (user_id, product_id, delta is None))
+    
+    if delta is not None and cur.rowcount <= 0:
+        cur.execute('''
+            UPDATE cart_items
+            SET quantity = LEAST(GREATEST(quantity + %s, 1), %s)
+            WHERE telegram_user_id = %s AND product_id = %s
+        ''', (delta, CART_MAX_QUANTITY, user_id, product_id))
+    
+    conn.commit()
+    cur.close()
+    conn.close()
+    
+    send_cart(chat_id, user_id, message_id)
+
+
+def clear_cart(chat_id: int, message_id: int, user_id: int):
+    conn = get_db_connection()
+    cur = conn.cursor()
+    
+    cur.execute('DELETE FROM cart_items WHERE telegram_user_id = %s', (user_id,))
+    conn.commit()
+    
+    cur.close()
+    conn.close()
+    
+    send_cart(chat_id, user_id, message_id)
+
+
+def reserve_stock(cur, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    shortages = []
+    
+    for item in sorted(items, key=lambda item: item['product_id']):
+        if item['stock'] is None:
+            continue
+        
+        cur.execute('''
+            UPDATE products
+            SET stock = stock - %s
+            WHERE id = %s AND stock >= %s
+        ''', (item['quantity'], item['product_id'], item['quantity']))
+        
+        if cur.rowcount == 0:
+            shortages.append(item)
+    
+    return shortages
+
+
+def release_order_stock(cur, order_ids: List[int]):
+    if not order_ids:
+        return
+    
+    cur.execute('''
+        UPDATE products p
+        SET stock = p.stock + released.quantity
+        FROM (
+            SELECT product_id, SUM(quantity) AS quantity
+            FROM order_items
+            WHERE order_id = ANY(%s)
+            GROUP BY product_id
+        ) released
+        WHERE p.id = released.product_id AND p.stock IS NOT NULL
+    ''', (order_ids,))
+
+
+def generate_order_number() -> str:
+    import secrets
+    return f"ORD-{int(time.time() * 1000)}{secrets.randbelow(100):02d}"
+
+
+def place_order(cur, user: Dict[str, Any], items: List[Dict[str, Any]], order_number: Optional[str] = None,
+                payment: Optional[Dict[str, Any]] = None) -> Tuple[Optional[Dict[str, Any]], List[Dict[str, Any]]]:
+    shortages = reserve_stock(cur, items)
+    if shortages:
+        return None, shortages
+    
+    order_number = order_number or generate_order_number()
+    customer_name = user.get('first_name', 'Клиент')
+    username = user.get('username', '')
+    total_amount = sum(item['price'] * item['quantity'] for item in items)
+    
+    product_name = ', '.join(
+        f"{item['name']} ×{item['quantity']}" if item['quantity'] > 1 else item['name']
+        for item in items
+    )
+    if len(product_name) > 255:
+        product_name = product_name[:252] + '...'
+    
+    start_date = datetime.now()
+    end_date = start_date + timedelta(days=7)
+    
+    cur.execute('''
+        INSERT INTO orders 
+        (order_number, telegram_user_id, telegram_username, customer_name, 
+         product_name, total_amount, status, start_date, end_date,
+         telegram_payment_charge_id, provider_payment_charge_id, paid_at)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        RETURNING id
+    ''', (order_number, user['id'], username, customer_name, 
+          product_name, total_amount, 'accepted' if payment else 'pending', start_date, end_date,
+          payment['telegram_payment_charge_id'] if payment else None,
+          payment['provider_payment_charge_id'] if payment else None,
+          start_date if payment else None))
+    order_id = cur.fetchone()['id']
+    
+    from psycopg2.extras import execute_values
+    execute_values(cur, '''
+        INSERT INTO order_items (order_id, product_id, product_name, price, quantity)
+        VALUES %s
+    ''', [(order_id, item['product_id'], item['name'], item['price'], item['quantity']) for item in items])
+    
+    return {
+        'id': order_id,
+        'order_number': order_number,
+        'customer_name': customer_name,
+        'username': username,
+        'total_amount': total_amount,
+        'items': items,
+        'paid': payment is not None
+    }, []
+
+
+def send_order_confirmation(chat_id: int, order: Dict[str, Any]):
+    lines = '\n'.join(
+        f"📦 {item['name']} × {item['quantity']} — {item['price'] * item['quantity']:,} ₽"
+        for item in order['items']
+    )
+    
+    text = f'''✅ <b>Заказ оформлен!</b>
+
+{lines}
+💰 Итого: {order['total_amount']:,} ₽{' — 💳 оплачено' if order.get('paid') else ''}
+📋 Номер заказа: #{order['order_number']}
+
+Мы свяжемся с вами в ближайшее время для подтверждения.
+Отслеживайте статус в разделе "Мои заказы".'''
+    
+    send_telegram_message(chat_id, text)
+    
+    admin_notification = f'''🔔 <b>Получен новый заказ!</b>
+
+📋 Номер: #{order['order_number']}
+👤 Клиент: {order['customer_name']} (@{order['username'] or 'нет username'})
+{lines}
+💰 Сумма: {order['total_amount']:,} ₽{' — 💳 оплачено' if order.get('paid') else ''}
+
+Откройте /admin для управления заказом.'''
+    
+    notify_admins(admin_notification)
+
+
+def send_stock_shortages(chat_id: int, shortages: List[Dict[str, Any]]):
+    lines = '\n'.join(f"{item['emoji']} {item['name']}" for item in shortages)
+    
+    inline_keyboard = [[{'text': '🛒 Корзина', 'callback_data': 'cart_view'}]]
+    reply_markup = {'inline_keyboard': inline_keyboard}
+    send_telegram_message(chat_id, f'''😔 <b>Недостаточно товара на складе</b>
+
+{lines}
 
+Уменьшите количество или выберите другие товары.''', reply_markup)
 
-def update_order_status(chat_id: int, order_id: int, new_status: str):
+
+def checkout_cart(chat_id: int, user: Dict[str, Any]):
     conn = get_db_connection()
     cur = conn.cursor(cursor_factory=RealDictCursor)
     
-    cur.execute('SELECT telegram_user_id, order_number FROM orders WHERE id = %s', (order_id,))
-    order = cur.fetchone()
+    items = get_cart_items(cur, user['id'])
+    if not items:
+        cur.close()
+        conn.close()
+        send_cart(chat_id, user['id'])
+        return
+    
+    order, shortages = place_order(cur, user, items)
     
     if order:
-        cur.execute('UPDATE orders SET status = %s WHERE id = %s', (new_status, order_id))
+        cur.execute('DELETE FROM cart_items WHERE telegram_user_id = %s', (user['id'],))
         conn.commit()
-        
-        status_text = {
-            'pending': 'Ожидание принятия',
-            'accepted': 'Заказ принят',
-            'processing': 'Выполняется',
-            'completed': 'Выполнено',
-            'cancelled': 'Отменено'
-        }
-        
-        notification = f'''📦 <b>Статус заказа изменен</b>
-
-Заказ #{order['order_number']}
-Новый статус: {status_text.get(new_status, new_status)}'''
-        
-        send_telegram_message(order['telegram_user_id'], notification)
-        send_telegram_message(chat_id, f'✅ Статус заказа обновлен на: {status_text.get(new_status, new_status)}')
-        send_admin_order_details(chat_id, order_id)
+    else:
+        conn.rollback()
     
     cur.close()
     conn.close()
+    
+    if order:
+        send_order_confirmation(chat_id, order)
+    else:
+        send_stock_shortages(chat_id, shortages)
 
 
-def delete_order(chat_id: int, order_id: int):
-    conn = get_db_connection()
-    cur = conn.cursor()
+def create_order(chat_id: int, product_id: int, user: Dict[str, Any]):
+    try:
+        conn = get_db_connection()
+    except DatabaseUnavailable:
+        spool_order(chat_id, product_id, user)
+        return
+    cur = conn.cursor(cursor_factory=RealDictCursor)
     
-    cur.execute('DELETE FROM orders WHERE id = %s', (order_id,))
-    conn.commit()
+    cur.execute('''
+        SELECT id AS product_id, 1 AS quantity, name, price, emoji, stock
+        FROM products
+        WHERE id = %s
+    ''', (product_id,))
+    product = cur.fetchone()
+    
+    if not product:
+        send_telegram_message(chat_id, '❌ Товар не найден')
+        cur.close()
+        conn.close()
+        return
+    
+    order, shortages = place_order(cur, user, [product])
+    
+    if order:
+        conn.commit()
+    else:
+        conn.rollback()
     
     cur.close()
     conn.close()
     
-    send_telegram_message(chat_id, '✅ Заказ удален!')
-    send_admin_orders(chat_id)
+    if order:
+        send_order_confirmation(chat_id, order)
+    else:
+        send_stock_shortages(chat_id, shortages)
 
 
-def delete_product(chat_id: int, product_id: int):
+PAYMENT_CURRENCY = os.environ.get('PAYMENT_CURRENCY', 'RUB')
+PRE_CHECKOUT_STATEMENT_TIMEOUT_MS = 2000
+
+pre_checkout_state = ShopScoped(lambda: {'conn': None})
+
+
+def send_product_invoice(chat_id: int, product_id: int):
+    product = get_catalog_product(product_id)
+    if not product or not current_shop['payment_token']:
+        send_telegram_message(chat_id, '❌ Товар не найден')
+        return
+    if product['stock'] == 0:
+        send_telegram_message(chat_id, f"🚫 {product['name']} — нет в наличии")
+        return
+    
+    call_telegram_api('sendInvoice', {
+        'chat_id': chat_id,
+        'title': product['name'][:32],
+        'description': (product['description'] or product['name'])[:255],
+        'payload': f"product:{product_id}:{product['price']}",
+        'provider_token': current_shop['payment_token'],
+        'currency': PAYMENT_CURRENCY,
+        'prices': json.dumps([{'label': product['name'][:32], 'amount': product['price'] * 100}])
+    })
+
+
+def parse_invoice_payload(payload: str) -> Optional[Tuple[int, int]]:
+    parts = payload.split(':')
+    if len(parts) != 3 or parts[0] != 'product' or not parts[1].isdigit() or not parts[2].isdigit():
+        return None
+    return int(parts[1]), int(parts[2])
+
+
+def check_product_stock(product_id: int, price: int) -> bool:
+    for attempt in range(2):
+        conn = pre_checkout_state['conn']
+        try:
+            if conn is None or conn.closed:
+                conn = connect_database(os.environ.get('DATABASE_URL'))
+                conn.autocommit = True
+                cur = conn.cursor()
+                cur.execute('SET statement_timeout = %s', (PRE_CHECKOUT_STATEMENT_TIMEOUT_MS,))
+                cur.close()
+                pre_checkout_state['conn'] = conn
+            
+            cur = conn.cursor()
+            cur.execute('SELECT stock IS NULL OR stock > 0 FROM products WHERE id = %s AND price = %s', (product_id, price))
+            row = cur.fetchone()
+            cur.close()
+            return bool(row and row[0])
+        except DatabaseUnavailable:
+            raise
+        except psycopg2.OperationalError:
+            if conn is not None and not conn.closed:
+                conn.close()
+            pre_checkout_state['conn'] = None
+            if attempt:
+                raise
+    return False
+
+
+def answer_pre_checkout_query(query: Dict[str, Any]):
+    parsed = parse_invoice_payload(query.get('invoice_payload', ''))
+    cached_products = catalog_cache['products'] or []
+    product = next((item for item in cached_products if parsed and item['id'] == parsed[0]), None)
+    error = None
+    
+    if not parsed or query.get('currency') != PAYMENT_CURRENCY or query.get('total_amount') != parsed[1] * 100:
+        error = 'Счёт устарел. Откройте товар в каталоге и оплатите заново.'
+    elif product is not None and product['price'] != parsed[1]:
+        error = 'Цена товара изменилась. Откройте товар в каталоге и оплатите заново.'
+    else:
+        try:
+            if not check_product_stock(*parsed):
+                error = 'Товар закончился или его цена изменилась.'
+        except psycopg2.OperationalError:
+            error = 'Сервис временно недоступен. Попробуйте через минуту.'
+    
+    data = {'pre_checkout_query_id': query['id'], 'ok': 'false' if error else 'true'}
+    if error:
+        data['error_message'] = error
+    call_telegram_api('answerPreCheckoutQuery', data)
+
+
+def handle_successful_payment(chat_id: int, user: Dict[str, Any], payment: Dict[str, Any]):
+    parsed = parse_invoice_payload(payment.get('invoice_payload', ''))
+    total = f"{payment['total_amount'] / 100:,.2f} {payment['currency']}"
+    
     conn = get_db_connection()
-    cur = conn.cursor()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
     
-    cur.execute('DELETE FROM products WHERE id = %s', (product_id,))
-    conn.commit()
+    cur.execute('SELECT order_number FROM orders WHERE telegram_payment_charge_id = %s', (payment['telegram_payment_charge_id'],))
+    if cur.fetchone():
+        cur.close()
+        conn.close()
+        return
+    
+    order, shortages = None, []
+    if parsed:
+        cur.execute('''
+            SELECT id AS product_id, 1 AS quantity, name, %s AS price, emoji, stock
+            FROM products
+            WHERE id = %s
+        ''', (parsed[1], parsed[0]))
+        product = cur.fetchone()
+        if product:
+            order, shortages = place_order(cur, user, [product], payment=payment)
+    
+    if order:
+        conn.commit()
+    else:
+        conn.rollback()
     
     cur.close()
     conn.close()
     
-    send_telegram_message(chat_id, '✅ Товар удален!')
-    send_admin_products(chat_id)
+    if order:
+        send_order_confirmation(chat_id, order)
+        return
+    
+    send_telegram_message(chat_id, f'''⚠️ <b>Оплата получена, но товар закончился</b>
 
+Сумма {total} будет возвращена. Администратор свяжется с вами.''')
+    notify_admins(f'''⚠️ <b>Оплата без товара — нужен возврат</b>
 
-def delete_admin(chat_id: int, admin_id: int):
-    conn = get_db_connection()
-    cur = conn.cursor()
+👤 Клиент: {user.get('first_name', 'Клиент')} (@{user.get('username') or 'нет username'}, id {user['id']})
+💰 Сумма: {total}
+🧾 Telegram: <code>{payment['telegram_payment_charge_id']}</code>
+🧾 Провайдер: <code>{payment['provider_payment_charge_id']}</code>''')
+
+
+ORDER_SPOOL_PATH = os.environ.get('ORDER_SPOOL_PATH', '/tmp/easyshop_order_spool.sqlite')
+
+
+def open_order_spool():
+    import sqlite3
+    
+    spool = sqlite3.connect(shop_file_path(ORDER_SPOOL_PATH), timeout=5)
+    spool.execute('PRAGMA journal_mode=WAL')
+    spool.execute('PRAGMA synchronous=FULL')
+    spool.execute('''
+        CREATE TABLE IF NOT EXISTS spooled_orders (
+            order_number TEXT PRIMARY KEY,
+            chat_id INTEGER NOT NULL,
+            payload TEXT NOT NULL,
+            created_at REAL NOT NULL
+        )
+    ''')
+    return spool
+
+
+def spool_order(chat_id: int, product_id: int, user: Dict[str, Any]):
+    product = get_catalog_product(product_id)
     
-    cur.execute('DELETE FROM admins WHERE id = %s', (admin_id,))
-    conn.commit()
+    if not product:
+        send_telegram_message(chat_id, '❌ Товар не найден')
+        return
+    if product['stock'] == 0:
+        send_stock_shortages(chat_id, [product])
+        return
     
-    cur.close()
-    conn.close()
+    order_number = generate_order_number()
+    item = {
+        'product_id': product['id'],
+        'quantity': 1,
+        'name': product['name'],
+        'price': product['price'],
+        'emoji': product['emoji']
+    }
     
-    send_telegram_message(chat_id, '✅ Админ удален!')
-    send_admin_admins(chat_id)
+    spool = open_order_spool()
+    with spool:
+        spool.execute(
+            'INSERT INTO spooled_orders (order_number, chat_id, payload, created_at) VALUES (?, ?, ?, ?)',
+            (order_number, chat_id, json.dumps({'user': user, 'items': [item]}, ensure_ascii=False), time.time())
+        )
+    spool.close()
+    
+    send_telegram_message(chat_id, f'''📝 <b>Заказ принят в обработку</b>
+
+📦 {product['name']}
+💰 {product['price']:,} ₽
+📋 Номер заказа: #{order_number}
 
+Сейчас наблюдаются технические неполадки. Мы пришлём подтверждение, как только заказ будет зарегистрирован.''')
 
-def show_product_details(chat_id: int, product_id: int, user: Dict[str, Any]):
-    conn = get_db_connection()
+
+def replay_order_spool():
+    spool = open_order_spool()
+    spooled = spool.execute('SELECT order_number, chat_id, payload FROM spooled_orders ORDER BY created_at').fetchall()
+    
+    for order_number, chat_id, payload in spooled:
+        data = json.loads(payload)
+        items = data['items']
+        
+        conn = get_db_connection()
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        
+        cur.execute('SELECT id, stock FROM products WHERE id = ANY(%s)', ([item['product_id'] for item in items],))
+        stock_by_product = {row['id']: row['stock'] for row in cur.fetchall()}
+        
+        missing = [item for item in items if item['product_id'] not in stock_by_product]
+        for item in items:
+            item['stock'] = stock_by_product.get(item['product_id'])
+        
+        order, shortages = None, missing
+        if not missing:
+            try:
+                order, shortages = place_order(cur, data['user'], items, order_number)
+            except psycopg2.IntegrityError:
+                order, shortages = None, []
+        
+        if order:
+            conn.commit()
+        else:
+            conn.rollback()
+        cur.close()
+        conn.close()
+        
+        with spool:
+            spool.execute('DELETE FROM spooled_orders WHERE order_number = ?', (order_number,))
+        
+        try:
+            if order:
+                send_order_confirmation(chat_id, order)
+            elif shortages:
+                send_telegram_message(chat_id, f'😔 Заказ #{order_number} не удалось подтвердить: товара нет в наличии.')
+        except Exception:
+            pass
+    
+    spool.close()
+    
+    if not spooled:
+        os.remove(shop_file_path(ORDER_SPOOL_PATH))
+
+
+STOREFRONT_MAX_AGE = int(os.environ.get('STOREFRONT_MAX_AGE', '60'))
+STOREFRONT_CDN_MAX_AGE = int(os.environ.get('STOREFRONT_CDN_MAX_AGE', '300'))
+STOREFRONT_GZIP_MIN_BYTES = 1024
+
+
+def storefront_response(event: Dict[str, Any], status_code: int, payload: Any,
+                        cache_control: str, etag: Optional[str] = None) -> Dict[str, Any]:
+    import base64
+    import gzip
+    
+    headers = {key.lower(): value for key, value in (event.get('headers') or {}).items()}
+    response_headers = {
+        'Content-Type': 'application/json; charset=utf-8',
+        'Access-Control-Allow-Origin': '*',
+        'Access-Control-Expose-Headers': 'ETag',
+        'Cache-Control': cache_control,
+        'Vary': 'Accept-Encoding'
+    }
+    
+    if etag:
+        response_headers['ETag'] = etag
+        if etag in [tag.strip() for tag in headers.get('if-none-match', '').split(',')]:
+            return {
+                'statusCode': 304,
+                'headers': response_headers,
+                'body': '',
+                'isBase64Encoded': False
+            }
+    
+    body = json.dumps(payload, ensure_ascii=False, default=str)
+    
+    if len(body) >= STOREFRONT_GZIP_MIN_BYTES and 'gzip' in headers.get('accept-encoding', ''):
+        response_headers['Content-Encoding'] = 'gzip'
+        return {
+            'statusCode': status_code,
+            'headers': response_headers,
+            'body': base64.b64encode(gzip.compress(body.encode(), compresslevel=6)).decode(),
+            'isBase64Encoded': True
+        }
+    
+    return {
+        'statusCode': status_code,
+        'headers': response_headers,
+        'body': body,
+        'isBase64Encoded': False
+    }
+
+
+def storefront_product(product: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'id': product['id'],
+        'name': product['name'],
+        'description': product['description'],
+        'price': product['price'],
+        'emoji': product['emoji'],
+        'in_stock': product['stock'] != 0
+    }
+
+
+def get_public_order_status(order_number: str) -> Optional[Dict[str, Any]]:
+    conn = get_read_connection()
     cur = conn.cursor(cursor_factory=RealDictCursor)
     
-    cur.execute('SELECT id, name, description, price, emoji FROM products WHERE id = %s', (product_id,))
-    product = cur.fetchone()
+    cur.execute('''
+        SELECT order_number, product_name, status, created_at, end_date
+        FROM orders
+        WHERE order_number = %s
+        UNION ALL
+        SELECT order_number, product_name, status, created_at, end_date
+        FROM orders_archive
+        WHERE order_number = %s
+        LIMIT 1
+    ''', (order_number, order_number))
+    order = cur.fetchone()
     
     cur.close()
     conn.close()
     
-    if not product:
-        send_telegram_message(chat_id, '❌ Товар не найден')
-        return
+    return order
+
+
+def handle_storefront_api(resource: str, event: Dict[str, Any]) -> Dict[str, Any]:
+    query_params = event.get('queryStringParameters') or {}
+    catalog_cache_control = f'public, max-age={STOREFRONT_MAX_AGE}, s-maxage={STOREFRONT_CDN_MAX_AGE}, stale-while-revalidate={STOREFRONT_CDN_MAX_AGE}'
     
-    text = f'''{product['emoji']} <b>{product['name']}</b>
+    if resource not in ('products', 'product', 'order'):
+        return storefront_response(event, 404, {'error': f'Unknown resource: {resource}'}, 'no-store')
+    
+    shop_id = resolve_shop(event)
+    if not shop_id:
+        return storefront_response(event, 404, {'error': 'Unknown shop'}, 'no-store')
+    activate_shop(shop_id)
+    
+    try:
+        sync_cache_events()
+        
+        if resource == 'products':
+            products = get_catalog_products()
+            etag = f'"catalog-{get_catalog_version(products)}"'
+            payload = {'products': [storefront_product(product) for product in products]}
+            return storefront_response(event, 200, payload, catalog_cache_control, etag)
+        
+        if resource == 'product':
+            products = get_catalog_products()
+            product_id = query_params.get('id', '')
+            product = next((item for item in products if str(item['id']) == product_id), None)
+            if not product:
+                return storefront_response(event, 404, {'error': 'Product not found'}, catalog_cache_control)
+            etag = f'"product-{product_id}-{get_catalog_version(products)}"'
+            return storefront_response(event, 200, {'product': storefront_product(product)}, catalog_cache_control, etag)
+        
+        if resource == 'order':
+            order_number = query_params.get('number', '').strip().lstrip('#').upper()
+            order = get_public_order_status(order_number) if order_number.startswith('ORD-') else None
+            if not order:
+                return storefront_response(event, 404, {'error': 'Order not found'}, 'private, no-store')
+            
+            payload = {
+                'order_number': order['order_number'],
+                'product_name': order['product_name'],
+                'status': order['status'],
+                'status_text': ORDER_STATUS_TEXT.get(order['status'], order['status']),
+                'created_at': order['created_at'].isoformat(),
+                'end_date': order['end_date'].isoformat() if order['end_date'] else None
+            }
+            return storefront_response(event, 200, {'order': payload}, 'private, max-age=30')
+    except psycopg2.OperationalError:
+        return storefront_response(event, 503, {'error': 'Temporarily unavailable'}, 'no-store')
 
-📝 {product['description']}
 
-💰 <b>Цена:</b> {product['price']:,} ₽'''
+ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', '90'))
+ARCHIVE_BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE', '1000'))
+
+
+def archive_orders_batch(cur, cutoff: datetime) -> int:
+    cur.execute('''
+        SELECT id FROM orders
+        WHERE status IN ('completed', 'cancelled') AND created_at < %s
+        ORDER BY created_at
+        LIMIT %s
+        FOR UPDATE SKIP LOCKED
+    ''', (cutoff, ARCHIVE_BATCH_SIZE))
+    order_ids = [row[0] for row in cur.fetchall()]
     
-    inline_keyboard = [
-        [{'text': '🛒 Заказать', 'callback_data': f"order_{product_id}"}],
-        [{'text': '🔙 К каталогу', 'callback_data': 'back_to_catalog'}]
-    ]
+    if not order_ids:
+        return 0
     
-    reply_markup = {'inline_keyboard': inline_keyboard}
-    send_telegram_message(chat_id, text, reply_markup)
+    cur.execute('''
+        INSERT INTO order_items_archive
+        SELECT * FROM order_items WHERE order_id = ANY(%s)
+    ''', (order_ids,))
+    cur.execute('''
+        INSERT INTO order_status_history_archive
+        SELECT * FROM order_status_history WHERE order_id = ANY(%s)
+    ''', (order_ids,))
+    cur.execute('''
+        WITH moved AS (
+            DELETE FROM orders WHERE id = ANY(%s)
+            RETURNING *
+        )
+        INSERT INTO orders_archive SELECT * FROM moved
+    ''', (order_ids,))
+    
+    return len(order_ids)
 
 
-def create_order(chat_id: int, product_id: int, user: Dict[str, Any]):
+def archive_feedback_batch(cur, cutoff: datetime) -> int:
+    cur.execute('''
+        WITH moved AS (
+            DELETE FROM feedback_messages
+            WHERE id IN (
+                SELECT id FROM feedback_messages
+                WHERE is_replied AND created_at < %s
+                ORDER BY created_at
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING *
+        )
+        INSERT INTO feedback_messages_archive SELECT * FROM moved
+    ''', (cutoff, ARCHIVE_BATCH_SIZE))
+    
+    return cur.rowcount
+
+
+def run_archival(time_budget: float) -> Dict[str, Any]:
+    started = time.time()
+    cutoff = datetime.now() - timedelta(days=ARCHIVE_AFTER_DAYS)
+    archived = {'orders': 0, 'feedback': 0}
+    
     conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
+    cur = conn.cursor()
     
-    cur.execute('SELECT name, price FROM products WHERE id = %s', (product_id,))
-    product = cur.fetchone()
+    for key, archive_batch in [('orders', archive_orders_batch), ('feedback', archive_feedback_batch)]:
+        while time.time() - started < time_budget:
+            moved = archive_batch(cur, cutoff)
+            conn.commit()
+            archived[key] += moved
+            if moved < ARCHIVE_BATCH_SIZE:
+                break
     
-    if not product:
-        send_telegram_message(chat_id, '❌ Товар не найден')
+    cur.close()
+    conn.close()
+    
+    return {'archived': archived}
+
+
+PENDING_STALE_HOURS = int(os.environ.get('PENDING_STALE_HOURS', '24'))
+DEADLINE_DIGEST_LIMIT = 30
+DEADLINE_NOTIFY_ATTEMPTS = 3
+
+
+def claim_job_window(cur, job_name: str, now: datetime) -> Optional[datetime]:
+    cur.execute('''
+        UPDATE scheduler_state s
+        SET last_run_at = %s
+        FROM (
+            SELECT last_run_at FROM scheduler_state
+            WHERE job_name = %s
+            FOR UPDATE SKIP LOCKED
+        ) previous
+        WHERE s.job_name = %s
+        RETURNING previous.last_run_at
+    ''', (now, job_name, job_name))
+    row = cur.fetchone()
+    return row['last_run_at'] if row else None
+
+
+def format_deadline_digest(title: str, orders: List[Dict[str, Any]]) -> str:
+    text = f'{title} ({len(orders)})\n'
+    for order in orders[:DEADLINE_DIGEST_LIMIT]:
+        emoji = ORDER_STATUS_EMOJI.get(order['status'], '📦')
+        text += f"\n{emoji} #{order['order_number']} — {html.escape(order['customer_name'])}: {html.escape(order['product_name'][:30])}"
+    if len(orders) > DEADLINE_DIGEST_LIMIT:
+        text += f'\n...и ещё {len(orders) - DEADLINE_DIGEST_LIMIT}'
+    return text
+
+
+def run_deadline_checks(time_budget: float) -> Dict[str, Any]:
+    started = time.time()
+    now = datetime.now()
+    stale_delta = timedelta(hours=PENDING_STALE_HOURS)
+    
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    
+    last_run_at = claim_job_window(cur, 'deadlines', now)
+    if last_run_at is None:
+        conn.rollback()
         cur.close()
         conn.close()
-        return
-    
-    import time
-    order_number = f"ORD-{int(time.time())}"
-    customer_name = user.get('first_name', 'Клиент')
-    username = user.get('username', '')
+        return {'skipped': True}
     
-    start_date = datetime.now()
-    end_date = start_date + timedelta(days=7)
+    cur.execute('''
+        SELECT id, order_number, telegram_user_id, customer_name, product_name, status
+        FROM orders
+        WHERE status IN ('pending', 'accepted', 'processing')
+          AND end_date > %s AND end_date <= %s
+        ORDER BY end_date
+    ''', (last_run_at, now))
+    overdue = cur.fetchall()
     
     cur.execute('''
-        INSERT INTO orders 
-        (order_number, telegram_user_id, telegram_username, customer_name, 
-         product_name, status, start_date, end_date)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-    ''', (order_number, user['id'], username, customer_name, 
-          product['name'], 'pending', start_date, end_date))
+        SELECT id, order_number, telegram_user_id, customer_name, product_name, status
+        FROM orders
+        WHERE status = 'pending'
+          AND created_at > %s AND created_at <= %s
+        ORDER BY created_at
+    ''', (last_run_at - stale_delta, now - stale_delta))
+    stale = cur.fetchall()
+    
+    digest = []
+    if overdue:
+        digest.append(format_deadline_digest('⏰ <b>Истёк срок заказов</b>', overdue))
+    if stale:
+        digest.append(format_deadline_digest(f'⏳ <b>Ожидают принятия более {PENDING_STALE_HOURS} ч</b>', stale))
+    
+    messages = []
+    if digest:
+        text = '\n\n'.join(digest) + '\n\nОткройте /admin для управления заказами.'
+        messages.extend((admin_id, text) for admin_id in get_all_admins())
+    
+    for order in overdue:
+        messages.append((order['telegram_user_id'], f'''⏰ <b>Заказ #{order['order_number']} задерживается</b>
+
+Срок выполнения истёк, но мы уже работаем над заказом.
+Текущий статус: {ORDER_STATUS_TEXT.get(order['status'], order['status'])}
+
+Мы свяжемся с вами в ближайшее время.'''))
     
+    # The window only moves together with the queued notices, so a send that fails
+    # (or a run cut off mid-batch) is retried from deadline_notifications, not lost.
+    if messages:
+        cur.execute('''
+            INSERT INTO deadline_notifications (chat_id, message)
+            SELECT * FROM unnest(%s::bigint[], %s::text[])
+        ''', ([chat_id for chat_id, _ in messages], [text for _, text in messages]))
     conn.commit()
+    
+    sent = 0
+    failed_ids = []
+    while time.time() - started < time_budget:
+        cur.execute('''
+            SELECT id, chat_id, message
+            FROM deadline_notifications
+            WHERE NOT id = ANY(%s)
+            ORDER BY id
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        ''', (failed_ids, BROADCAST_CHUNK_SIZE))
+        queued = cur.fetchall()
+        if not queued:
+            conn.rollback()
+            break
+        
+        outcomes = send_telegram_messages_batch([(row['chat_id'], row['message']) for row in queued])
+        
+        # 'sent' and 'blocked' are done; a failed send waits for the next run
+        retry_ids = [row['id'] for row, (status, _) in zip(queued, outcomes) if status == 'failed']
+        cur.execute('''
+            DELETE FROM deadline_notifications
+            WHERE id = ANY(%s) AND (NOT id = ANY(%s) OR attempts + 1 >= %s)
+        ''', ([row['id'] for row in queued], retry_ids, DEADLINE_NOTIFY_ATTEMPTS))
+        cur.execute('UPDATE deadline_notifications SET attempts = attempts + 1 WHERE id = ANY(%s)', (retry_ids,))
+        conn.commit()
+        
+        sent += sum(1 for status, _ in outcomes if status == 'sent')
+        failed_ids.extend(retry_ids)
+    
     cur.close()
     conn.close()
     
-    text = f'''✅ <b>Заказ оформлен!</b>
+    return {
+        'overdue': len(overdue),
+        'stale_pending': len(stale),
+        'sent': sent,
+        'failed': len(failed_ids)
+    }
 
-📦 {product['name']}
-💰 {product['price']:,} ₽
-📋 Номер заказа: #{order_number}
 
-Мы свяжемся с вами в ближайшее время для подтверждения.
-Отслеживайте статус в разделе "Мои заказы".'''
-    
-    send_telegram_message(chat_id, text)
-    
-    admin_notification = f'''🔔 <b>Получен новый заказ!</b>
+JOB_TIME_BUDGET = float(os.environ.get('JOB_TIME_BUDGET', '25'))
 
-📋 Номер: #{order_number}
-👤 Клиент: {customer_name} (@{username or 'нет username'})
-📦 Товар: {product['name']}
-💰 Сумма: {product['price']:,} ₽
+SCHEDULED_JOBS = {
+    'broadcasts': run_pending_broadcasts,
+    'archive': run_archival,
+    'deadlines': run_deadline_checks
+}
 
-Откройте /admin для управления заказом.'''
+
+def run_scheduled_job(job: str, event: Dict[str, Any]) -> Dict[str, Any]:
+    import hmac
     
-    notify_admins(admin_notification)
+    headers = {key.lower(): value for key, value in (event.get('headers') or {}).items()}
+    job_secret = os.environ.get('JOB_SECRET', '')
+    
+    if not job_secret or not hmac.compare_digest(headers.get('x-job-secret', ''), job_secret):
+        return {
+            'statusCode': 403,
+            'headers': {'Content-Type': 'application/json'},
+            'body': json.dumps({'error': 'Forbidden'}),
+            'isBase64Encoded': False
+        }
+    
+    job_handler = SCHEDULED_JOBS.get(job)
+    if not job_handler:
+        return {
+            'statusCode': 404,
+            'headers': {'Content-Type': 'application/json'},
+            'body': json.dumps({'error': f'Unknown job: {job}'}),
+            'isBase64Encoded': False
+        }
+    
+    started = time.time()
+    results = {}
+    for shop_id in SHOPS:
+        remaining = JOB_TIME_BUDGET - (time.time() - started)
+        if remaining <= 0:
+            break
+        activate_shop(shop_id)
+        results[shop_id] = job_handler(remaining)
+    
+    return {
+        'statusCode': 200,
+        'headers': {'Content-Type': 'application/json'},
+        'body': json.dumps({'ok': True, 'job': job, 'shops': results}, default=str),
+        'isBase64Encoded': False
+    }
@@ -0,0 +1,319 @@
+'''
+Business: Query-plan regression check of the bot's hot SQL on a large synthetic dataset
+Args: --orders/--feedback/--customers row counts, --schema scratch schema, --max-ms and --max-buffers budgets
+Returns: prints one line per query and exits with status 1 if any plan regressed
+
+Creates a scratch schema in DATABASE_URL, applies db_migrations to it, and fills it with
+millions of generated rows. Each hot query is read from index.py as it is written today.
+The check runs EXPLAIN (ANALYZE, BUFFERS) on each one. A query fails when it does a
+sequential scan of a large table, spills a sort to disk, or goes over its time or buffer
+budget. Writes are rolled back. Run it before releasing new migrations or queries.
+'''
+import argparse
+import ast
+import os
+import re
+import sys
+import time
+from datetime import timedelta
+from typing import Any, Callable, Dict, List, Tuple, Union
+
+import psycopg2
+
+from provision_shop import apply_migrations
+
+INDEX_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'index.py')
+
+LARGE_TABLES = {
+    'orders', 'order_items', 'feedback_messages', 'customers', 'cart_items', 'broadcast_recipients',
+    'orders_archive', 'order_items_archive', 'feedback_messages_archive'
+}
+
+# (function in index.py, fragment or fragments that pick the query inside it, params from the sample, budget overrides)
+HOT_QUERIES: List[Tuple[str, Union[str, Tuple[str, ...]], Callable[[Dict[str, Any]], tuple], Dict[str, Any]]] = [
+    ('touch_customer', 'INSERT INTO customers', lambda s: (s['user_id'], s['username'], 'Plan', 'Check', 3600), {}),
+    ('send_admin_orders', 'FROM orders', lambda s: (), {}),
+    ('start_bulk_order_selection', 'FROM orders', lambda s: ('pending', 50), {}),
+    ('start_bulk_order_selection', 'FROM orders', lambda s: ('accepted', 50), {}),
+    ('apply_bulk_order_status', 'UPDATE orders', lambda s: (
+        'accepted', s['pending_ids'], 'pending', 'pending', 'accepted', 1), {}),
+    ('send_admin_order_details', 'FROM orders_archive', lambda s: (s['order_id'], s['order_id']), {}),
+    ('send_admin_order_details', 'FROM order_items_archive', lambda s: (s['order_id'], s['order_id']), {}),
+    ('send_admin_feedback', 'FROM feedback_messages', lambda s: (), {}),
+    ('send_admin_feedback_details', 'FROM feedback_messages_archive', lambda s: (s['feedback_id'], s['feedback_id']), {}),
+    ('handle_add_admin', 'FROM customers', lambda s: (s['username'],), {}),
+    ('handle_feedback_reply', 'SELECT telegram_user_id', lambda s: (s['feedback_id'],), {}),
+    ('handle_feedback_reply', 'UPDATE feedback_messages', lambda s: ('Plan check', '2024-01-01', s['feedback_id']), {}),
+    ('send_my_orders', 'FROM orders', lambda s: (s['user_id'],), {}),
+    ('get_cart_items', 'FROM cart_items', lambda s: (s['cart_user_id'],), {}),
+    ('add_to_cart', 'INSERT INTO cart_items', lambda s: (s['cart_user_id'], s['product_id'], 99), {}),
+    ('change_cart_quantity', 'DELETE FROM cart_items', lambda s: (s['cart_user_id'], s['product_id'], False), {}),
+    ('change_cart_quantity', 'UPDATE cart_items', lambda s: (1, 99, s['cart_user_id'], s['product_id']), {}),
+    ('clear_cart', 'DELETE FROM cart_items', lambda s: (s['cart_user_id'],), {}),
+    ('reserve_stock', 'UPDATE products', lambda s: (1, s['product_id'], 1), {}),
+    ('release_order_stock', 'UPDATE products', lambda s: ([s['order_id']],), {}),
+    ('update_order_status', 'UPDATE orders', lambda s: (
+        s['order_id'], 'processing', ['pending', 'accepted'], 'processing', 1), {}),
+    ('delete_order', 'FOR UPDATE', lambda s: (s['order_id'],), {}),
+    # a short prefix matches every order, a full number exactly one
+    ('search_orders', 'order_number LIKE', lambda s: (
+        'ORD-10000%', 'ORD-10000', 'ORD-10001', 'infinity', 0, 11), {}),
+    ('search_orders', 'order_number LIKE', lambda s: (
+        'ORD-10000%', 'ORD-10000', 'ORD-10001', s['archive_cutoff'], 0, 11), {}),
+    ('search_orders', 'order_number LIKE', lambda s: (
+        s['order_number'] + '%', s['order_number'], s['order_number'] + '0', 'infinity', 0, 11), {}),
+    # a common term: the capped candidate scan may be sequential, it stops after 1000 matches
+    ('search_orders', 'MATERIALIZED', lambda s: (
+        'customer%', '%customer%', 'customer', 'infinity', 0, 1000, 11), {'allow_seq_scan': True}),
+    ('search_orders', 'MATERIALIZED', lambda s: (
+        'user123457%', '%user123457%', 'user123457', 'infinity', 0, 1000, 11), {}),
+    ('search_orders', 'MATERIALIZED', lambda s: (
+        'ивано%', '%ивано%', 'ивано', 'infinity', 0, 1000, 11), {}),
+    ('search_orders', ('ILIKE', 'ORDER BY created_at DESC, id DESC'), lambda s: (
+        'customer%', '%customer%', 'customer', 'infinity', 0, 11), {}),
+    ('search_orders', 'FROM orders_archive', lambda s: (s['order_number'],), {}),
+    ('get_public_order_status', 'FROM orders_archive', lambda s: (s['order_number'], s['order_number']), {}),
+    ('run_broadcast', 'FROM broadcast_recipients', lambda s: (s['campaign_id'], s['customers'] // 2, 25), {}),
+    ('run_broadcast', 'UPDATE broadcast_recipients', lambda s: (
+        [s['customers'] // 2 + 1], ['sent'], [None], s['campaign_id']), {}),
+    ('archive_orders_batch', 'SKIP LOCKED', lambda s: (s['archive_cutoff'], 1000), {'max_ms': 200, 'max_buffers': 20000}),
+    ('archive_feedback_batch', 'feedback_messages_archive', lambda s: (s['archive_cutoff'], 1000), {'max_ms': 500, 'max_buffers': 50000}),
+    ('run_deadline_checks', 'end_date >', lambda s: (s['window_start'], s['now']), {}),
+    ('run_deadline_checks', "status = 'pending'", lambda s: (s['window_start'], s['now']), {}),
+]
+
+SEED_SQL = '''
+    INSERT INTO products (name, description, price, emoji, stock)
+    SELECT 'Product ' || g, 'Synthetic product', 100 + g %% 5000, '📦', CASE WHEN g %% 10 = 0 THEN NULL ELSE 1000 END
+    FROM generate_series(1, %(products)s) g;
+    
+    INSERT INTO customers (telegram_user_id, telegram_username, first_name, first_seen_at, last_seen_at)
+    SELECT g, 'user' || g, 'Customer ' || g, NOW() - INTERVAL '2 years', NOW() - (g %% 720) * INTERVAL '1 day'
+    FROM generate_series(1, %(customers)s) g;
+    
+    -- every 50th order belongs to customer 1, a repeat buyer whose history no longer fits one page
+    INSERT INTO orders (order_number, telegram_user_id, telegram_username, customer_name, product_name,
+                        total_amount, status, start_date, end_date, created_at)
+    SELECT 'ORD-' || (1000000000000 + g), user_id, 'user' || user_id, 'Customer ' || user_id, 'Product ' || (g %% 500 + 1),
+           1000,
+           CASE WHEN g %% 100 < 2 THEN 'pending' WHEN g %% 100 < 4 THEN 'accepted' WHEN g %% 100 < 6 THEN 'processing'
+                WHEN g %% 100 < 92 THEN 'completed' ELSE 'cancelled' END,
+           created_at, created_at + INTERVAL '7 days', created_at
+    FROM (
+        SELECT g, CASE WHEN g %% 50 = 0 THEN 1 ELSE 1 + (g::bigint * 7919) %% %(customers)s END AS user_id,
+               NOW() - INTERVAL '730 days' * (1 - g::float / %(orders)s) AS created_at
+        FROM generate_series(1, %(orders)s) g
+    ) generated;
+    
+    INSERT INTO order_items (order_id, product_id, product_name, price, quantity)
+    SELECT id, id %% %(products)s + 1, product_name, 1000, 1 FROM orders;
+    
+    INSERT INTO order_items_archive
+    SELECT * FROM order_items WHERE order_id <= %(archived)s;
+    WITH moved AS (
+        DELETE FROM orders WHERE id <= %(archived)s RETURNING *
+    )
+    INSERT INTO orders_archive SELECT * FROM moved;
+    
+    INSERT INTO feedback_messages (telegram_user_id, telegram_username, customer_name, message, is_replied, created_at)
+    SELECT 1 + (g::bigint * 7919) %% %(customers)s, 'user' || g, 'Customer', 'Synthetic feedback', g %% 20 <> 0,
+           NOW() - INTERVAL '730 days' * (1 - g::float / %(feedback)s)
+    FROM generate_series(1, %(feedback)s) g;
+    WITH moved AS (
+        DELETE FROM feedback_messages WHERE id <= %(feedback)s / 4 AND is_replied RETURNING *
+    )
+    INSERT INTO feedback_messages_archive SELECT * FROM moved;
+    
+    INSERT INTO cart_items (telegram_user_id, product_id, quantity)
+    SELECT c.telegram_user_id, p.id, 1
+    FROM customers c CROSS JOIN (SELECT id FROM products ORDER BY id LIMIT 2) p
+    WHERE c.telegram_user_id %% 10 = 0;
+    
+    INSERT INTO broadcast_campaigns (message, status, total_count) VALUES ('Plan check', 'running', %(customers)s);
+    INSERT INTO broadcast_recipients (campaign_id, seq, telegram_user_id)
+    SELECT currval(pg_get_serial_sequence('broadcast_campaigns', 'id')), telegram_user_id, telegram_user_id FROM customers;
+'''
+
+
+def load_queries(index_path: str = INDEX_PATH) -> Dict[str, List[str]]:
+    with open(index_path, encoding='utf-8') as f:
+        tree = ast.parse(f.read())
+    
+    queries: Dict[str, List[str]] = {}
+    for node in tree.body:
+        if not isinstance(node, ast.FunctionDef):
+            continue
+        calls = [
+            call for call in ast.walk(node)
+            if isinstance(call, ast.Call) and isinstance(call.func, ast.Attribute) and call.func.attr == 'execute'
+            and call.args and isinstance(call.args[0], ast.Constant) and isinstance(call.args[0].value, str)
+        ]
+        for call in sorted(calls, key=lambda call: call.lineno):
+            queries.setdefault(node.name, []).append(call.args[0].value)
+    return queries
+
+
+def find_query(queries: Dict[str, List[str]], function: str, fragment: Union[str, Tuple[str, ...]]) -> str:
+    fragments = (fragment,) if isinstance(fragment, str) else fragment
+    matches = [sql for sql in queries.get(function, []) if all(part in sql for part in fragments)]
+    if len(matches) != 1:
+        raise SystemExit(f'{function}: expected one query containing {fragment!r}, found {len(matches)}')
+    return matches[0]
+
+
+def seed(conn, args: argparse.Namespace):
+    cur = conn.cursor()
+    started = time.perf_counter()
+    cur.execute('TRUNCATE products, customers, orders, order_items, orders_archive, order_items_archive, '
+                'feedback_messages, feedback_messages_archive, cart_items, broadcast_campaigns RESTART IDENTITY CASCADE')
+    cur.execute(SEED_SQL, {
+        'products': args.products,
+        'customers': args.customers,
+        'orders': args.orders,
+        'archived': args.orders // 4,
+        'feedback': args.feedback
+    })
+    conn.commit()
+    
+    conn.autocommit = True
+    cur.execute('VACUUM ANALYZE products, customers, orders, order_items, orders_archive, order_items_archive, '
+                'feedback_messages, feedback_messages_archive, cart_items, broadcast_recipients')
+    conn.autocommit = False
+    cur.close()
+    print(f'seeded {args.orders} orders, {args.feedback} feedback messages, {args.customers} customers '
+          f'in {time.perf_counter() - started:.0f}s')
+
+
+def build_sample(conn, args: argparse.Namespace) -> Dict[str, Any]:
+    cur = conn.cursor()
+    cur.execute("SELECT id, order_number FROM orders WHERE status = 'pending' ORDER BY id DESC LIMIT 1")
+    order_id, order_number = cur.fetchone()
+    cur.execute("SELECT array_agg(id) FROM (SELECT id FROM orders WHERE status = 'pending' LIMIT 50) pending")
+    pending_ids = cur.fetchone()[0]
+    cur.execute('SELECT MAX(id) FROM feedback_messages')
+    feedback_id = cur.fetchone()[0]
+    cur.execute('SELECT MIN(id) FROM products WHERE stock IS NOT NULL')
+    product_id = cur.fetchone()[0]
+    cur.execute('SELECT MAX(id) FROM broadcast_campaigns')
+    campaign_id = cur.fetchone()[0]
+    cur.execute('SELECT NOW()::timestamp')
+    now = cur.fetchone()[0]
+    conn.rollback()
+    cur.close()
+    
+    return {
+        'order_id': order_id,
+        'order_number': order_number,
+        'pending_ids': pending_ids,
+        'feedback_id': feedback_id,
+        'product_id': product_id,
+        'campaign_id': campaign_id,
+        'user_id': 1,
+        'username': 'User1',
+        'cart_user_id': 10,
+        'customers': args.customers,
+        'now': now,
+        'window_start': now - timedelta(minutes=5),
+        'archive_cutoff': now - timedelta(days=90)
+    }
+
+
+def walk_plan(node: Dict[str, Any]):
+    yield node
+    for child in node.get('Plans', []):
+        yield from walk_plan(child)
+
+
+def check_query(cur, sql: str, params: tuple, max_ms: float, max_buffers: float,
+                allow_seq_scan: bool = False) -> Tuple[float, int, List[str]]:
+    explain_sql = 'EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) ' + sql
+    cur.execute(explain_sql, params)
+    cur.connection.rollback()
+    cur.execute(explain_sql, params)
+    result = cur.fetchone()[0][0]
+    cur.connection.rollback()
+    
+    plan = result['Plan']
+    elapsed_ms = result['Execution Time']
+    buffers = plan.get('Shared Hit Blocks', 0) + plan.get('Shared Read Blocks', 0)
+    
+    problems = []
+    for node in walk_plan(plan):
+        if node['Node Type'] == 'Seq Scan' and node.get('Relation Name') in LARGE_TABLES and not allow_seq_scan:
+            problems.append(f"seq scan on {node['Relation Name']}")
+        if node.get('Sort Space Type') == 'Disk':
+            problems.append('sort spilled to disk')
+    if elapsed_ms > max_ms:
+        problems.append(f'{elapsed_ms:.1f} ms > {max_ms:.0f} ms')
+    if buffers > max_buffers:
+        problems.append(f'{buffers} buffers > {max_buffers:.0f}')
+    return elapsed_ms, buffers, problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--orders', type=int, default=2000000)
+    parser.add_argument('--feedback', type=int, default=1000000)
+    parser.add_argument('--customers', type=int, default=200000)
+    parser.add_argument('--products', type=int, default=500)
+    parser.add_argument('--schema', default='plan_check')
+    parser.add_argument('--reuse', action='store_true', help='keep the data seeded by a previous run')
+    parser.add_argument('--keep', action='store_true', help='do not drop the schema afterwards')
+    parser.add_argument('--max-ms', type=float, default=50)
+    parser.add_argument('--max-buffers', type=float, default=2000)
+    args = parser.parse_args()
+    
+    if not re.match(r'^[a-z_][a-z0-9_]*$', args.schema):
+        raise SystemExit(f'Invalid schema name: {args.schema}')
+    
+    queries = load_queries()
+    checks = [
+        (f"{function}: {fragment if isinstance(fragment, str) else ' + '.join(fragment)}", find_query(queries, function, fragment), make_params, budget)
+        for function, fragment, make_params, budget in HOT_QUERIES
+    ]
+    
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    cur = conn.cursor()
+    if not args.reuse:
+        cur.execute(f'DROP SCHEMA IF EXISTS {args.schema} CASCADE')
+        conn.commit()
+    apply_migrations(conn, args.schema)
+    
+    cur.execute('SELECT EXISTS (SELECT 1 FROM orders)')
+    if not cur.fetchone()[0]:
+        seed(conn, args)
+    conn.rollback()
+    
+    sample = build_sample(conn, args)
+    
+    failures = 0
+    for name, sql, make_params, budget in checks:
+        elapsed_ms, buffers, problems = check_query(
+            cur, sql, make_params(sample),
+            budget.get('max_ms', args.max_ms), budget.get('max_buffers', args.max_buffers),
+            budget.get('allow_seq_scan', False)
+        )
+        failures += bool(problems)
+        status = 'FAIL' if problems else 'ok'
+        print(f"{status:4}  {elapsed_ms:8.2f} ms  {buffers:7d} buf  {name}" + (f"  <-- {'; '.join(problems)}" if problems else ''))
+    
+    checked_sql = {sql for _, sql, _, _ in checks}
+    unchecked = sorted({
+        function for function, sqls in queries.items() for sql in sqls
+        if sql not in checked_sql and LARGE_TABLES & set(re.findall(r'\b(?:FROM|JOIN|INTO|UPDATE)\s+(\w+)', sql))
+    })
+    if unchecked:
+        print(f"not plan-checked: {', '.join(unchecked)}")
+    
+    if not args.keep:
+        cur.execute(f'DROP SCHEMA {args.schema} CASCADE')
+        conn.commit()
+    cur.close()
+    conn.close()
+    
+    print(f'{len(checks) - failures}/{len(checks)} queries within budget')
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+'''
+Business: Creates or upgrades the database schema of a shop in multi-shop mode
+Args: shop id (schema shop_<id> unless --schema is given), --admin-id (and --admin-username) of the first admin,
+      --migrations directory with V*.sql files
+Returns: prints applied migrations; the shop then needs an entry in the SHOPS environment variable
+
+Every shop lives in its own Postgres schema, so the bot's queries stay unqualified
+and reach the right tables through search_path. Migrations are applied in version
+order and recorded in <schema>.shop_migrations, so re-running only applies new ones.
+V0003 seeds the original shop's owner from its order history; a new schema has no
+orders, so that seed row is skipped and the first admin is taken from --admin-id.
+'''
+import argparse
+import os
+import re
+
+import psycopg2
+
+DEFAULT_MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'db_migrations')
+LEGACY_ADMIN_SEED = ('V0003__create_admins_table.sql', 'INSERT INTO admins')
+
+
+def list_migrations(migrations_dir: str):
+    migrations = []
+    for filename in os.listdir(migrations_dir):
+        match = re.match(r'V(\d+)__.+\.sql$', filename)
+        if match:
+            migrations.append((int(match.group(1)), filename))
+    return sorted(migrations)
+
+
+def apply_migrations(conn, schema: str, migrations_dir: str = DEFAULT_MIGRATIONS_DIR):
+    cur = conn.cursor()
+    
+    cur.execute(f'CREATE SCHEMA IF NOT EXISTS {schema}')
+    cur.execute(f'SET search_path TO {schema}')
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS shop_migrations (
+            version INTEGER PRIMARY KEY,
+            filename VARCHAR(255) NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cur.execute('SELECT version FROM shop_migrations')
+    applied = {row[0] for row in cur.fetchall()}
+    conn.commit()
+    
+    for version, filename in list_migrations(migrations_dir):
+        if version in applied:
+            continue
+        
+        with open(os.path.join(migrations_dir, filename), encoding='utf-8') as f:
+            sql = f.read()
+        if filename == LEGACY_ADMIN_SEED[0]:
+            sql = ';'.join(statement for statement in sql.split(';') if not statement.strip().startswith(LEGACY_ADMIN_SEED[1]))
+        cur.execute(sql)
+        cur.execute('INSERT INTO shop_migrations (version, filename) VALUES (%s, %s)', (version, filename))
+        conn.commit()
+        print(f'{schema}: applied {filename}')
+    
+    cur.close()
+
+
+def add_first_admin(conn, admin_id: int, username: str):
+    cur = conn.cursor()
+    cur.execute('''
+        INSERT INTO admins (telegram_user_id, telegram_username, full_name)
+        VALUES (%s, %s, %s)
+        ON CONFLICT (telegram_user_id) DO NOTHING
+    ''', (admin_id, username or None, username or 'Main Admin'))
+    conn.commit()
+    cur.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('shop_id')
+    parser.add_argument('--schema')
+    parser.add_argument('--admin-id', type=int, help='Telegram user id of the first admin')
+    parser.add_argument('--admin-username', default='')
+    parser.add_argument('--migrations', default=DEFAULT_MIGRATIONS_DIR)
+    args = parser.parse_args()
+    
+    schema = args.schema or f'shop_{args.shop_id}'
+    if not re.match(r'^[a-z_][a-z0-9_]*$', schema):
+        raise SystemExit(f'Invalid schema name: {schema}')
+    
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    apply_migrations(conn, schema, args.migrations)
+    
+    if args.admin_id:
+        add_first_admin(conn, args.admin_id, args.admin_username.lstrip('@'))
+    else:
+        cur = conn.cursor()
+        cur.execute('SELECT NOT EXISTS (SELECT 1 FROM admins)')
+        if cur.fetchone()[0]:
+            print(f'{schema}: no admins yet, run again with --admin-id <telegram user id>')
+        cur.close()
+    conn.close()
+    print(f'{schema}: up to date')
+
+
+if __name__ == '__main__':
+    main()
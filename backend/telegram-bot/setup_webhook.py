@@ -0,0 +1,125 @@
+'''
+Business: Sets, inspects or removes the Telegram webhook of each shop
+Args: set|info|delete, --shop to limit to one shop, --url, --max-connections, --drop-pending-updates
+Returns: prints the webhook state reported by getWebhookInfo
+
+The webhook only receives the update types the router handles (ALLOWED_UPDATES).
+It sends the shop's secret as X-Telegram-Bot-Api-Secret-Token, which handler
+checks before parsing the body. The function URL defaults to backend/func2url.json.
+In multi-shop mode ?shop=<id> is appended to it. Use --drop-pending-updates after
+an outage so the bot does not replay a backlog of stale updates.
+'''
+import argparse
+import json
+import os
+import secrets
+import sys
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime
+from typing import Any, Dict
+
+from index import SHOPS, DEFAULT_SHOP_ID
+
+ALLOWED_UPDATES = ['message', 'callback_query', 'pre_checkout_query']
+DEFAULT_MAX_CONNECTIONS = 20
+FUNC2URL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'func2url.json')
+
+
+def call_bot_api(token: str, method: str, data: Dict[str, Any]) -> Dict[str, Any]:
+    url = f'https://api.telegram.org/bot{token}/{method}'
+    req = urllib.request.Request(url, data=urllib.parse.urlencode(data).encode())
+    try:
+        with urllib.request.urlopen(req) as response:
+            return json.loads(response.read().decode())
+    except urllib.error.HTTPError as e:
+        return json.loads(e.read().decode())
+
+
+def default_webhook_url() -> str:
+    with open(FUNC2URL_PATH, encoding='utf-8') as f:
+        return json.load(f)['telegram-bot']
+
+
+def shop_webhook_url(base_url: str, shop_id: str) -> str:
+    if len(SHOPS) == 1 and shop_id == DEFAULT_SHOP_ID:
+        return base_url
+    separator = '&' if '?' in base_url else '?'
+    return f'{base_url}{separator}shop={urllib.parse.quote(shop_id)}'
+
+
+def print_webhook_info(shop_id: str, token: str) -> bool:
+    info = call_bot_api(token, 'getWebhookInfo', {})
+    if not info.get('ok'):
+        print(f"{shop_id}: getWebhookInfo failed: {info.get('description')}")
+        return False
+    
+    result = info['result']
+    print(f"{shop_id}: {result.get('url') or '(no webhook)'}")
+    print(f"  pending updates:  {result.get('pending_update_count', 0)}")
+    print(f"  max connections:  {result.get('max_connections', '-')}")
+    print(f"  allowed updates:  {', '.join(result.get('allowed_updates', [])) or 'all'}")
+    if result.get('last_error_date'):
+        error_time = datetime.fromtimestamp(result['last_error_date']).strftime('%d.%m.%Y %H:%M:%S')
+        print(f"  last error:       {error_time} {result.get('last_error_message', '')}")
+    if result.get('last_synchronization_error_date'):
+        sync_time = datetime.fromtimestamp(result['last_synchronization_error_date']).strftime('%d.%m.%Y %H:%M:%S')
+        print(f"  last sync error:  {sync_time}")
+    
+    if result.get('url') and result.get('allowed_updates') and set(result['allowed_updates']) != set(ALLOWED_UPDATES):
+        print(f"  ! allowed updates differ from {', '.join(ALLOWED_UPDATES)}; run set")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('action', choices=['set', 'info', 'delete'])
+    parser.add_argument('--shop', help='only this shop id')
+    parser.add_argument('--url', help='function URL, defaults to backend/func2url.json')
+    parser.add_argument('--max-connections', type=int, default=DEFAULT_MAX_CONNECTIONS)
+    parser.add_argument('--drop-pending-updates', action='store_true')
+    args = parser.parse_args()
+    
+    if args.shop and args.shop not in SHOPS:
+        raise SystemExit(f'Unknown shop: {args.shop}')
+    shop_ids = [args.shop] if args.shop else list(SHOPS)
+    
+    failures = 0
+    for shop_id in shop_ids:
+        shop = SHOPS[shop_id]
+        if not shop['token']:
+            print(f'{shop_id}: no bot token configured')
+            failures += 1
+            continue
+        
+        if args.action == 'set':
+            if not shop['secret']:
+                print(f'{shop_id}: no webhook secret configured, so the handler cannot reject forged updates.')
+                print(f'  Add one, for example "secret": "{secrets.token_urlsafe(32)}", and run set again.')
+                failures += 1
+                continue
+            
+            result = call_bot_api(shop['token'], 'setWebhook', {
+                'url': shop_webhook_url(args.url or default_webhook_url(), shop_id),
+                'secret_token': shop['secret'],
+                'allowed_updates': json.dumps(ALLOWED_UPDATES),
+                'max_connections': args.max_connections,
+                'drop_pending_updates': 'true' if args.drop_pending_updates else 'false'
+            })
+            print(f"{shop_id}: setWebhook {'ok' if result.get('ok') else 'failed'}: {result.get('description', '')}")
+            failures += not result.get('ok')
+        elif args.action == 'delete':
+            result = call_bot_api(shop['token'], 'deleteWebhook', {
+                'drop_pending_updates': 'true' if args.drop_pending_updates else 'false'
+            })
+            print(f"{shop_id}: deleteWebhook {'ok' if result.get('ok') else 'failed'}: {result.get('description', '')}")
+            failures += not result.get('ok')
+        
+        failures += not print_webhook_info(shop_id, shop['token'])
+    
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
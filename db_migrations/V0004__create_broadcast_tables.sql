@@ -0,0 +1,30 @@
+CREATE TABLE IF NOT EXISTS broadcast_campaigns (
+    id SERIAL PRIMARY KEY,
+    message TEXT NOT NULL,
+    status VARCHAR(20) DEFAULT 'running',
+    total_count INTEGER DEFAULT 0,
+    cursor_position INTEGER DEFAULT 0,
+    sent_count INTEGER DEFAULT 0,
+    blocked_count INTEGER DEFAULT 0,
+    failed_count INTEGER DEFAULT 0,
+    created_by_user_id BIGINT,
+    progress_chat_id BIGINT,
+    progress_message_id BIGINT,
+    locked_until TIMESTAMP,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    finished_at TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS broadcast_recipients (
+    campaign_id INTEGER NOT NULL REFERENCES broadcast_campaigns(id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    telegram_user_id BIGINT NOT NULL,
+    status VARCHAR(20) DEFAULT 'pending',
+    error TEXT,
+    sent_at TIMESTAMP,
+    PRIMARY KEY (campaign_id, seq)
+);
+
+CREATE INDEX idx_broadcast_campaigns_status ON broadcast_campaigns(status);
+CREATE INDEX idx_broadcast_recipients_undelivered ON broadcast_recipients(campaign_id, status) WHERE status IN ('blocked', 'failed');
@@ -0,0 +1,25 @@
+CREATE TABLE IF NOT EXISTS customers (
+    telegram_user_id BIGINT PRIMARY KEY,
+    telegram_username VARCHAR(255),
+    first_name VARCHAR(255),
+    last_name VARCHAR(255),
+    first_seen_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    last_seen_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX idx_customers_username_lower ON customers(LOWER(telegram_username));
+
+INSERT INTO customers (telegram_user_id, telegram_username, first_name, first_seen_at, last_seen_at)
+SELECT DISTINCT ON (telegram_user_id)
+    telegram_user_id,
+    NULLIF(telegram_username, ''),
+    customer_name,
+    MIN(created_at) OVER (PARTITION BY telegram_user_id),
+    created_at
+FROM (
+    SELECT telegram_user_id, telegram_username, customer_name, created_at FROM orders
+    UNION ALL
+    SELECT telegram_user_id, telegram_username, customer_name, created_at FROM feedback_messages
+) seen
+ORDER BY telegram_user_id, created_at DESC
+ON CONFLICT (telegram_user_id) DO NOTHING;
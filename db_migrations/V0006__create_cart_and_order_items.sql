@@ -0,0 +1,24 @@
+ALTER TABLE products ADD COLUMN IF NOT EXISTS stock INTEGER;
+ALTER TABLE products ADD CONSTRAINT products_stock_non_negative CHECK (stock IS NULL OR stock >= 0);
+
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS total_amount INTEGER;
+
+CREATE TABLE IF NOT EXISTS cart_items (
+    telegram_user_id BIGINT NOT NULL,
+    product_id INTEGER NOT NULL REFERENCES products(id) ON DELETE CASCADE,
+    quantity INTEGER NOT NULL CHECK (quantity > 0),
+    added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (telegram_user_id, product_id)
+);
+
+CREATE TABLE IF NOT EXISTS order_items (
+    id SERIAL PRIMARY KEY,
+    order_id INTEGER NOT NULL REFERENCES orders(id) ON DELETE CASCADE,
+    product_id INTEGER REFERENCES products(id) ON DELETE SET NULL,
+    product_name VARCHAR(255) NOT NULL,
+    price INTEGER NOT NULL,
+    quantity INTEGER NOT NULL CHECK (quantity > 0)
+);
+
+CREATE INDEX idx_order_items_order_id ON order_items(order_id);
+CREATE INDEX idx_order_items_product_id ON order_items(product_id);
@@ -0,0 +1,10 @@
+-- Archive tables mirror the hot tables column-for-column: the archival job moves
+-- rows with INSERT ... SELECT *, so any column added to orders, order_items or
+-- feedback_messages must be added to its archive table in the same migration.
+
+CREATE TABLE IF NOT EXISTS orders_archive (LIKE orders INCLUDING DEFAULTS INCLUDING INDEXES);
+CREATE TABLE IF NOT EXISTS order_items_archive (LIKE order_items INCLUDING DEFAULTS INCLUDING INDEXES);
+CREATE TABLE IF NOT EXISTS feedback_messages_archive (LIKE feedback_messages INCLUDING DEFAULTS INCLUDING INDEXES);
+
+CREATE INDEX idx_orders_archivable ON orders(created_at) WHERE status IN ('completed', 'cancelled');
+CREATE INDEX idx_feedback_archivable ON feedback_messages(created_at) WHERE is_replied;
@@ -0,0 +1,11 @@
+CREATE TABLE IF NOT EXISTS scheduler_state (
+    job_name VARCHAR(50) PRIMARY KEY,
+    last_run_at TIMESTAMP NOT NULL
+);
+
+INSERT INTO scheduler_state (job_name, last_run_at)
+VALUES ('deadlines', CURRENT_TIMESTAMP)
+ON CONFLICT (job_name) DO NOTHING;
+
+CREATE INDEX idx_orders_open_end_date ON orders(end_date) WHERE status IN ('pending', 'accepted', 'processing');
+CREATE INDEX idx_orders_pending_created_at ON orders(created_at) WHERE status = 'pending';
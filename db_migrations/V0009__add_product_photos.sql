@@ -0,0 +1,2 @@
+ALTER TABLE products ADD COLUMN IF NOT EXISTS photo_file_id VARCHAR(255);
+ALTER TABLE products ADD COLUMN IF NOT EXISTS thumb_file_id VARCHAR(255);
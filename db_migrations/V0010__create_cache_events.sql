@@ -0,0 +1,104 @@
+-- Cache invalidation events. Every statement that changes what the bot keeps cached in memory bumps a
+-- version in cache_versions and sends one NOTIFY on easyshop_changes with the affected ids, so warm
+-- instances can drop exactly those entries. Instances that miss a notification catch up by comparing
+-- versions. Stock-only updates from order placement do not publish, except when a product sells out or
+-- comes back in stock.
+CREATE TABLE IF NOT EXISTS cache_versions (
+    name VARCHAR(50) PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0
+);
+
+INSERT INTO cache_versions (name) VALUES ('products'), ('admins'), ('orders') ON CONFLICT (name) DO NOTHING;
+
+CREATE OR REPLACE FUNCTION publish_cache_event(event_table TEXT, event_op TEXT, event_schema TEXT, event_ids BIGINT[]) RETURNS VOID AS $$
+DECLARE
+    new_version BIGINT;
+BEGIN
+    IF event_ids IS NULL OR cardinality(event_ids) = 0 THEN
+        RETURN;
+    END IF;
+    
+    UPDATE cache_versions SET version = version + 1 WHERE name = event_table RETURNING version INTO new_version;
+    
+    PERFORM pg_notify('easyshop_changes', json_build_object(
+        'schema', event_schema,
+        'table', event_table,
+        'op', event_op,
+        'version', new_version,
+        'ids', CASE WHEN cardinality(event_ids) <= 500 THEN event_ids END
+    )::text);
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION products_cache_event() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM publish_cache_event('products', TG_OP, TG_TABLE_SCHEMA, ARRAY(SELECT id::BIGINT FROM new_rows));
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM publish_cache_event('products', TG_OP, TG_TABLE_SCHEMA, ARRAY(SELECT id::BIGINT FROM old_rows));
+    ELSE
+        PERFORM publish_cache_event('products', TG_OP, TG_TABLE_SCHEMA, ARRAY(
+            SELECT n.id::BIGINT FROM new_rows n JOIN old_rows o ON o.id = n.id
+            WHERE (n.name, n.description, n.price, n.emoji, n.photo_file_id, n.thumb_file_id)
+                      IS DISTINCT FROM (o.name, o.description, o.price, o.emoji, o.photo_file_id, o.thumb_file_id)
+               OR (n.stock = 0) IS DISTINCT FROM (o.stock = 0)
+        ));
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION admins_cache_event() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM publish_cache_event('admins', TG_OP, TG_TABLE_SCHEMA, ARRAY(SELECT telegram_user_id::BIGINT FROM new_rows));
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM publish_cache_event('admins', TG_OP, TG_TABLE_SCHEMA, ARRAY(SELECT telegram_user_id::BIGINT FROM old_rows));
+    ELSE
+        PERFORM publish_cache_event('admins', TG_OP, TG_TABLE_SCHEMA, ARRAY(
+            SELECT telegram_user_id::BIGINT FROM new_rows UNION SELECT telegram_user_id::BIGINT FROM old_rows
+        ));
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION orders_cache_event() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        PERFORM publish_cache_event('orders', TG_OP, TG_TABLE_SCHEMA, ARRAY(SELECT id::BIGINT FROM old_rows));
+    ELSE
+        PERFORM publish_cache_event('orders', TG_OP, TG_TABLE_SCHEMA, ARRAY(
+            SELECT n.id::BIGINT FROM new_rows n JOIN old_rows o ON o.id = n.id WHERE n.status IS DISTINCT FROM o.status
+        ));
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS products_cache_insert ON products;
+DROP TRIGGER IF EXISTS products_cache_update ON products;
+DROP TRIGGER IF EXISTS products_cache_delete ON products;
+CREATE TRIGGER products_cache_insert AFTER INSERT ON products
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION products_cache_event();
+CREATE TRIGGER products_cache_update AFTER UPDATE ON products
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION products_cache_event();
+CREATE TRIGGER products_cache_delete AFTER DELETE ON products
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION products_cache_event();
+
+DROP TRIGGER IF EXISTS admins_cache_insert ON admins;
+DROP TRIGGER IF EXISTS admins_cache_update ON admins;
+DROP TRIGGER IF EXISTS admins_cache_delete ON admins;
+CREATE TRIGGER admins_cache_insert AFTER INSERT ON admins
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION admins_cache_event();
+CREATE TRIGGER admins_cache_update AFTER UPDATE ON admins
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION admins_cache_event();
+CREATE TRIGGER admins_cache_delete AFTER DELETE ON admins
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION admins_cache_event();
+
+DROP TRIGGER IF EXISTS orders_cache_update ON orders;
+DROP TRIGGER IF EXISTS orders_cache_delete ON orders;
+CREATE TRIGGER orders_cache_update AFTER UPDATE ON orders
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION orders_cache_event();
+CREATE TRIGGER orders_cache_delete AFTER DELETE ON orders
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION orders_cache_event();
@@ -0,0 +1,21 @@
+-- Indexes for the admin lists and per-status scans that plan_check.py flagged on a multi-million row dataset.
+-- The expression in idx_orders_admin_list must stay identical to the ORDER BY in send_admin_orders,
+-- otherwise the planner falls back to sorting the whole table.
+CREATE INDEX IF NOT EXISTS idx_orders_admin_list ON orders ((
+    CASE status
+        WHEN 'pending' THEN 1
+        WHEN 'accepted' THEN 2
+        WHEN 'processing' THEN 3
+        WHEN 'completed' THEN 4
+        ELSE 5
+    END
+), created_at DESC);
+
+CREATE INDEX IF NOT EXISTS idx_orders_status_created_at ON orders(status, created_at);
+DROP INDEX IF EXISTS idx_orders_status;
+
+CREATE INDEX IF NOT EXISTS idx_orders_user_created_at ON orders(telegram_user_id, created_at DESC);
+DROP INDEX IF EXISTS idx_orders_telegram_user_id;
+
+CREATE INDEX IF NOT EXISTS idx_feedback_admin_list ON feedback_messages(is_replied, created_at DESC);
+DROP INDEX IF EXISTS idx_feedback_is_replied;
@@ -0,0 +1,14 @@
+-- Written by the same statement that changes orders.status (update_order_status, apply_bulk_order_status).
+-- Moves to order_status_history_archive together with its order, like order_items.
+CREATE TABLE IF NOT EXISTS order_status_history (
+    id BIGSERIAL PRIMARY KEY,
+    order_id INTEGER NOT NULL REFERENCES orders(id) ON DELETE CASCADE,
+    old_status VARCHAR(50),
+    new_status VARCHAR(50) NOT NULL,
+    changed_by_user_id BIGINT,
+    changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX idx_order_status_history_order_id ON order_status_history(order_id);
+
+CREATE TABLE IF NOT EXISTS order_status_history_archive (LIKE order_status_history INCLUDING DEFAULTS INCLUDING INDEXES);
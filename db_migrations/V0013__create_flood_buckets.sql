@@ -0,0 +1,6 @@
+-- Shared per-user token buckets for FLOOD_SHARED=1. Losing them on a crash only resets the limits.
+CREATE UNLOGGED TABLE IF NOT EXISTS flood_buckets (
+    telegram_user_id BIGINT PRIMARY KEY,
+    tokens DOUBLE PRECISION NOT NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+) WITH (fillfactor = 70);
@@ -0,0 +1,11 @@
+-- Telegram Payments. orders_archive gets the same columns in the same order (see V0007).
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS telegram_payment_charge_id VARCHAR(255);
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS provider_payment_charge_id VARCHAR(255);
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS paid_at TIMESTAMP;
+
+ALTER TABLE orders_archive ADD COLUMN IF NOT EXISTS telegram_payment_charge_id VARCHAR(255);
+ALTER TABLE orders_archive ADD COLUMN IF NOT EXISTS provider_payment_charge_id VARCHAR(255);
+ALTER TABLE orders_archive ADD COLUMN IF NOT EXISTS paid_at TIMESTAMP;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_orders_payment_charge ON orders(telegram_payment_charge_id)
+    WHERE telegram_payment_charge_id IS NOT NULL;
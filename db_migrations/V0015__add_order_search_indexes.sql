@@ -0,0 +1,8 @@
+-- Trigram indexes for the admin order search. gin_trgm_ops serves ILIKE '%…%' on any part of the value
+-- and the word-similarity operator %> used for fuzzy matches.
+-- The extension lives in public so every shop schema reaches it as public.gin_trgm_ops / OPERATOR(public.%>).
+CREATE EXTENSION IF NOT EXISTS pg_trgm WITH SCHEMA public;
+
+CREATE INDEX IF NOT EXISTS idx_orders_order_number_trgm ON orders USING gin (order_number public.gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_orders_customer_name_trgm ON orders USING gin (customer_name public.gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_orders_telegram_username_trgm ON orders USING gin (telegram_username public.gin_trgm_ops);
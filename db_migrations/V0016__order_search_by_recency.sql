@@ -0,0 +1,8 @@
+-- The admin order search lists matches newest first and pages by (created_at, id).
+-- Order numbers are found by a key range on the unique order_number index and usernames by prefix,
+-- so their trigram indexes go: every username shares trigrams like 'use', and scanning those
+-- posting lists cost ~300 ms per search on 1.5M orders. Customer names keep theirs.
+CREATE INDEX IF NOT EXISTS idx_orders_created_at_id ON orders(created_at, id);
+CREATE INDEX IF NOT EXISTS idx_orders_username_prefix ON orders(lower(telegram_username) text_pattern_ops);
+DROP INDEX IF EXISTS idx_orders_order_number_trgm;
+DROP INDEX IF EXISTS idx_orders_telegram_username_trgm;
@@ -0,0 +1,7 @@
+-- Nothing caches order rows, so the order triggers from V0010 only serialized every status change,
+-- bulk update and archive batch on the single cache_versions('orders') row. Add them back together
+-- with the first in-process order cache.
+DROP TRIGGER IF EXISTS orders_cache_update ON orders;
+DROP TRIGGER IF EXISTS orders_cache_delete ON orders;
+DROP FUNCTION IF EXISTS orders_cache_event();
+DELETE FROM cache_versions WHERE name = 'orders';
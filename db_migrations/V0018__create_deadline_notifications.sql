@@ -0,0 +1,10 @@
+-- Outbox for the deadlines job. A run queues its notices in the same transaction that advances
+-- scheduler_state('deadlines'), then deletes each row once Telegram has taken it. A failed send stays
+-- queued for the next run until it has used up its attempts.
+CREATE TABLE IF NOT EXISTS deadline_notifications (
+    id SERIAL PRIMARY KEY,
+    chat_id BIGINT NOT NULL,
+    message TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
@@ -0,0 +1,46 @@
+import funcUrls from "../../backend/func2url.json";
+
+const API_URL = funcUrls["telegram-bot"];
+
+export interface StorefrontProduct {
+  id: number;
+  name: string;
+  description: string;
+  price: number;
+  emoji: string;
+  in_stock: boolean;
+}
+
+export interface StorefrontOrder {
+  order_number: string;
+  product_name: string;
+  status: string;
+  status_text: string;
+  created_at: string;
+  end_date: string | null;
+}
+
+async function request<T>(params: Record<string, string>): Promise<T> {
+  const response = await fetch(`${API_URL}?${new URLSearchParams(params)}`);
+  if (!response.ok) {
+    throw new Error(`Storefront API error: ${response.status}`);
+  }
+  return response.json();
+}
+
+export async function fetchProducts(): Promise<StorefrontProduct[]> {
+  const data = await request<{ products: StorefrontProduct[] }>({ api: "products" });
+  return data.products;
+}
+
+export async function fetchOrder(orderNumber: string): Promise<StorefrontOrder | null> {
+  const response = await fetch(`${API_URL}?${new URLSearchParams({ api: "order", number: orderNumber })}`);
+  if (response.status === 404) {
+    return null;
+  }
+  if (!response.ok) {
+    throw new Error(`Storefront API error: ${response.status}`);
+  }
+  const data: { order: StorefrontOrder } = await response.json();
+  return data.order;
+}
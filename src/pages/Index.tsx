@@ -1,4 +1,25 @@
+import { FormEvent, useState } from "react";
+import { useMutation, useQuery } from "@tanstack/react-query";
+import { fetchOrder, fetchProducts } from "@/lib/storefront";
+
 const Index = () => {
+  const [orderNumber, setOrderNumber] = useState("");
+
+  const products = useQuery({
+    queryKey: ["storefront", "products"],
+    queryFn: fetchProducts,
+    staleTime: 60_000,
+  });
+
+  const orderLookup = useMutation({ mutationFn: fetchOrder });
+
+  const handleOrderLookup = (event: FormEvent) => {
+    event.preventDefault();
+    if (orderNumber.trim()) {
+      orderLookup.mutate(orderNumber.trim());
+    }
+  };
+
   return (
     <div className="min-h-screen bg-gradient-to-br from-purple-50 via-blue-50 to-pink-50 flex items-center justify-center p-4">
       <div className="max-w-2xl w-full text-center space-y-8">
@@ -56,6 +77,87 @@ const Index = () => {
           </div>
         </div>
 
+        <div className="bg-white rounded-2xl shadow-xl p-8 space-y-6">
+          <h2 className="text-2xl font-semibold text-gray-800">
+            📦 Каталог
+          </h2>
+
+          {products.isLoading && (
+            <p className="text-gray-500">Загружаем товары...</p>
+          )}
+
+          {products.isError && (
+            <p className="text-gray-500">Каталог временно недоступен — загляните в бот!</p>
+          )}
+
+          {products.data && (
+            <div className="grid grid-cols-1 sm:grid-cols-2 gap-4 text-left">
+              {products.data.map((product) => (
+                <div
+                  key={product.id}
+                  className={`rounded-xl border border-gray-200 p-4 space-y-2 ${product.in_stock ? "" : "opacity-50"}`}
+                >
+                  <div className="flex items-center gap-3">
+                    <span className="text-3xl">{product.emoji}</span>
+                    <div>
+                      <div className="font-semibold text-gray-800">{product.name}</div>
+                      <div className="text-purple-600 font-semibold">
+                        {product.price.toLocaleString("ru-RU")} ₽
+                      </div>
+                    </div>
+                  </div>
+                  <p className="text-sm text-gray-600">{product.description}</p>
+                  {!product.in_stock && (
+                    <p className="text-sm text-gray-500">Нет в наличии</p>
+                  )}
+                </div>
+              ))}
+            </div>
+          )}
+        </div>
+
+        <div className="bg-white rounded-2xl shadow-xl p-8 space-y-4">
+          <h2 className="text-2xl font-semibold text-gray-800">
+            📋 Статус заказа
+          </h2>
+          <form onSubmit={handleOrderLookup} className="flex flex-col sm:flex-row gap-3">
+            <input
+              value={orderNumber}
+              onChange={(event) => setOrderNumber(event.target.value)}
+              placeholder="ORD-..."
+              className="flex-1 rounded-xl border border-gray-200 px-4 py-3 focus:outline-none focus:ring-2 focus:ring-purple-400"
+            />
+            <button
+              type="submit"
+              disabled={orderLookup.isPending}
+              className="px-6 py-3 bg-gradient-to-r from-purple-600 to-pink-600 text-white rounded-xl font-semibold disabled:opacity-60"
+            >
+              Проверить
+            </button>
+          </form>
+
+          {orderLookup.isError && (
+            <p className="text-gray-500">Не удалось проверить заказ, попробуйте позже.</p>
+          )}
+
+          {orderLookup.isSuccess && !orderLookup.data && (
+            <p className="text-gray-500">Заказ не найден</p>
+          )}
+
+          {orderLookup.data && (
+            <div className="text-left text-gray-700 space-y-1">
+              <div className="font-semibold">Заказ #{orderLookup.data.order_number}</div>
+              <div>{orderLookup.data.product_name}</div>
+              <div>Статус: {orderLookup.data.status_text}</div>
+              {orderLookup.data.end_date && (
+                <div>
+                  Готовность: {new Date(orderLookup.data.end_date).toLocaleDateString("ru-RU")}
+                </div>
+              )}
+            </div>
+          )}
+        </div>
+
         <div className="text-sm text-gray-500">
           Возникли вопросы? Напишите нам в боте через раздел "💬 Обратная связь"
         </div>